@@ -66,6 +66,10 @@ t_500ms = 0b010
 t_1s    = 0b011
 t_2s    = 0b100
 t_4s    = 0b101 # or 0b110 or 0b111 wil work
+SEQ_DELAY_S = (0.0, 0.25, 0.5, 1.0, 2.0, 4.0, 4.0, 4.0)   # seconds for each t_ code
+
+# Duty cycle step time for each incr_ code, ms per 1/511 duty step
+INCR_MS = (0.0, 1.953125, 3.90625, 7.8125, 15.625, 31.25, 62.5, 125.0)
 
 # Duty Cycle on Failure
 duty_0      = 0b00
@@ -116,183 +120,444 @@ def TACH_TARGET_COUNT_LSB(channel):
 	return 0x51 + ((channel - 1) * 2)
 #------------------------------------------------------
 
+#------------------------ Fan profiles ------------------
+TACH_MAX  = 0x7FF     # 11-bit tach count, saturates here when the fan is stalled
+TACH_CLOCK = 8192     # Hz
+
+_TACH_PER_CODE = {1 : tachPer_1, 2 : tachPer_2, 4 : tachPer_4, 8 : tachPer_8,
+                  16 : tachPer_16, 32 : tachPer_32}
+
+class FanProfile(object):
+	"""Per-channel fan settings and its tach count -> RPM table
+
+	pulsePerRev - tach pulses per revolution (NP), 2 for most PC fans
+	tachPeriods - tach periods counted (SR): 1, 2, 4, 8, 16 or 32
+	spinUp      - spin_0 / spin_500ms / spin_1s / spin_2s
+	pwmFreq     - PWMFREQ_*, shared by channels 1-3 and by 4-6
+	minRPM      - slower readings are reported as stalled (0)
+	maxRPM      - faster readings (tach glitches) are clamped to this
+
+	RPM = 60 * SR * 8192 / (NP * count) is precomputed for all 2048 counts,
+	so reading a fan is a table lookup.  Count 0 (no measurement yet) and
+	count 0x7FF (counter overflowed - fan stopped) both read 0.
+	"""
+	def __init__(self, pulsePerRev=2, tachPeriods=4, spinUp=spin_500ms,
+				 pwmFreq=PWMFREQ_25kHz, minRPM=0, maxRPM=None):
+		if tachPeriods not in _TACH_PER_CODE:
+			raise ValueError('tachPeriods must be 1, 2, 4, 8, 16 or 32')
+		self.pulsePerRev = pulsePerRev
+		self.tachPeriods = tachPeriods
+		self.spinUp = spinUp
+		self.pwmFreq = pwmFreq
+		self.minRPM = minRPM
+		self.maxRPM = maxRPM
+		self.k = 60 * tachPeriods * TACH_CLOCK		# RPM * count * NP
+		lut = [0] * (TACH_MAX + 1)
+		for count in range(1, TACH_MAX):
+			rpm = self.k // (pulsePerRev * count)
+			if rpm < minRPM:
+				rpm = 0
+			elif maxRPM is not None and rpm > maxRPM:
+				rpm = maxRPM
+			lut[count] = rpm
+		self.lut = tuple(lut)
+
+	def __repr__(self):
+		return '<FanProfile NP={} SR={} {}-{} rpm>'.format(
+			self.pulsePerRev, self.tachPeriods, self.minRPM, self.maxRPM)
+
+	def rpm(self, count):
+		return self.lut[count & TACH_MAX]
+
+	def tachCount(self, rpm):
+		#Tach count for a target RPM (clamped to the profile and 11 bits)
+		if self.maxRPM is not None:
+			rpm = min(rpm, self.maxRPM)
+		rpm = max(rpm, self.minRPM)
+		if rpm <= 0:
+			return TACH_MAX
+		return max(1, min(TACH_MAX, self.k // (self.pulsePerRev * rpm)))
+
+	def srCode(self):
+		return _TACH_PER_CODE[self.tachPeriods]
+
+# Used for channels without a profile (the old module-wide settings)
+DEFAULT_PROFILE = FanProfile(pulsePerRev, tachPeriods)
+#------------------------------------------------------
+
+
+
+class Controller(object):
+	"""One MAX31790 chip.  Several can be used at once (one per HAT / address)
+
+	busId - i2c bus number, ignored if an open SMBus is passed as bus
+	addr  - 7 bit i2c address (0x20 with ADD0 & ADD1 = GND)
+	"""
+	def __init__(self, busId=1, addr=maxAddr, bus=None):
+		self.bus = bus if bus is not None else smbus.SMBus(busId)
+		self.addr = addr
+		self.profiles = {}		# channel -> FanProfile
+
+	def profile(self, channel):
+		return self.profiles.get(channel, DEFAULT_PROFILE)
+
+	def applyProfiles(self, profiles):
+		"""Write {channel: FanProfile} to the chip.
+
+		Fan config (02h-07h) and dynamics (08h-0Dh) for all six channels are
+		read in one block, updated and written back in one block, then the
+		PWM frequency register.  Channels 1-3 and 4-6 share a frequency.
+		"""
+		freqs = {}
+		for channel, p in profiles.items():
+			group = 0 if channel <= 3 else 1
+			if freqs.setdefault(group, p.pwmFreq) != p.pwmFreq:
+				raise ValueError('channels {} share one PWM frequency'.format('1-3' if group == 0 else '4-6'))
+		regs = self.bus.read_i2c_block_data(self.addr, FAN_CONFIG(1), 12)
+		for channel, p in profiles.items():
+			config = regs[channel - 1]
+			config = (config & ~(0b11 << 5)) | (p.spinUp << 5)	# spin-up [6:5]
+			config |= 1 << 3									# tach input enable
+			regs[channel - 1] = config
+			dynamics = regs[channel + 5]
+			regs[channel + 5] = (dynamics & ~(0b111 << 5)) | (p.srCode() << 5)	# SR [7:5]
+		self.bus.write_i2c_block_data(self.addr, FAN_CONFIG(1), regs)
+		if freqs:
+			current = self.bus.read_byte_data(self.addr, PWMFREQ)
+			self.setPWMFreq(freqs.get(1, current >> 4), freqs.get(0, current & 0x0F))
+		self.profiles.update(profiles)
+
+	def __repr__(self):
+		return '<MAX31790 at {:#04x}>'.format(self.addr)
+
+	def writeBit(self, regAddr, bitNum, data):
+		#Write single bit to 8-bit register
+		regData = self.bus.read_byte_data(self.addr,regAddr)
+		writeData = (regData | (1 << bitNum)) if data == 1 else (regData & ~(1 << bitNum))
+		self.bus.write_byte_data(self.addr, regAddr, writeData)
+
+	def writeBits(self, regAddr, bitStart, length, data):
+		#Write multiple bits to 8-bit register
+		regData = self.bus.read_byte_data(self.addr,regAddr)
+		mask = ((1 << length) - 1) << (bitStart - length + 1)
+		data = data << (bitStart - length + 1)
+		data = data & mask
+		writeData = (regData & ~(mask)) | data;
+		self.bus.write_byte_data(self.addr, regAddr, writeData)
+
+	def readReg(self, regNum):
+		#Easier to type in python shell
+		return self.bus.read_byte_data(self.addr, regNum)
+
+	#Settings 
+	def reset(self):
+		self.writeBit(GLOBALCONFIG, 6, 1)
+
+	def standbyMode(self):
+		#Global Configuration bit 7 = 1 is standby
+		self.writeBit(GLOBALCONFIG, 7, 1)
+
+	def runMode(self):
+		#bit 7 = 0 is run (the POR default)
+		self.writeBit(GLOBALCONFIG, 7, 0)
+
+	def spinUp(self, channel, time):
+		self.writeBits(FAN_CONFIG(channel), 6, 2, time)
+
+	def tachEnable(self, channel, bit):
+		self.writeBit(FAN_CONFIG(channel), 3, bit)
+		# 0 = Disable
+		# 1 = Enable
+
+	def numTachPerCnt(self, channel, tachPer):
+		self.writeBits(FAN_DYNAMICS(channel), 7, 3, tachPer)
+
+	def timeBtwDutyCycleIncr(self, channel, time):
+		self.writeBits(FAN_DYNAMICS(channel), 4, 3, time)
+
+	def rateofChangeSymmetry(self, channel, bit):
+		self.writeBit(FAN_DYNAMICS(channel), 1, bit)
+		# 0 = Same RoC increasing/decreasing
+		# 1 = RoC is half when drecreasing
+
+	def setSeqStartDelay(self, time):
+		self.writeBits(SEQ_START, 7, 3, time)
+
+	def dutyCycleOnFail(self, duty):
+		self.writeBits(SEQ_START, 3, 2, duty)
+
+	def faultQueue(self, numFaults):
+		self.writeBits(SEQ_START, 1, 2, numFaults)
+
+	def initializeMAX(self, numberOfFans):
+		self.reset()
+		time.sleep(.1)
+		for i in range(1,numberOfFans+1):
+			#setRPM(i, MaxRPM)   		# Set MAX RPM for faults
+			#setPWMTarget(i, 0)	 		# set intial PWM
+			self.tachEnable(i, 1)	 		# Enable Tach input
+			self.rateofChangeSymmetry(i, 1)	#Rate of Change slower when decreaseing
+			print "Fan {:d} initialized".format(i)
+		#print "MAX31790 Setup Complete"
+
+	#PWM Functions
+	def PWMMode(self, channel):
+		#Enable PWM Control Mode (bit 7 = 0, the POR default)
+		self.writeBit(FAN_CONFIG(channel), 7, 0)
+
+	def setPWMFreq(self, freq4_6 , freq1_3):
+		#Set the PWM Frequency
+		writeData = freq4_6 << 4 | freq1_3
+		self.bus.write_byte_data(self.addr, PWMFREQ, writeData)
+
+	def setPWMTarget(self, channel, ratePWM):  
+		#set target PWM duty cycle in range (0,511)
+		MSB = ratePWM >> 1
+		LSB = (ratePWM & 0b1) << 7
+		self.bus.write_byte_data(self.addr, PWMOUT_TARGET_MSB(channel), MSB)
+		self.bus.write_byte_data(self.addr, PWMOUT_TARGET_LSB(channel), LSB) 
+
+	def setPWMTargetDuty(self, channel, percent):
+		#set target PWM duty cycle in range (0,100)
+		self.setPWMTarget(channel, (percent * 511) // 100)
+
+	def readPWM(self, channel):
+		#read current PWM duty cycle in range (0,500)
+		MSB = self.bus.read_byte_data(self.addr,PWM_OUT_DUTYCYCLE_MSB(channel))
+		LSB = self.bus.read_byte_data(self.addr,PWM_OUT_DUTYCYCLE_LSB(channel)) 
+		pwmNum = (MSB << 1) | (LSB >> 7)
+		return pwmNum
+
+	def readPWMDuty(self, channel):
+		#read current PWM duty cycle in range (0,100)
+		return (self.readPWM(channel) * 100) // 511	
+
+	def readAllPWM(self):
+		#Current duty (0,511) of all six channels in one block read (30h - 3Bh)
+		data = self.bus.read_i2c_block_data(self.addr, PWM_OUT_DUTYCYCLE_MSB(1), 12)
+		return [(data[i] << 1) | (data[i + 1] >> 7) for i in range(0, 12, 2)]
+
+	def setPWMTargets(self, targets):
+		#{channel: target (0,511)} - written in one block so the channels
+		#start ramping together
+		first, last = min(targets), max(targets)
+		regs = self.bus.read_i2c_block_data(self.addr, PWMOUT_TARGET_MSB(first), (last - first + 1) * 2)
+		for channel, ratePWM in targets.items():
+			i = (channel - first) * 2
+			regs[i] = ratePWM >> 1
+			regs[i + 1] = (ratePWM & 0b1) << 7
+		self.bus.write_i2c_block_data(self.addr, PWMOUT_TARGET_MSB(first), regs)
+
+	def setRampRates(self, rates, slowDown=None):
+		#{channel: incr_ code} for several channels in one block write
+		#(08h - 0Dh).  slowDown sets rateofChangeSymmetry on them as well
+		regs = self.bus.read_i2c_block_data(self.addr, FAN_DYNAMICS(1), 6)
+		for channel, code in rates.items():
+			reg = (regs[channel - 1] & ~(0b111 << 2)) | (code << 2)
+			if slowDown is not None:
+				reg = (reg & ~0b10) | (int(slowDown) << 1)
+			regs[channel - 1] = reg
+		self.bus.write_i2c_block_data(self.addr, FAN_DYNAMICS(1), regs)
+
+	def	readPWMTarget(self, channel):
+		#Read current PWM target in range (0,511)
+		MSB = self.bus.read_byte_data(self.addr,PWMOUT_TARGET_MSB(channel))
+		LSB = self.bus.read_byte_data(self.addr,PWMOUT_TARGET_LSB(channel)) 
+		pwmNum = (MSB << 1) | (LSB >> 7)
+		return pwmNum	
+
+	#RPM Functions
+	def RPMMode(self, channel):
+		#Enable RPM Control Mode (bit 7 = 1)
+		self.writeBit(FAN_CONFIG(channel), 7, 1)
+
+	def setRPMTarget(self, channel, rateRPM):
+		#Set the tach target in RPM
+		tCount = self.profile(channel).tachCount(rateRPM)
+		MSB = (tCount >> 3)
+		LSB = (tCount & 0b111) << 5
+		self.bus.write_byte_data(self.addr, TACH_TARGET_COUNT_MSB(channel), MSB)
+		self.bus.write_byte_data(self.addr, TACH_TARGET_COUNT_LSB(channel), LSB) 
+
+	def readTachCount(self, channel):
+		#11-bit tach count, MSB and LSB in one transaction so they match
+		data = self.bus.read_i2c_block_data(self.addr, TACH_COUNT_MSB(channel), 2)
+		return (data[0] << 3) | (data[1] >> 5)
+
+	def readRPM(self, channel):
+		#Read the current tach count in RPM (0 when stalled)
+		return self.profile(channel).lut[self.readTachCount(channel)]
+
+	def readAllTachCounts(self):
+		#Read all six 11-bit tach counts in one block transaction (18h - 23h)
+		data = self.bus.read_i2c_block_data(self.addr, TACH_COUNT_MSB(1), 12)
+		return [(data[i] << 3) | (data[i + 1] >> 5) for i in range(0, 12, 2)]
+
+	def readAllRPM(self):
+		#RPM of all six channels from one block read, stalled/absent = 0
+		counts = self.readAllTachCounts()
+		return [self.profile(i + 1).lut[counts[i]] for i in range(6)]
+
+	def readRPMTarget(self, channel):
+		#Read the current tach target in RPM
+		data = self.bus.read_i2c_block_data(self.addr, TACH_TARGET_COUNT_MSB(channel), 2)
+		tCount = (data[0] << 3) | (data[1] >> 5)
+		return self.profile(channel).lut[tCount]
+
+	#Usage Functions
+	def checkFaults(self):
+		#Returns 0 if no faults
+		return self.readReg(0x11) 
+
+	def StopAllFans(self, numberOfFans):
+		#Stop fans 1..numberOfFans now
+		channels = range(1, numberOfFans + 1)
+		for i in channels:
+			self.PWMMode(i)
+		self.setRampRates(dict((i, incr_1) for i in channels))
+		self.setPWMTargets(dict((i, 0) for i in channels))
+
+	def slowStopAllFans(self, numberOfFans, seconds=10.0):
+		#Ramp fans 1..numberOfFans to 0 in hardware over about `seconds`.
+		#Returns the ramp time without waiting - check readAllPWM() for 0s
+		channels = range(1, numberOfFans + 1)
+		current = self.readAllPWM()
+		steps = max(current[i - 1] for i in channels)
+		code = rampCode(steps, seconds)
+		self.setRampRates(dict((i, code) for i in channels), slowDown=False)
+		self.setPWMTargets(dict((i, 0) for i in channels))
+		return steps * INCR_MS[code] / 1000.0
+
+	def fanTest(self):
+		#Used to Map expected tach values for each duty cycle
+		for i in range (0,512):
+			self.setPWMTarget(1, i)
+			time.sleep(.5)
+			tachCt = self.readRPM(1)
+			print "{:d}".format(i) + " | " + "{:d}".format(tachCt)
+
+
+def rampCode(steps, seconds):
+	#Slowest incr_ code that moves `steps` duty steps within `seconds`
+	code = incr_1
+	for c in range(len(INCR_MS)):
+		if steps * INCR_MS[c] <= seconds * 1000.0:
+			code = c
+	return code
+
+
+#------------------ Module level API -------------------
+# The original single-chip functions drive the chip at maxAddr on bus 1
+
+_default = Controller(addr=maxAddr, bus=bus)
 
 def writeBit(regAddr, bitNum, data):
-	#Write single bit to 8-bit register
-	regData = bus.read_byte_data(maxAddr,regAddr)
-	writeData = (regData | (1 << bitNum)) if data == 1 else (regData & ~(1 << bitNum))
-	bus.write_byte_data(maxAddr, regAddr, writeData)
+	_default.writeBit(regAddr, bitNum, data)
 
 def writeBits(regAddr, bitStart, length, data):
-	#Write multiple bits to 8-bit register
-	regData = bus.read_byte_data(maxAddr,regAddr)
-	mask = ((1 << length) - 1) << (bitStart - length + 1)
-	data = data << (bitStart - length + 1)
-	data = data & mask
-	writeData = (regData & ~(mask)) | data;
-	bus.write_byte_data(maxAddr, regAddr, writeData)
-
+	_default.writeBits(regAddr, bitStart, length, data)
 
 def readReg(regNum):
-	#Easier to type in python shell
-	return bus.read_byte_data(maxAddr, regNum)
+	return _default.readReg(regNum)
 
-#Settings 
 def reset():
-	writeBit(GLOBALCONFIG, 6, 1)
+	_default.reset()
 
 def standbyMode():
-	writeBit(GLOBALCONFIG, 7, 0)
+	_default.standbyMode()
 
 def runMode():
-	writeBit(GLOBALCONFIG, 7, 1)
+	_default.runMode()
 
 def spinUp(channel, time):
-	writeBits(FAN_CONFIG(channel), 6, 2, time)
+	_default.spinUp(channel, time)
 
 def tachEnable(channel, bit):
-	writeBit(FAN_CONFIG(channel), 3, bit)
-	# 0 = Disable
-	# 1 = Enable
+	_default.tachEnable(channel, bit)
 
 def numTachPerCnt(channel, tachPer):
-	writeBits(FAN_DYNAMICS(channel), 7, 3, tachPer)
+	_default.numTachPerCnt(channel, tachPer)
 
 def timeBtwDutyCycleIncr(channel, time):
-	writeBits(FAN_DYNAMICS(channel), 4, 3, time)
+	_default.timeBtwDutyCycleIncr(channel, time)
 
 def rateofChangeSymmetry(channel, bit):
-	writeBit(FAN_DYNAMICS(channel), 1, bit)
-	# 0 = Same RoC increasing/decreasing
-	# 1 = RoC is half when drecreasing
+	_default.rateofChangeSymmetry(channel, bit)
 
 def setSeqStartDelay(time):
-	writeBits(SEQSTART, 7, 3, time)
+	_default.setSeqStartDelay(time)
 
 def dutyCycleOnFail(duty):
-	writeBits(SEQSTART, 3, 2, duty)
+	_default.dutyCycleOnFail(duty)
 
 def faultQueue(numFaults):
-	writeBits(SEQSTART, 1, 2, numFaults)
+	_default.faultQueue(numFaults)
 
 def initializeMAX(numberOfFans):
-	reset()
-	time.sleep(.1)
-	for i in range(1,numberOfFans+1):
-		#setRPM(i, MaxRPM)   		# Set MAX RPM for faults
-		#setPWMTarget(i, 0)	 		# set intial PWM
-		tachEnable(i, 1)	 		# Enable Tach input
-		rateofChangeSymmetry(i, 1)	#Rate of Change slower when decreaseing
-		print "Fan {:d} initialized".format(i)
-	#print "MAX31790 Setup Complete"
-
-
-#--------------------------------------------------
+	_default.initializeMAX(numberOfFans)
 
-#PWM Functions
 def PWMMode(channel):
-	#Enable PWM Control Mode
-	writeBit(FAN_CONFIG(channel), 7, 1)
+	_default.PWMMode(channel)
 
-def setPWMFreq( freq4_6 , freq1_3):
-	#Set the PWM Frequency
-	writeData = freq4_6 << 4 | freq1_3
-	bus.write_byte_data(maxAddr, PWMFREQ, writeData)
+def setPWMFreq(freq4_6 , freq1_3):
+	_default.setPWMFreq(freq4_6, freq1_3)
 
-def setPWMTarget(channel, ratePWM):  
-	#set target PWM duty cycle in range (0,511)
-	MSB = ratePWM >> 1
-	LSB = (ratePWM & 0b1) << 7
-	bus.write_byte_data(maxAddr, PWMOUT_TARGET_MSB(channel), MSB)
-	bus.write_byte_data(maxAddr, PWMOUT_TARGET_LSB(channel), LSB) 
+def setPWMTarget(channel, ratePWM):
+	_default.setPWMTarget(channel, ratePWM)
 
 def setPWMTargetDuty(channel, percent):
-	#set target PWM duty cycle in range (0,100)
-	dutyCycle = (percent * 511) / 100
-	MSB = dutyCycle >> 1
-	LSB = (dutyCycle & 0b1) << 7
-	bus.write_byte_data(maxAddr, PWMOUT_TARGET_MSB(channel), MSB)
-	bus.write_byte_data(maxAddr, PWMOUT_TARGET_LSB(channel), LSB) 
+	_default.setPWMTargetDuty(channel, percent)
 
 def readPWM(channel):
-	#read current PWM duty cycle in range (0,500)
-	MSB = bus.read_byte_data(maxAddr,PWM_OUT_DUTYCYCLE_MSB(channel))
-	LSB = bus.read_byte_data(maxAddr,PWM_OUT_DUTYCYCLE_LSB(channel)) 
-	pwmNum = (MSB << 1) | (LSB >> 7)
-	return pwmNum
+	return _default.readPWM(channel)
 
 def readPWMDuty(channel):
-	#read current PWM duty cycle in range (0,100)
-	MSB = bus.read_byte_data(maxAddr,PWM_OUT_DUTYCYCLE_MSB(channel))
-	LSB = bus.read_byte_data(maxAddr,PWM_OUT_DUTYCYCLE_LSB(channel)) 
-	pwmNum = (MSB << 1) | (LSB >> 7)
-	return (pwmNum * 100) / 511	
-
-def	readPWMTarget(channel):
-	#Read current PWM target in range (0,511)
-	MSB = bus.read_byte_data(maxAddr,PWMOUT_TARGET_MSB(channel))
-	LSB = bus.read_byte_data(maxAddr,PWMOUT_TARGET_LSB(channel)) 
-	pwmNum = (MSB << 1) | (LSB >> 7)
-	return pwmNum	
-
-#RPM Functions
+	return _default.readPWMDuty(channel)
+
+def readPWMTarget(channel):
+	return _default.readPWMTarget(channel)
+
+def readAllPWM():
+	return _default.readAllPWM()
+
+def setPWMTargets(targets):
+	_default.setPWMTargets(targets)
+
+def setRampRates(rates, slowDown=None):
+	_default.setRampRates(rates, slowDown)
+
 def RPMMode(channel):
-	#Enable RPM Control Mode
-	writeBit(FAN_CONFIG(channel), 7, 0)
+	_default.RPMMode(channel)
 
 def setRPMTarget(channel, rateRPM):
-	#Set the tach target in RPM
-	tCount = (60 * (tachPeriods) * (8192)) / (pulsePerRev * rateRPM)
-	MSB = (tCount >> 3)
-	LSB = (tCount & 0b111) << 5
-	bus.write_byte_data(maxAddr, TACH_TARGET_COUNT_MSB(channel), MSB)
-	bus.write_byte_data(maxAddr, TACH_TARGET_COUNT_LSB(channel), LSB) 
+	_default.setRPMTarget(channel, rateRPM)
+
+def applyProfiles(profiles):
+	_default.applyProfiles(profiles)
+
+def readTachCount(channel):
+	return _default.readTachCount(channel)
 
 def readRPM(channel):
-	#Read the current tach count in RPM
-	MSB = bus.read_byte_data(maxAddr, TACH_COUNT_MSB(channel))
-	LSB = bus.read_byte_data(maxAddr, TACH_COUNT_LSB(channel))
-	tCount = (MSB << 3) | (LSB >> 5)
-	rpm = (60 * (tachPeriods) * (8192)) / (pulsePerRev * tCount)
-	# My tach reads 480 when stopped
-	if rpm == 480:
-		rpm = 0 
-	return rpm
+	return _default.readRPM(channel)
 
-def readRPMTarget(channel):
-	#Read the current tach target in RPM
-	MSB = bus.read_byte_data(maxAddr, TACH_TARGET_COUNT_MSB(channel))
-	LSB = bus.read_byte_data(maxAddr, TACH_TARGET_COUNT_MSB(channel))
-	tCount = (MSB << 3) | (LSB >> 5)
-	return (60 * (tachPeriods) * (8192)) / (pulsePerRev * tCount)
+def readAllRPM():
+	return _default.readAllRPM()
 
+def readRPMTarget(channel):
+	return _default.readRPMTarget(channel)
 
-#Usage Functions
 def checkFaults():
-	#Returns 0 if no faults
-	return readReg(0x11) 
+	return _default.checkFaults()
 
 def StopAllFans(numberOfFans):
-	for i in range (1,numberOfFans):
-		setPWMMode(i)
-		setPWMTarget(i,0)
-
-def slowStopAllFans(numberOfFans):
-	#NOT FUNCTIONAL
-	for i in range (1,numberOfFans):
-		setPWMTarget(i,20)
-	while(readPwm(1) >20):
-		pass
-	for i in range (1,numberOfFans):
-		setPWMTarget(i,0)
+	_default.StopAllFans(numberOfFans)
+
+def slowStopAllFans(numberOfFans, seconds=10.0):
+	return _default.slowStopAllFans(numberOfFans, seconds)
 
 def fanTest():
-	#Used to Map expected tach values for each duty cycle
-	for i in range (0,512):
-		setPWMTarget(1, i)
-		time.sleep(.5)
-		tachCt = readRPM(1)
-		print "{:d}".format(i) + " | " + "{:d}".format(tachCt)
+	_default.fanTest()
 
 
 
@@ -304,4 +569,4 @@ def main():
 
 if __name__=="__main__":
    main()
-'''
\ No newline at end of file
+'''
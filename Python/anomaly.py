@@ -0,0 +1,254 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           anomaly.py
+#  Streaming checks for sensors that still answer but no longer measure.
+#
+#    Stuck(count, tolerance)  same value for `count` samples in a row
+#                             (frozen BME280, tach count that never moves)
+#    Range(lo, hi)            reading at or beyond the sensor's limits
+#                             (Chirp pinned at 0 / 100 %, BME280 at -40 C)
+#    Rate(maxRate)            changed faster than the air / soil can
+#                             (units per second)
+#    Consensus(tolerance)     redundant sensors disagree; with three or
+#                             more the odd one out is named, with two
+#                             both are - or only the one that is not the
+#                             `primary`
+#
+#  Every check has update(x, now) -> reason string or None, and reset().
+#  State is a few numbers per channel, no history is kept.
+#
+#  Monitor runs the checks for each channel like filters.FilterBank runs
+#  filters, keeps the alarms latched until `hold` clean samples in a row,
+#  logs each alarm once when it starts and once when it clears, and flags
+#  the channel's device in deviceHealth - except for the `alertOnly`
+#  checks (e.g. 'stuck'), which are only logged:
+#
+#    monitor = Monitor({'tempC' : ('bme', lambda: [Range(-40, 85), Stuck(30)])},
+#                      health=health, log=printLog)
+#    monitor.check('tempC', 24.31)
+#
+#  python anomaly.py   timing for 48 channels
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import time
+
+try:
+    _now = time.monotonic
+except AttributeError:       # Python 2
+    _now = time.time
+
+
+class Stuck(object):
+    def __init__(self, count=30, tolerance=0.0):
+        self.count = count
+        self.tolerance = tolerance
+        self.reset()
+
+    def update(self, x, now=None):
+        if self.ref is not None and abs(x - self.ref) <= self.tolerance:
+            self.n += 1
+            if self.n >= self.count:
+                return 'stuck at {:g} for {:d} samples'.format(self.ref, self.n)
+        else:
+            self.ref = x
+            self.n = 1
+        return None
+
+    def reset(self):
+        self.ref = None
+        self.n = 0
+
+
+class Range(object):
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+
+    def update(self, x, now=None):
+        if x <= self.lo or x >= self.hi:
+            return '{:g} at or outside {:g} - {:g}'.format(x, self.lo, self.hi)
+        return None
+
+    def reset(self):
+        pass
+
+
+class Rate(object):
+    def __init__(self, maxRate):
+        self.maxRate = maxRate          # units per second
+        self.reset()
+
+    def update(self, x, now=None):
+        if now is None:
+            now = _now()
+        last, then = self.last, self.then
+        self.last, self.then = x, now
+        if last is None or now <= then:
+            return None
+        rate = (x - last) / (now - then)
+        if abs(rate) > self.maxRate:
+            return 'changed {:+.3g}/s (limit {:g}/s)'.format(rate, self.maxRate)
+        return None
+
+    def reset(self):
+        self.last = None
+        self.then = None
+
+
+class Consensus(object):
+    """Redundant sensors of one quantity; flags a source after `persist`
+    samples in a row away from the others by more than `tolerance`.
+    With only two readings the `primary` source is trusted and only the
+    other one is flagged"""
+
+    def __init__(self, tolerance, persist=3, primary=None):
+        self.tolerance = tolerance
+        self.persist = persist
+        self.primary = primary
+        self.counts = {}
+
+    def update(self, values, now=None):
+        """{source: value} (None = no reading) -> {source: reason}"""
+        present = [(s, v) for s, v in values.items() if v is not None]
+        for s in values:
+            if values[s] is None:
+                self.counts[s] = 0
+        if len(present) < 2:
+            return {}
+        ordered = sorted(v for _, v in present)
+        n = len(ordered)
+        if n == 2:
+            # Can not tell which one is wrong - both are suspect
+            ref = (ordered[0] + ordered[1]) / 2.0
+            off = ordered[1] - ordered[0] > self.tolerance
+        else:
+            ref = ordered[n // 2] if n % 2 else (ordered[n // 2 - 1] + ordered[n // 2]) / 2.0
+            off = None
+        alarms = {}
+        for s, v in present:
+            bad = off if off is not None else abs(v - ref) > self.tolerance
+            if n == 2 and s == self.primary:
+                bad = False
+            self.counts[s] = self.counts.get(s, 0) + 1 if bad else 0
+            if self.counts[s] >= self.persist:
+                alarms[s] = '{:g} vs {:g} from the others'.format(v, ref)
+        return alarms
+
+    def reset(self):
+        self.counts = {}
+
+
+class Monitor(object):
+
+    def __init__(self, config=None, groups=None, health=None, log=None, hold=3,
+                 alertOnly=()):
+        """
+        config    - {channel: (device, factory)}, factory returns a list of checks
+        groups    - {name: (factory, {source: device})}, factory returns a Consensus
+        health    - deviceHealth.DeviceHealth to flag devices in
+        hold      - clean samples before an alarm clears
+        alertOnly - check names ('stuck', ...) that are logged but do not
+                    flag the device
+        """
+        self.health = health
+        self.log = log
+        self.hold = hold
+        self.alertOnly = set(alertOnly)
+        self.channels = {}
+        for channel, (device, factory) in (config or {}).items():
+            # alarms are keyed (channel, check name) - one check of each kind
+            self.channels[channel] = (device, [((channel, type(check).__name__.lower()), check)
+                                               for check in factory()])
+        self.groups = {}
+        for name, (factory, devices) in (groups or {}).items():
+            self.groups[name] = (factory(), devices)
+        self.alarms = {}              # (channel, check name) -> [reason, clean samples]
+
+    def _set(self, key, device, reason):
+        alarm = self.alarms.get(key)
+        if reason is not None:
+            if alarm is None:
+                self.alarms[key] = [reason, 0]
+                self._say(key, device, reason)
+            else:
+                alarm[0] = reason
+                alarm[1] = 0
+        elif alarm is not None:
+            alarm[1] += 1
+            if alarm[1] >= self.hold:
+                del self.alarms[key]
+                self._say(key, device, None)
+
+    def _say(self, key, device, reason):
+        name = '{} {}'.format(key[0], key[1])
+        if self.health is not None and key[1] not in self.alertOnly:
+            self.health.flag(device, name, reason)
+        if self.log is not None:
+            if reason is None:
+                self.log('anomaly cleared: {}'.format(name))
+            else:
+                self.log('anomaly: {} - {}'.format(name, reason))
+
+    def check(self, channel, x, now=None):
+        """Run channel's checks on x, returns the channel's active reasons"""
+        device, checks = self.channels[channel]
+        if x is None:
+            return []
+        if now is None:
+            now = _now()
+        active = []
+        for key, check in checks:
+            reason = check.update(x, now)
+            if reason is not None or key in self.alarms:
+                self._set(key, device, reason)
+            alarm = self.alarms.get(key)
+            if alarm is not None:
+                active.append(alarm[0])
+        return active
+
+    def agree(self, name, values, now=None):
+        """Cross-check {source: value} of group `name`, returns {source: reason}"""
+        consensus, devices = self.groups[name]
+        alarms = consensus.update(values, now)
+        for source in values:
+            self._set((name, source), devices[source], alarms.get(source))
+        return alarms
+
+    def active(self):
+        return dict(('{} {}'.format(*key), alarm[0]) for key, alarm in self.alarms.items())
+
+
+def bench(channels=48, n=2000):
+    import math
+    import random
+    config = {}
+    for c in range(channels):
+        config['ch{:d}'.format(c)] = ('dev{:d}'.format(c % 6),
+                                      lambda: [Range(-40, 85), Stuck(30), Rate(0.5)])
+    groups = {'temperature' : (lambda: Consensus(1.0), {'bme' : 'bme', 'bmp' : 'bmp', 'chirp' : 'chirp'})}
+    monitor = Monitor(config, groups)
+    rnd = random.Random(1)
+    names = sorted(config)
+    rows = [[20 + 5 * math.sin(i / 500.0) + rnd.gauss(0, 0.05) for c in names] for i in range(n)]
+    start = _now()
+    for i, row in enumerate(rows):
+        now = i * 10.0
+        for c, x in zip(names, row):
+            monitor.check(c, x, now)
+        monitor.agree('temperature', {'bme' : row[0], 'bmp' : row[0] + 0.2, 'chirp' : row[0] - 0.1}, now)
+    elapsed = _now() - start
+    print('{:d} channels x 3 checks + one 3-way consensus: {:.0f} us per sample loop '
+          '({:.1f} us per channel)'.format(channels, elapsed / n * 1e6, elapsed / n / channels * 1e6))
+
+if __name__=="__main__":
+   bench()
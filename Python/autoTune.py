@@ -0,0 +1,381 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           autoTune.py
+#  Tunes the fan controller for the tent it is in instead of using the
+#  hand-picked ladder.
+#
+#  1. Relay experiment - around the setpoint the fan is switched between
+#     two duties (fast below / slow above) and the temperature oscillates
+#     a few times.
+#  2. Model fit - a first order plus dead time model
+#         tempF = bias + K * duty(t - L) through a lag of T seconds
+#     is fitted to the recorded trace.  For every (T, L) on a grid the
+#     rest is linear, so K and bias come from least squares.
+#  3. Controller - PI gains from the SIMC rules (Skogestad):
+#         Kc = T / (K * (tauC + L)),  Ti = min(T, 4 * (tauC + L))
+#     with tauC = max(L, T / 2) - slower than SIMC's "tight" tauC = L,
+#     which chatters the fan on sensor noise.  The PI output is
+#     quantised to `step` % with hysteresis so the fan is only re-written
+#     when the demand really moved.
+#  4. Saved to JSON and picked up by fullbucket_v3 (TUNING_PATH) - only
+#     a fit with K above MIN_GAIN and rmse under MAX_RMSE is saved.
+#
+#  Duty is as written to the MAX31790 (inverted: 30% = MAX fan speed), so
+#  K is positive - more duty, slower fan, warmer tent.
+#
+#  Usage:
+#    python autoTune.py sim            relay test + fit + ladder vs PI on a
+#                                      simulated tent (one day)
+#    python autoTune.py run [setpoint] [path]
+#                                      relay test on the real tent (BME280,
+#                                      MAX31790 channel 1), saves the tuning
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import bisect
+import json
+import math
+import random
+import sys
+import time
+
+# Same steps as fullbucket_v3 (duty is inverted: 30% = MAX fan speed)
+LADDER = [(82, 30), (80, 40), (76, 50), (72, 60), (None, 70)]
+
+MIN_GAIN = 0.01          # F per % - a weaker (or negative) fitted K is noise
+MAX_RMSE = 0.5           # F - a worse fit is not the tent
+
+
+# ------------------------------------------------------------ experiment
+class RelayExperiment(object):
+    """Relay feedback: duty `low` (fans fast) above setpoint + hysteresis,
+    `high` (fans slow) below setpoint - hysteresis.
+
+    Call step(now, tempF) every sample; it returns the duty to write, or
+    None once `cycles` oscillations were recorded (or maxSeconds passed).
+    """
+
+    def __init__(self, setpoint, low=30, high=70, hysteresis=0.3, cycles=4,
+                 maxSeconds=6 * 3600):
+        self.setpoint = setpoint
+        self.low = low
+        self.high = high
+        self.hysteresis = hysteresis
+        self.cycles = cycles
+        self.maxSeconds = maxSeconds
+        self.duty = high
+        self.trace = []            # (t, duty, tempF)
+        self.switches = []         # times the relay flipped
+        self.t0 = None
+
+    def step(self, now, temp):
+        if self.t0 is None:
+            self.t0 = now
+            self.duty = self.low if temp > self.setpoint else self.high
+        self.trace.append((now, self.duty, temp))
+        if len(self.switches) >= 2 * self.cycles + 1 or now - self.t0 > self.maxSeconds:
+            return None
+        if self.duty == self.high and temp > self.setpoint + self.hysteresis:
+            self.duty = self.low
+            self.switches.append(now)
+        elif self.duty == self.low and temp < self.setpoint - self.hysteresis:
+            self.duty = self.high
+            self.switches.append(now)
+        return self.duty
+
+    def done(self):
+        return len(self.switches) >= 2 * self.cycles + 1
+
+    def fit(self):
+        # Skip the run-in before the first switch
+        start = self.switches[0] if self.switches else self.t0
+        trace = [r for r in self.trace if r[0] >= start]
+        return fitFOPDT([r[0] for r in trace], [r[1] for r in trace], [r[2] for r in trace])
+
+
+# ------------------------------------------------------------ model fit
+def _solve3(a, b):
+    # Gaussian elimination for a 3x3 system (normal equations)
+    m = [row[:] + [v] for row, v in zip(a, b)]
+    for i in range(3):
+        p = max(range(i, 3), key=lambda r: abs(m[r][i]))
+        if abs(m[p][i]) < 1e-12:
+            return None
+        m[i], m[p] = m[p], m[i]
+        for r in range(3):
+            if r != i:
+                f = m[r][i] / m[i][i]
+                for c in range(i, 4):
+                    m[r][c] -= f * m[i][c]
+    return [m[i][3] / m[i][i] for i in range(3)]
+
+
+def fitFOPDT(times, duties, temps, Ts=None, Ls=None):
+    """Fit tempF = bias + K * lag_T(duty(t - L)) + c * exp(-(t - t0) / T).
+
+    The exp term absorbs the starting condition.  Returns a dict with K
+    (F per %), T and L (s), bias (F) and rmse (F), or None.
+    """
+    n = len(times)
+    if n < 10:
+        return None
+    t0 = times[0]
+    span = times[-1] - t0
+    dt = span / (n - 1)
+    if Ts is None:
+        Ts = [dt * math.exp(i * math.log(span / dt) / 39.0) for i in range(40)]
+    if Ls is None:
+        Ls = [i * dt for i in range(int(min(span / 4, 900) / dt) + 1)]
+
+    best = None
+    for L in Ls:
+        # duty in effect at t - L (duty is held between samples)
+        delayed = []
+        for t in times:
+            i = bisect.bisect_right(times, t - L) - 1
+            delayed.append(duties[max(i, 0)])
+        for T in Ts:
+            z = delayed[0]
+            zs = [z]
+            for k in range(1, n):
+                a = math.exp(-(times[k] - times[k - 1]) / T)
+                z = a * z + (1 - a) * delayed[k - 1]
+                zs.append(z)
+            es = [math.exp(-(t - t0) / T) for t in times]
+            # normal equations for [1, z, e]
+            s = [[0.0] * 3 for _ in range(3)]
+            r = [0.0] * 3
+            for k in range(n):
+                row = (1.0, zs[k], es[k])
+                y = temps[k]
+                for i in range(3):
+                    r[i] += row[i] * y
+                    for j in range(3):
+                        s[i][j] += row[i] * row[j]
+            coef = _solve3(s, r)
+            if coef is None:
+                continue
+            bias, K, c = coef
+            sse = 0.0
+            for k in range(n):
+                err = temps[k] - (bias + K * zs[k] + c * es[k])
+                sse += err * err
+            if best is None or sse < best[0]:
+                best = (sse, K, T, L, bias)
+    if best is None:
+        return None
+    sse, K, T, L, bias = best
+    return {'K' : K, 'T' : T, 'L' : L, 'bias' : bias, 'rmse' : math.sqrt(sse / n)}
+
+
+def checkModel(model):
+    """ValueError unless the fit can be tuned from - a K <= 0 would give
+    a negative Kc, positive feedback that drives the fans to one limit"""
+    if model is None:
+        raise ValueError("no model fitted")
+    if not model['K'] >= MIN_GAIN:
+        raise ValueError("fitted K {:.4f} F/% is not above {} - more duty must warm the tent".format(
+            model['K'], MIN_GAIN))
+    if not model['rmse'] <= MAX_RMSE:
+        raise ValueError("fit rmse {:.2f} F is over {} F".format(model['rmse'], MAX_RMSE))
+
+
+# ------------------------------------------------------------ controller
+def simcPI(model, tauC=None):
+    """PI gains (Kc in % per F, Ti in s) for a FOPDT model"""
+    checkModel(model)
+    L = max(model['L'], 1.0)
+    tauC = max(L, model['T'] / 2.0) if tauC is None else tauC
+    kc = model['T'] / (model['K'] * (tauC + L))
+    ti = min(model['T'], 4 * (tauC + L))
+    return kc, ti
+
+
+class PIController(object):
+    """Temperature -> duty %, quantised to `step` with hysteresis"""
+
+    def __init__(self, setpoint, kc, ti, lo=30, hi=70, step=5, start=50):
+        self.setpoint = setpoint
+        self.kc = kc
+        self.ti = ti
+        self.lo = lo
+        self.hi = hi
+        self.step = step
+        self.integral = float(start)          # duty the integral holds
+        self.duty = start
+        self.lastTime = None
+
+    def update(self, temp, now=None):
+        if now is None:
+            now = time.time()
+        dt = 0.0 if self.lastTime is None else now - self.lastTime
+        self.lastTime = now
+        error = self.setpoint - temp
+        demand = self.integral + self.kc * error
+        # Only integrate while the output is not pinned (anti-windup)
+        if self.lo < demand < self.hi or (demand >= self.hi) != (error > 0):
+            self.integral += self.kc * error * dt / self.ti
+            self.integral = min(max(self.integral, self.lo), self.hi)
+        demand = min(max(self.integral + self.kc * error, self.lo), self.hi)
+        # Move a whole step only once the demand is 3/4 step away
+        if abs(demand - self.duty) >= 0.75 * self.step:
+            level = self.lo + round((demand - self.lo) / self.step) * self.step
+            self.duty = int(min(max(level, self.lo), self.hi))
+        return self.duty
+
+
+def ladder(temp, steps=LADDER):
+    for limit, duty in steps:
+        if limit is None or temp > limit:
+            return duty
+
+
+# ------------------------------------------------------------ persistence
+def save(path, setpoint, model, kc, ti, step=5):
+    tuning = {'setpoint' : setpoint, 'model' : model, 'kc' : kc, 'ti' : ti,
+              'step' : step, 'tuned' : time.strftime("%Y-%m-%d %H:%M:%S")}
+    with open(path, 'w') as f:
+        json.dump(tuning, f, indent=2, sort_keys=True)
+    return tuning
+
+
+def load(path, lo=30, hi=70):
+    """PIController from a saved tuning file (ValueError if its gains are
+    not positive)"""
+    with open(path) as f:
+        tuning = json.load(f)
+    if not (tuning['kc'] > 0 and tuning['ti'] > 0):
+        raise ValueError("{}: kc {} / ti {} must both be positive".format(path, tuning['kc'], tuning['ti']))
+    return PIController(tuning['setpoint'], tuning['kc'], tuning['ti'], lo, hi,
+                        tuning.get('step', 5))
+
+
+# ------------------------------------------------------------ simulation
+class SimulatedTent(object):
+    """FOPDT tent: day/night ambient, lights 06:00-24:00, sensor noise"""
+
+    def __init__(self, K=0.25, T=300.0, L=40.0, ambient=62.0, swing=3.0,
+                 lights=4.0, noise=0.05, seed=1, t0=0.0):
+        self.K = K
+        self.T = T
+        self.L = L
+        self.ambient = ambient
+        self.swing = swing
+        self.lights = lights
+        self.noise = noise
+        self.rnd = random.Random(seed)
+        self.t = t0
+        self.history = []          # (t, duty) so the dead time can look back
+        self.temp = None
+
+    def load(self, t):
+        hour = (t % 86400) / 3600.0
+        heat = self.lights if hour >= 6 else 0.0
+        return self.ambient + self.swing * math.sin(2 * math.pi * (hour - 9) / 24) + heat
+
+    def step(self, duty, dt=10.0):
+        self.history.append((self.t, duty))
+        delayed = self.history[0][1]
+        while len(self.history) > 1 and self.history[1][0] <= self.t - self.L:
+            self.history.pop(0)
+            delayed = self.history[0][1]
+        target = self.load(self.t) + self.K * delayed
+        if self.temp is None:
+            self.temp = target
+        a = math.exp(-dt / self.T)
+        self.temp = a * self.temp + (1 - a) * target
+        self.t += dt
+        return self.temp + self.rnd.gauss(0, self.noise)
+
+
+def simulate(control, plant, hours=24, dt=10.0, settle=1800):
+    """Run control(tempF, t) -> duty on the plant.  Returns metrics"""
+    import filters
+    smooth = filters.Chain(filters.Median(3), filters.Ewma(0.3), filters.Deadband(0.5))
+    duty = 50
+    temps = []
+    changes = 0
+    for i in range(int(hours * 3600 / dt)):
+        raw = plant.step(duty, dt)
+        new = control(smooth.update(raw), plant.t)
+        if new != duty and plant.t > settle:
+            changes += 1
+        duty = new
+        if plant.t > settle:
+            temps.append(plant.temp)
+    return {'max' : max(temps), 'min' : min(temps), 'changes' : changes,
+            'mean' : sum(temps) / len(temps)}
+
+
+def simDemo(setpoint=78.0):
+    plant = SimulatedTent(t0=10 * 3600)
+    exp = RelayExperiment(setpoint)
+    duty = exp.high
+    start = time.time()
+    while duty is not None:
+        temp = plant.step(duty)
+        duty = exp.step(plant.t, temp)
+    if not exp.done():
+        print("relay test did not oscillate")
+        return
+    model = exp.fit()
+    print("relay test : {:d} switches in {:.1f} h".format(len(exp.switches), (plant.t - exp.t0) / 3600.0))
+    try:
+        kc, ti = simcPI(model)
+    except ValueError as e:
+        print("not tuned  : {}".format(e))
+        return
+    print("fitted     : K {K:.3f} F/% | T {T:.0f} s | L {L:.0f} s | rmse {rmse:.3f} F".format(**model))
+    print("true       : K {:.3f} F/% | T {:.0f} s | L {:.0f} s   ({:.1f} s to fit)".format(
+        plant.K, plant.T, plant.L, time.time() - start))
+    print("PI         : Kc {:.1f} %/F | Ti {:.0f} s".format(kc, ti))
+
+    ladderRun = simulate(lambda temp, t: ladder(temp), SimulatedTent(seed=2))
+    pi = PIController(setpoint, kc, ti)
+    piRun = simulate(lambda temp, t: pi.update(temp, t), SimulatedTent(seed=2))
+    for name, run in (('ladder', ladderRun), ('tuned PI', piRun)):
+        print("{:10s} : {:5.1f} - {:5.1f} F (mean {:.1f}) | overshoot {:+.1f} F | {:d} fan changes / day".format(
+            name, run['min'], run['max'], run['mean'], run['max'] - setpoint, run['changes']))
+
+
+def runTent(setpoint=78.0, path='tuning.json', period=10):
+    import bme280
+    import MAX31790
+    exp = RelayExperiment(setpoint)
+    duty = exp.high
+    while duty is not None:
+        MAX31790.setPWMTargetDuty(1, duty)
+        time.sleep(period)
+        (temperature, pressure, humidity) = bme280.readBME280All()
+        duty = exp.step(time.time(), temperature * 9.0 / 5.0 + 32)
+        print("{:.0f} s | {:.2f} F | duty {} | switches {:d}".format(
+            time.time() - exp.t0, exp.trace[-1][2], duty, len(exp.switches)))
+    if not exp.done():
+        print("No oscillation - check the setpoint is between the two duties' temperatures")
+        return
+    model = exp.fit()
+    try:
+        kc, ti = simcPI(model)
+    except ValueError as e:
+        print("Not saved: {}".format(e))
+        return
+    save(path, setpoint, model, kc, ti)
+    print("K {K:.3f} F/% | T {T:.0f} s | L {L:.0f} s | rmse {rmse:.3f} F".format(**model))
+    print("Kc {:.1f} %/F | Ti {:.0f} s -> {}".format(kc, ti, path))
+
+
+if __name__=="__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'run':
+        runTent(float(sys.argv[2]) if len(sys.argv) > 2 else 78.0,
+                sys.argv[3] if len(sys.argv) > 3 else 'tuning.json')
+    else:
+        simDemo()
@@ -56,6 +56,88 @@ def readBME280ID(addr=DEVICE):
   (chip_id, chip_version) = bus.read_i2c_block_data(addr, REG_ID, 2)
   return (chip_id, chip_version)
 
+# Calibration words per i2c address, read from the chip once.  Shared with
+# bmp280.py - the BMP280 has the same T/P trimming (no humidity block).
+_calibration = {}
+
+def readCalibration(addr=DEVICE, humidity=True):
+  # Read blocks of calibration data from EEPROM (cached)
+  # See Page 22 data sheet
+  cal = _calibration.get(addr)
+  if cal is not None and (cal['H'] is not None or not humidity):
+    return cal
+
+  cal1 = bus.read_i2c_block_data(addr, 0x88, 24)
+
+  # Convert byte data to word values
+  cal = {
+    'T' : (getUShort(cal1, 0), getShort(cal1, 2), getShort(cal1, 4)),
+    'P' : (getUShort(cal1, 6), getShort(cal1, 8), getShort(cal1, 10),
+           getShort(cal1, 12), getShort(cal1, 14), getShort(cal1, 16),
+           getShort(cal1, 18), getShort(cal1, 20), getShort(cal1, 22)),
+    'H' : None,
+  }
+
+  if humidity:
+    cal2 = bus.read_i2c_block_data(addr, 0xA1, 1)
+    cal3 = bus.read_i2c_block_data(addr, 0xE1, 7)
+
+    dig_H1 = getUChar(cal2, 0)
+    dig_H2 = getShort(cal3, 0)
+    dig_H3 = getUChar(cal3, 2)
+
+    dig_H4 = getChar(cal3, 3)
+    dig_H4 = (dig_H4 << 24) >> 20
+    dig_H4 = dig_H4 | (getChar(cal3, 4) & 0x0F)
+
+    dig_H5 = getChar(cal3, 5)
+    dig_H5 = (dig_H5 << 24) >> 20
+    dig_H5 = dig_H5 | (getUChar(cal3, 4) >> 4 & 0x0F)
+
+    dig_H6 = getChar(cal3, 6)
+    cal['H'] = (dig_H1, dig_H2, dig_H3, dig_H4, dig_H5, dig_H6)
+
+  _calibration[addr] = cal
+  return cal
+
+def compensateTemperature(cal, temp_raw):
+  # Returns (temperature in C, t_fine for the pressure/humidity formulas)
+  dig_T1, dig_T2, dig_T3 = cal['T']
+  var1 = ((((temp_raw>>3)-(dig_T1<<1)))*(dig_T2)) >> 11
+  var2 = (((((temp_raw>>4) - (dig_T1)) * ((temp_raw>>4) - (dig_T1))) >> 12) * (dig_T3)) >> 14
+  t_fine = var1+var2
+  temperature = float(((t_fine * 5) + 128) >> 8);
+  return temperature/100.0, t_fine
+
+def compensatePressure(cal, pres_raw, t_fine):
+  # Returns pressure in Pa
+  dig_P1, dig_P2, dig_P3, dig_P4, dig_P5, dig_P6, dig_P7, dig_P8, dig_P9 = cal['P']
+  var1 = t_fine / 2.0 - 64000.0
+  var2 = var1 * var1 * dig_P6 / 32768.0
+  var2 = var2 + var1 * dig_P5 * 2.0
+  var2 = var2 / 4.0 + dig_P4 * 65536.0
+  var1 = (dig_P3 * var1 * var1 / 524288.0 + dig_P2 * var1) / 524288.0
+  var1 = (1.0 + var1 / 32768.0) * dig_P1
+  if var1 == 0:
+    return 0
+  pressure = 1048576.0 - pres_raw
+  pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
+  var1 = dig_P9 * pressure * pressure / 2147483648.0
+  var2 = pressure * dig_P8 / 32768.0
+  return pressure + (var1 + var2 + dig_P7) / 16.0
+
+def compensateHumidity(cal, hum_raw, t_fine):
+  # Returns relative humidity in %
+  dig_H1, dig_H2, dig_H3, dig_H4, dig_H5, dig_H6 = cal['H']
+  humidity = t_fine - 76800.0
+  humidity = (hum_raw - (dig_H4 * 64.0 + dig_H5 / 16384.0 * humidity)) * (dig_H2 / 65536.0 * (1.0 + dig_H6 / 67108864.0 * humidity * (1.0 + dig_H3 / 67108864.0 * humidity)))
+  humidity = humidity * (1.0 - dig_H1 * humidity / 524288.0)
+  if humidity > 100:
+    humidity = 100
+  elif humidity < 0:
+    humidity = 0
+  return humidity
+
 def readBME280All(addr=DEVICE):
   # Register Addresses
   REG_DATA = 0xF7
@@ -78,40 +160,7 @@ def readBME280All(addr=DEVICE):
   control = OVERSAMPLE_TEMP<<5 | OVERSAMPLE_PRES<<2 | MODE
   bus.write_byte_data(addr, REG_CONTROL, control)
 
-  # Read blocks of calibration data from EEPROM
-  # See Page 22 data sheet
-  cal1 = bus.read_i2c_block_data(addr, 0x88, 24)
-  cal2 = bus.read_i2c_block_data(addr, 0xA1, 1)
-  cal3 = bus.read_i2c_block_data(addr, 0xE1, 7)
-
-  # Convert byte data to word values
-  dig_T1 = getUShort(cal1, 0)
-  dig_T2 = getShort(cal1, 2)
-  dig_T3 = getShort(cal1, 4)
-
-  dig_P1 = getUShort(cal1, 6)
-  dig_P2 = getShort(cal1, 8)
-  dig_P3 = getShort(cal1, 10)
-  dig_P4 = getShort(cal1, 12)
-  dig_P5 = getShort(cal1, 14)
-  dig_P6 = getShort(cal1, 16)
-  dig_P7 = getShort(cal1, 18)
-  dig_P8 = getShort(cal1, 20)
-  dig_P9 = getShort(cal1, 22)
-
-  dig_H1 = getUChar(cal2, 0)
-  dig_H2 = getShort(cal3, 0)
-  dig_H3 = getUChar(cal3, 2)
-
-  dig_H4 = getChar(cal3, 3)
-  dig_H4 = (dig_H4 << 24) >> 20
-  dig_H4 = dig_H4 | (getChar(cal3, 4) & 0x0F)
-
-  dig_H5 = getChar(cal3, 5)
-  dig_H5 = (dig_H5 << 24) >> 20
-  dig_H5 = dig_H5 | (getUChar(cal3, 4) >> 4 & 0x0F)
-
-  dig_H6 = getChar(cal3, 6)
+  cal = readCalibration(addr)
 
   # Wait in ms (Datasheet Appendix B: Measurement time and current calculation)
   wait_time = 1.25 + (2.3 * OVERSAMPLE_TEMP) + ((2.3 * OVERSAMPLE_PRES) + 0.575) + ((2.3 * OVERSAMPLE_HUM)+0.575)
@@ -123,38 +172,11 @@ def readBME280All(addr=DEVICE):
   temp_raw = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
   hum_raw = (data[6] << 8) | data[7]
 
-  #Refine temperature
-  var1 = ((((temp_raw>>3)-(dig_T1<<1)))*(dig_T2)) >> 11
-  var2 = (((((temp_raw>>4) - (dig_T1)) * ((temp_raw>>4) - (dig_T1))) >> 12) * (dig_T3)) >> 14
-  t_fine = var1+var2
-  temperature = float(((t_fine * 5) + 128) >> 8);
-
-  # Refine pressure and adjust for temperature
-  var1 = t_fine / 2.0 - 64000.0
-  var2 = var1 * var1 * dig_P6 / 32768.0
-  var2 = var2 + var1 * dig_P5 * 2.0
-  var2 = var2 / 4.0 + dig_P4 * 65536.0
-  var1 = (dig_P3 * var1 * var1 / 524288.0 + dig_P2 * var1) / 524288.0
-  var1 = (1.0 + var1 / 32768.0) * dig_P1
-  if var1 == 0:
-    pressure=0
-  else:
-    pressure = 1048576.0 - pres_raw
-    pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
-    var1 = dig_P9 * pressure * pressure / 2147483648.0
-    var2 = pressure * dig_P8 / 32768.0
-    pressure = pressure + (var1 + var2 + dig_P7) / 16.0
-
-  # Refine humidity
-  humidity = t_fine - 76800.0
-  humidity = (hum_raw - (dig_H4 * 64.0 + dig_H5 / 16384.0 * humidity)) * (dig_H2 / 65536.0 * (1.0 + dig_H6 / 67108864.0 * humidity * (1.0 + dig_H3 / 67108864.0 * humidity)))
-  humidity = humidity * (1.0 - dig_H1 * humidity / 524288.0)
-  if humidity > 100:
-    humidity = 100
-  elif humidity < 0:
-    humidity = 0
+  temperature, t_fine = compensateTemperature(cal, temp_raw)
+  pressure = compensatePressure(cal, pres_raw, t_fine)
+  humidity = compensateHumidity(cal, hum_raw, t_fine)
 
-  return temperature/100.0,pressure/100.0,humidity
+  return temperature,pressure/100.0,humidity
 """
 def main():
 
@@ -0,0 +1,171 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           bmp280.py
+#  BMP280 temperature / pressure sensor.
+#
+#  Uses the compensation formulas and the calibration cache in bme280.py
+#  (the two chips share the same T/P trimming), so calibration is read
+#  once per address.  Runs in normal mode: the chip measures on its own
+#  every standby period through its IIR filter and readSensor() just
+#  reads the latest result in one 6 byte burst.
+#
+#  Official datasheet available from :
+#  https://www.bosch-sensortec.com/bst/products/all_products/bmp280
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import time
+
+import bme280
+
+DEVICE = 0x77   # SDO high; 0x76 is usually taken by the BME280
+
+# Registers
+REG_ID      = 0xD0
+REG_RESET   = 0xE0
+REG_STATUS  = 0xF3
+REG_CONTROL = 0xF4
+REG_CONFIG  = 0xF5
+REG_DATA    = 0xF7
+
+CHIP_ID     = 0x58
+RESET_WORD  = 0xB6
+
+
+class bmp280Wrapper(object):
+    """BMP280 on the shared bme280 i2c bus.
+
+    Config / measurement bytes are built by OR-ing the constants below:
+        sensor.setMode(config = sensor.tSb62t5 | sensor.filt4,
+                       meas   = sensor.osP16 | sensor.osT2 | sensor.modeNormal)
+
+    After readSensor(), temperature is in C and pressure in Pa.
+    """
+
+    # config (0xF5): standby time between normal mode measurements [7:5]
+    tSb0t5  = 0b000 << 5     # 0.5 ms
+    tSb62t5 = 0b001 << 5     # 62.5 ms
+    tSb125  = 0b010 << 5
+    tSb250  = 0b011 << 5
+    tSb500  = 0b100 << 5
+    tSb1000 = 0b101 << 5
+    tSb2000 = 0b110 << 5
+    tSb4000 = 0b111 << 5
+
+    # config (0xF5): IIR filter coefficient [4:2]
+    filtOff = 0b000 << 2
+    filt2   = 0b001 << 2
+    filt4   = 0b010 << 2
+    filt8   = 0b011 << 2
+    filt16  = 0b100 << 2
+
+    # ctrl_meas (0xF4): temperature oversampling [7:5]
+    osTSkip = 0b000 << 5
+    osT1    = 0b001 << 5
+    osT2    = 0b010 << 5
+    osT4    = 0b011 << 5
+    osT8    = 0b100 << 5
+    osT16   = 0b101 << 5
+
+    # ctrl_meas (0xF4): pressure oversampling [4:2]
+    osPSkip = 0b000 << 2
+    osP1    = 0b001 << 2
+    osP2    = 0b010 << 2
+    osP4    = 0b011 << 2
+    osP8    = 0b100 << 2
+    osP16   = 0b101 << 2
+
+    # ctrl_meas (0xF4): mode [1:0]
+    modeSleep  = 0b00
+    modeForced = 0b01
+    modeNormal = 0b11
+
+    def __init__(self, addr=DEVICE):
+        self.addr = addr
+        self.bus = bme280.bus
+        self.chipID = self.bus.read_byte_data(addr, REG_ID)
+        if self.chipID != CHIP_ID:
+            raise IOError('no BMP280 at {:#04x} (chip id {:#04x})'.format(addr, self.chipID))
+        self.cal = bme280.readCalibration(addr, humidity=False)
+        self.meas = 0
+        self.temperature = None
+        self.pressure = None
+        self.timestamp = None
+
+    def resetSensor(self):
+        self.bus.write_byte_data(self.addr, REG_RESET, RESET_WORD)
+        time.sleep(0.002)       # start-up time after reset (2 ms)
+
+    def setMode(self, config=tSb62t5 | filt4, meas=osP16 | osT2 | modeNormal):
+        # Config is only writable in sleep mode, so set it before ctrl_meas
+        self.bus.write_byte_data(self.addr, REG_CONTROL, self.modeSleep)
+        self.bus.write_byte_data(self.addr, REG_CONFIG, config)
+        self.bus.write_byte_data(self.addr, REG_CONTROL, meas)
+        self.meas = meas
+
+    def readSensor(self):
+        # Forced mode needs a fresh conversion, normal mode already has one
+        if self.meas & 0b11 == self.modeForced:
+            self.bus.write_byte_data(self.addr, REG_CONTROL, self.meas)
+            while self.bus.read_byte_data(self.addr, REG_STATUS) & 0x08:
+                time.sleep(0.001)
+
+        # Pressure and temperature in one burst so both are from the same
+        # conversion
+        data = self.bus.read_i2c_block_data(self.addr, REG_DATA, 6)
+        pres_raw = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
+        temp_raw = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
+
+        self.temperature, t_fine = bme280.compensateTemperature(self.cal, temp_raw)
+        self.pressure = bme280.compensatePressure(self.cal, pres_raw, t_fine)
+        self.timestamp = time.time()
+        return self.temperature, self.pressure
+
+
+def fuse(bme, bmp, tempTol=1.0, presTol=1.0, method='mean'):
+    """Combine a BME280 and a BMP280 reading.
+
+    bme, bmp - (temperature C, pressure hPa), either may be None
+    method   - 'mean' averages the two, 'bme' / 'bmp' prefers that sensor
+               and uses the other to cross-check it
+
+    Returns (temperature, pressure, agree) where agree is False when the
+    sensors differ by more than tempTol C / presTol hPa, and None when
+    only one sensor was available.
+    """
+    if bme is None and bmp is None:
+        return None, None, None
+    if bme is None or bmp is None:
+        t, p = bme if bmp is None else bmp
+        return t, p, None
+    agree = abs(bme[0] - bmp[0]) <= tempTol and abs(bme[1] - bmp[1]) <= presTol
+    if method == 'bme':
+        return bme[0], bme[1], agree
+    if method == 'bmp':
+        return bmp[0], bmp[1], agree
+    return (bme[0] + bmp[0]) / 2.0, (bme[1] + bmp[1]) / 2.0, agree
+
+
+"""
+def main():
+  sensor = bmp280Wrapper()
+  print "Chip ID     :", hex(sensor.chipID)
+  sensor.resetSensor()
+  sensor.setMode()
+  time.sleep(0.1)
+  while True:
+    sensor.readSensor()
+    print "Temperature : ", sensor.temperature, "C"
+    print "Pressure : ", sensor.pressure / 100.0, "hPa"
+    time.sleep(1)
+
+if __name__=="__main__":
+   main()
+"""
@@ -0,0 +1,481 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           busReplay.py
+#  Record every smbus / GPIO interaction on the real board, then replay
+#  it to the drivers and the control loop without hardware.
+#
+#  Recording
+#    busReplay.record('tape.gz') wraps smbus.SMBus and RPi.GPIO - buses
+#    and GPIO already imported by other modules (bme280.bus,
+#    MAX31790._default.bus, fullbucket_v3.GPIO ...) are swapped in place.
+#    Each call is one gzipped JSON line
+#        [seconds since start, 'i2c' | 'gpio' | 'edge', op, args, result]
+#
+#  Replay
+#    busReplay.replay('tape.gz') installs fake smbus / RPi.GPIO modules and
+#    a virtual clock (time.time, time.sleep, time.monotonic).  A read is
+#    answered with what the same call (op + args) returned at or before
+#    the current virtual time, so changed code that reads in a different
+#    order or more often still sees the recorded world.  sleep() moves the
+#    clock instead of waiting, fires recorded button edges on the way and
+#    ends the run (TapeEnd) at the end of the tape - a day of traffic
+#    replays in seconds.  Writes are collected and compared with the tape.
+#
+#  Usage:
+#    python busReplay.py tape.gz [speed]   replay fullbucket_v3 against a
+#                                          tape (speed = x real time,
+#                                          default as fast as possible)
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import atexit
+import bisect
+import collections
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BUS_READS  = ('read_byte', 'read_byte_data', 'read_word_data',
+              'read_i2c_block_data', 'read_block_data')
+BUS_WRITES = ('write_quick', 'write_byte', 'write_byte_data', 'write_word_data',
+              'write_i2c_block_data', 'write_block_data')
+
+_realTime = time.time
+_realSleep = time.sleep
+
+
+class TapeEnd(BaseException):
+    """Raised in the main thread when the virtual clock passes the tape end.
+
+    A BaseException so `except Exception` in the control loop lets it out.
+    """
+
+
+# ------------------------------------------------------------ tape file
+class Tape(object):
+
+    def __init__(self, path, quiet=()):
+        self.path = path
+        self.quiet = set(quiet)       # i2c addresses whose writes are not kept
+        self.t0 = _realTime()
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, 'wb')
+        self._file.write((json.dumps({'tape' : 1, 't0' : self.t0,
+                                      'quiet' : sorted(self.quiet)}) + '\n').encode())
+
+    def write(self, kind, op, args, result=None):
+        line = json.dumps([round(_realTime() - self.t0, 4), kind, op, list(args), result],
+                          separators=(',', ':'))
+        with self._lock:
+            if self._file is not None:
+                self._file.write((line + '\n').encode())
+                self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def readTape(path):
+    """Returns (header, [(t, kind, op, args, result)]) with t in unix time"""
+    with gzip.open(path, 'rb') as f:
+        header = json.loads(f.readline().decode())
+        records = []
+        for line in f:
+            t, kind, op, args, result = json.loads(line.decode())
+            records.append((header['t0'] + t, kind, op, args, result))
+    records.sort(key=lambda r: r[0])
+    return header, records
+
+
+def _key(kind, op, args):
+    return (kind, op) + tuple(tuple(a) if isinstance(a, list) else a for a in args)
+
+
+# ------------------------------------------------------------ recording
+class RecordingBus(object):
+    """Pass-through smbus.SMBus that writes every call to a Tape"""
+
+    def __init__(self, bus, tape):
+        self._bus = bus
+        self._tape = tape
+
+    def __getattr__(self, name):
+        attr = getattr(self._bus, name)
+        if name not in BUS_READS and name not in BUS_WRITES:
+            return attr
+        tape = self._tape
+        def call(*args):
+            try:
+                result = attr(*args)
+            except IOError as e:
+                tape.write('i2c', name, args, {'err' : str(e)})
+                raise
+            if result is not None or args[0] not in tape.quiet:
+                tape.write('i2c', name, args, result)
+            return result
+        return call
+
+
+class RecordingGPIO(object):
+    """Pass-through RPi.GPIO recording input, output, setup and edges"""
+
+    def __init__(self, gpio, tape):
+        self._gpio = gpio
+        self._tape = tape
+
+    def __getattr__(self, name):
+        return getattr(self._gpio, name)
+
+    def input(self, pin):
+        value = self._gpio.input(pin)
+        self._tape.write('gpio', 'input', [pin], value)
+        return value
+
+    def output(self, pin, value):
+        self._tape.write('gpio', 'output', [pin, int(value)])
+        return self._gpio.output(pin, value)
+
+    def setup(self, pin, direction, **kw):
+        self._tape.write('gpio', 'setup', [pin, direction])
+        return self._gpio.setup(pin, direction, **kw)
+
+    def _wrap(self, callback):
+        tape = self._tape
+        def edge(pin):
+            tape.write('edge', 'edge', [pin])
+            return callback(pin)
+        return edge
+
+    def add_event_detect(self, pin, edge, callback=None, **kw):
+        if callback is not None:
+            callback = self._wrap(callback)
+            return self._gpio.add_event_detect(pin, edge, callback=callback, **kw)
+        return self._gpio.add_event_detect(pin, edge, **kw)
+
+    def add_event_callback(self, pin, callback):
+        return self._gpio.add_event_callback(pin, self._wrap(callback))
+
+
+def _ourModules():
+    # Only growPi modules are patched - never the standard library, and
+    # not this one (it needs the real clock)
+    for module in list(sys.modules.values()):
+        path = getattr(module, '__file__', None)
+        if (path and os.path.dirname(os.path.abspath(path)) == HERE
+                and not os.path.basename(path).startswith('busReplay.')):
+            yield module
+
+
+def _swap(match, make):
+    """Replace module globals (and their .bus attribute) where match(value)"""
+    swapped = []
+    for module in _ourModules():
+        for name, value in list(vars(module).items()):
+            if match(value):
+                setattr(module, name, make(value))
+                swapped.append((module, name, value))
+            elif match(getattr(value, 'bus', None)) and not isinstance(value, type):
+                swapped.append((value, 'bus', value.bus))
+                setattr(value, 'bus', make(value.bus))
+    return swapped
+
+
+def record(path, quiet=()):
+    """Start recording all bus / GPIO traffic to `path`, returns the Tape.
+
+    Writes to the i2c addresses in `quiet` are not recorded (the LCD alone
+    is ~99% of the traffic and nothing reads it back).
+    """
+    tape = Tape(path, quiet)
+    atexit.register(tape.close)
+
+    import smbus
+    realSMBus = smbus.SMBus
+    buses = {}
+    def wrapBus(bus):
+        if id(bus) not in buses:
+            buses[id(bus)] = RecordingBus(bus, tape)
+        return buses[id(bus)]
+    _swap(lambda v: isinstance(v, realSMBus) if isinstance(realSMBus, type) else False, wrapBus)
+    smbus.SMBus = lambda *args, **kw: RecordingBus(realSMBus(*args, **kw), tape)
+
+    try:
+        import RPi
+        import RPi.GPIO as realGPIO
+    except ImportError:
+        return tape
+    gpio = RecordingGPIO(realGPIO, tape)
+    _swap(lambda v: v is realGPIO, lambda v: gpio)
+    RPi.GPIO = gpio
+    sys.modules['RPi.GPIO'] = gpio
+    return tape
+
+
+# ------------------------------------------------------------ replay
+class VirtualClock(object):
+    """time.time / time.sleep stand-in for replays.
+
+    sleep(s) moves the clock forward by s (firing due edges on the way).
+    With `speed` it also really waits s / speed seconds.  Sleeps from
+    several threads are not interleaved exactly - each one moves the
+    shared clock to at least its own deadline.
+    """
+
+    def __init__(self, start, end=None, speed=None):
+        self.now = start
+        self.start = start
+        self.end = end
+        self.speed = speed
+        self.onAdvance = []           # fn(old, new) called before the move
+        self._lock = threading.RLock()
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now - self.start
+
+    def sleep(self, seconds):
+        if self.end is not None and self.now >= self.end:
+            if threading.current_thread().name == 'MainThread':
+                raise TapeEnd()
+            _realSleep(min(seconds, 1.0))       # background thread - park it
+            return
+        if self.speed:
+            _realSleep(seconds / float(self.speed))
+        with self._lock:
+            target = self.now + max(0.0, seconds)
+            for fn in self.onAdvance:
+                fn(self.now, target)
+            if target > self.now:
+                self.now = target
+
+
+class ReplayBus(object):
+    """smbus.SMBus stand-in answering from a Player"""
+
+    def __init__(self, player, busId=1):
+        self._player = player
+        self.busId = busId
+
+    def __getattr__(self, name):
+        player = self._player
+        if name in BUS_READS:
+            return lambda *args: player.answer('i2c', name, args)
+        if name in BUS_WRITES:
+            return lambda *args: player.written('i2c', name, args)
+        raise AttributeError(name)
+
+    def close(self):
+        pass
+
+
+class ReplayGPIO(types.ModuleType):
+    """RPi.GPIO stand-in: inputs from the tape, outputs collected"""
+
+    BOARD, BCM = 10, 11
+    OUT, IN = 0, 1
+    LOW, HIGH = 0, 1
+    PUD_OFF, PUD_DOWN, PUD_UP = 20, 21, 22
+    RISING, FALLING, BOTH = 31, 32, 33
+
+    def __init__(self, player):
+        types.ModuleType.__init__(self, 'RPi.GPIO')
+        self._player = player
+        self._callbacks = collections.defaultdict(list)
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def cleanup(self, *args):
+        pass
+
+    def setup(self, pin, direction, **kw):
+        self._player.written('gpio', 'setup', [pin, direction])
+
+    def input(self, pin):
+        return self._player.answer('gpio', 'input', [pin])
+
+    def output(self, pin, value):
+        self._player.written('gpio', 'output', [pin, int(value)])
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        if callback is not None:
+            self._callbacks[pin].append(callback)
+
+    def add_event_callback(self, pin, callback):
+        self._callbacks[pin].append(callback)
+
+    def remove_event_detect(self, pin):
+        self._callbacks.pop(pin, None)
+
+
+class Player(object):
+
+    def __init__(self, path, speed=None):
+        self.header, records = readTape(path)
+        self.quiet = set(self.header.get('quiet', ()))
+        self._answers = {}                       # key -> ([t], [result])
+        self.edges = []                          # (t, pin)
+        self.recordedWrites = collections.defaultdict(list)
+        self.writes = collections.defaultdict(list)
+        self.served = 0
+        self.misses = collections.Counter()
+        for t, kind, op, args, result in records:
+            if kind == 'edge':
+                self.edges.append((t, args[0]))
+            elif op in BUS_WRITES or op in ('output', 'setup'):
+                self.recordedWrites[_key(kind, op, args[:-1])].append(args[-1])
+            else:
+                times, results = self._answers.setdefault(_key(kind, op, args), ([], []))
+                times.append(t)
+                results.append(result)
+        start = records[0][0] if records else self.header['t0']
+        end = records[-1][0] if records else start
+        self.clock = VirtualClock(start, end, speed)
+        self.clock.onAdvance.append(self._fireEdges)
+        self.gpio = ReplayGPIO(self)
+        self._nextEdge = 0
+
+    def answer(self, kind, op, args):
+        found = self._answers.get(_key(kind, op, args))
+        if found is None:
+            self.misses[_key(kind, op, args)] += 1
+            raise IOError(121, 'not on tape: {} {}'.format(op, list(args)))
+        times, results = found
+        i = max(0, bisect.bisect_right(times, self.clock.now) - 1)
+        self.served += 1
+        result = results[i]
+        if isinstance(result, dict):
+            raise IOError(121, result['err'])
+        return result
+
+    def written(self, kind, op, args):
+        args = list(args)
+        if kind == 'i2c' and args[0] in self.quiet:
+            return
+        self.writes[_key(kind, op, args[:-1])].append(args[-1])
+
+    def _fireEdges(self, old, new):
+        while self._nextEdge < len(self.edges) and self.edges[self._nextEdge][0] <= new:
+            t, pin = self.edges[self._nextEdge]
+            self._nextEdge += 1
+            self.clock.now = max(self.clock.now, t)
+            for callback in list(self.gpio._callbacks.get(pin, ())):
+                callback(pin)
+
+    def diffWrites(self):
+        """[(key, recorded, replayed)] for every register / pin whose
+        sequence of written values differs from the tape"""
+        diffs = []
+        for key in sorted(set(self.recordedWrites) | set(self.writes), key=repr):
+            if _collapse(self.recordedWrites.get(key, [])) != _collapse(self.writes.get(key, [])):
+                diffs.append((key, self.recordedWrites.get(key, []), self.writes.get(key, [])))
+        return diffs
+
+
+def _collapse(values):
+    # Repeated writes of the same value do not change the hardware
+    out = []
+    for v in values:
+        if not out or out[-1] != v:
+            out.append(v)
+    return out
+
+
+def replay(path, speed=None):
+    """Install fake smbus / RPi.GPIO and the virtual clock, returns the Player.
+
+    Import the modules under test after this so they pick up the fakes;
+    ones already imported are swapped in place.
+    """
+    player = Player(path, speed)
+    clock = player.clock
+
+    smbus = types.ModuleType('smbus')
+    smbus.SMBus = lambda busId=1: ReplayBus(player, busId)
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = player.gpio
+    sys.modules['smbus'] = smbus
+    sys.modules['RPi'] = rpi
+    sys.modules['RPi.GPIO'] = player.gpio
+
+    bus = ReplayBus(player)
+    _swap(lambda v: type(v).__name__ == 'SMBus' or isinstance(v, RecordingBus), lambda v: bus)
+    _swap(lambda v: getattr(v, '__name__', None) == 'RPi.GPIO', lambda v: player.gpio)
+
+    realMonotonic = getattr(time, 'monotonic', None)
+    _swap(lambda v: v is _realTime or (realMonotonic is not None and v is realMonotonic),
+          lambda v: clock.time if v is _realTime else clock.monotonic)
+    time.time = clock.time
+    time.sleep = clock.sleep
+    if realMonotonic is not None:
+        time.monotonic = clock.monotonic
+    return player
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('python busReplay.py tape.gz [speed]')
+        return
+    import tempfile
+    player = replay(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else None)
+
+    import fullbucket_v3
+    scratch = tempfile.mkdtemp()
+    fullbucket_v3.LOG_PATH = os.path.join(scratch, 'growPi.log')
+    fullbucket_v3.HISTORY_PATH = os.path.join(scratch, 'history.db')
+    fullbucket_v3.SNAPSHOT_PATH = os.path.join(scratch, 'growPi.snap')
+    fullbucket_v3.IRRIGATION_STATE = os.path.join(scratch, 'irrigation.json')
+    fullbucket_v3.ZONES_PATH = os.path.join(scratch, 'zones.json')
+    fullbucket_v3.DASHBOARD_PORT = None
+    fullbucket_v3.CONTROL_CORE = False          # one process, all of it on the tape
+    def sendData(url, key, s):
+        fullbucket_v3.LOG.record('upload', s.tempC, fullbucket_v3.derived.toF(s.tempC), s.pressure,
+                                 s.humidity, s.vpd, 'replay')
+    fullbucket_v3.sendData = sendData           # never post replayed data
+
+    wall = _realTime()
+    try:
+        fullbucket_v3.main()
+    except TapeEnd:
+        pass
+    wall = _realTime() - wall
+    fullbucket_v3.LOG.close()
+
+    span = player.clock.now - player.clock.start
+    print('replayed {:.0f} s of traffic in {:.2f} s ({:.0f}x real time)'.format(
+        span, wall, span / wall if wall else 0.0))
+    print('  {:d} reads served | {:d} not on tape'.format(player.served, sum(player.misses.values())))
+    for key, n in player.misses.most_common(5):
+        print('    missing {} x{:d}'.format(key, n))
+    diffs = player.diffWrites()
+    print('  {:d} registers / pins written differently from the tape'.format(len(diffs)))
+    for key, recorded, replayed in diffs[:10]:
+        print('    {} tape {} -> replay {}'.format(key, _collapse(recorded)[-5:], _collapse(replayed)[-5:]))
+    print('  log: ' + fullbucket_v3.LOG_PATH)
+
+if __name__=="__main__":
+   main()
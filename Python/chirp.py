@@ -151,6 +151,18 @@ class Chirp(object):
         """
         self.bus.write_byte(self.address, self._SLEEP)
 
+    def send_wake(self):
+        """Send the wake up command without waiting for the sensor
+
+        The sensor is usable about one second later. Lets a caller that
+        knows when it will read next wake the sensor ahead of time instead
+        of blocking in wake_up().
+        """
+        try:
+            self.bus.read_byte_data(self.address, self._GET_VERSION)
+        except (IOError, OSError):
+            pass
+
     def wake_up(self, wake_time=1):
         """Wakes up the sensor from deep sleep mode
 
@@ -165,9 +177,7 @@ class Chirp(object):
         self.wake_time = wake_time
 
         try:
-            self.bus.read_byte_data(self.address, self._GET_VERSION)
-        except OSError:
-            pass
+            self.send_wake()
         finally:
             time.sleep(self.wake_time)
 
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           coldStart.py
+#  Fast startup after a crash or reboot.
+#
+#  1. probe the i2c bus once to see which devices answer
+#  2. caller puts the fans at a safe duty straight away (first control action)
+#  3. the slow device setup (LCD, MAX31790 reset, BMP280) runs in
+#     background threads so nothing waits on the LCD's bit-banged init
+#  4. a device missing at the probe, or whose init raised, can be brought
+#     up later with retry() from the main loop
+#
+#  The kernel i2c driver serialises transactions, so devices at different
+#  addresses can be initialised from separate threads.
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import threading
+import time
+import smbus
+
+try:
+    _now = time.monotonic
+except AttributeError:       # Python 2
+    _now = time.time
+
+
+class ColdStart(object):
+    """Bus probe + lazy, concurrent device initialisation.
+
+    Attributes:
+        present (set): names of the devices that answered the probe
+        timings (dict): name -> seconds taken by its init function
+        errors (dict): name -> exception raised by its init function
+    """
+
+    def __init__(self, busId=1):
+        self.t0 = _now()
+        self.bus = smbus.SMBus(busId)
+        self.probed = set()
+        self.present = set()
+        self.timings = {}
+        self.errors = {}
+        self.results = {}
+        self.firstControlAt = None
+        self._threads = {}
+
+    def probe(self, devices):
+        """Probe each {name: address} once, returns the set of names found"""
+        for name, addr in devices.items():
+            self.probed.add(name)
+            try:
+                self.bus.read_byte(addr)
+                self.present.add(name)
+            except IOError:
+                pass
+        return self.present
+
+    def firstControl(self):
+        # Call right after the first fan command has been written
+        if self.firstControlAt is None:
+            self.firstControlAt = _now() - self.t0
+        return self.firstControlAt
+
+    def launch(self, name, initFn, *args):
+        """Run initFn(*args) in the background if `name` was found"""
+        if name not in self.present:
+            return False
+        thread = threading.Thread(target=self._run, args=(name, initFn, args))
+        thread.daemon = True
+        self._threads[name] = thread
+        thread.start()
+        return True
+
+    def _run(self, name, initFn, args):
+        start = _now()
+        try:
+            self.results[name] = initFn(*args)
+        except Exception as e:
+            self.errors[name] = e
+        self.timings[name] = _now() - start
+
+    def retry(self, name, initFn, *args):
+        """Run initFn(*args) again in the caller's thread, for a device that
+        was missing at the probe or whose init failed.  Raises what initFn
+        raises, so it can go through the device's circuit breaker."""
+        start = _now()
+        self.results[name] = initFn(*args)
+        self.errors.pop(name, None)
+        self.present.add(name)
+        self.timings[name] = _now() - start
+        return True
+
+    def ready(self, name):
+        # True once name's init finished without error
+        thread = self._threads.get(name)
+        return (name in self.timings and name not in self.errors
+                and (thread is None or not thread.is_alive()))
+
+    def failed(self, name):
+        # True when name is not coming up by itself: missing or init raised
+        thread = self._threads.get(name)
+        return not self.ready(name) and (thread is None or not thread.is_alive())
+
+    def result(self, name):
+        # Return value of name's init function, None if not ready
+        if self.ready(name):
+            return self.results.get(name)
+        return None
+
+    def done(self):
+        # True when no launched init is still running
+        for thread in self._threads.values():
+            if thread.is_alive():
+                return False
+        return True
+
+    def wait(self, timeout=None):
+        # Block until every launched init has finished (or timeout)
+        end = None if timeout is None else _now() + timeout
+        for thread in self._threads.values():
+            thread.join(None if end is None else max(0, end - _now()))
+
+    def report(self):
+        log = "Startup | first control {} | ".format(
+            "none" if self.firstControlAt is None
+            else "{:.3f}s".format(self.firstControlAt))
+        for name in sorted(set(self._threads) | set(self.timings)):
+            if name in self.errors:
+                log += "{} FAIL ({}) | ".format(name, self.errors[name])
+            elif name in self.timings:
+                log += "{} {:.3f}s | ".format(name, self.timings[name])
+            else:
+                log += "{} pending | ".format(name)
+        missing = sorted(self.probed - self.present)
+        if missing:
+            log += "missing: " + ",".join(missing)
+        return log
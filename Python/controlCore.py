@@ -0,0 +1,382 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           controlCore.py
+#  The fan safety loop - read the BME280, pick the duty, command the
+#  MAX31790 - in a small process of its own.
+#
+#  In one process the control loop shares the GIL with uploads, LCD
+#  bit-banging and logging, so a busy neighbour delays cooling.  With
+#  CONTROL_CORE = True fullbucket_v3 starts this file as its own process
+#  once the cold start has set up the fans:
+#    - it imports only the sensor / fan drivers, filters, deviceHealth,
+#      fanCurve, autoTune and snapshot (no urllib, LCD, sqlite or HTTP
+#      server)
+#    - it asks for SCHED_FIFO, or nice -10, when allowed (root)
+#    - each cycle it publishes its readings and fan state with
+#      snapshot.py; the seqlock means readers can never block the core
+#    - it keeps its own latency figures: `latency` is sensor read start
+#      to fan command done, `lateness` is how late the cycle started
+#  The parent reads the snapshot for the LCD, logs and uploads, and
+#  restarts the core if it exits or stops publishing; the core exits when
+#  the parent does.
+#
+#  python controlCore.py '<json settings>'   run the core (see CoreProcess)
+#  python controlCore.py bench               worst case latency with busy
+#                                            neighbours, same process vs
+#                                            separate process
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import itertools
+import json
+import os
+import sys
+import time
+
+import autoTune
+import derived
+import deviceHealth
+import fanCurve
+import filters
+import snapshot
+
+try:
+    _now = time.monotonic
+except AttributeError:       # Python 2
+    _now = time.time
+
+CORE_PATH = '/dev/shm/growPi.core'
+FIELDS = ['tempC', 'humidity', 'pressure', 'tempF', 'rpm', 'duty', 'pwm', 'safe',
+          'latency', 'maxLatency', 'lateness', 'maxLateness', 'cycles']
+
+# Control input filters, shared with fullbucket_v3's SENSOR_FILTERS
+TEMP_FILTER     = lambda: filters.Chain(filters.Median(3), filters.Ewma(0.3), filters.Deadband(0.5))
+HUMIDITY_FILTER = lambda: filters.Chain(filters.Median(3), filters.Ewma(0.3))
+
+# "PWM =" shown on the LCD for each ladder duty (the fans run inverted)
+LADDER_PWM = {30 : 80, 40 : 60, 50 : 50, 60 : 40, 70 : 30}
+
+
+def elevate(fifo=10, nice=-10):
+    """Raise this process' scheduling priority as far as allowed"""
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(fifo))
+        return 'SCHED_FIFO {:d}'.format(fifo)
+    except (AttributeError, OSError):
+        pass
+    try:
+        os.nice(nice)
+        return 'nice {:d}'.format(nice)
+    except OSError:
+        return 'normal priority'
+
+
+def pwmShown(duty):
+    return LADDER_PWM.get(duty, 100 - duty)
+
+
+class Control(object):
+    """Fan duties from fanCurve curves (the ladder without a curves file);
+    a tuning file's PI replaces the curve of `channel`.  The curves file
+    is reloaded when it changes."""
+
+    def __init__(self, tuningPath=None, curvesPath=None, channel=1, log=None):
+        self.channel = channel
+        self.curvesPath = curvesPath
+        self.log = log
+        self.tuned = None
+        if tuningPath and os.path.exists(tuningPath):
+            try:
+                self.tuned = autoTune.load(tuningPath)
+            except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+                if self.log is not None:
+                    self.log('tuning {} not loaded, using the fan curves: {}'.format(tuningPath, e))
+        self.curves = fanCurve.fromConfig(fanCurve.DEFAULT)
+        self.mtime = None
+        self._reload()
+
+    def _reload(self):
+        if not self.curvesPath:
+            return
+        try:
+            mtime = os.stat(self.curvesPath).st_mtime
+        except OSError:
+            return
+        if mtime == self.mtime:
+            return
+        self.mtime = mtime
+        try:
+            self.curves = fanCurve.load(self.curvesPath)
+        except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+            if self.log is not None:
+                self.log('fan curves {} not loaded, keeping the old ones: {}'.format(self.curvesPath, e))
+            return
+        if self.log is not None:
+            self.log('fan curves from {} : channels {}, inputs {}'.format(
+                self.curvesPath, sorted(self.curves.channels), ', '.join(self.curves.inputs())))
+
+    def __call__(self, values):
+        """{'tempF' : .., 'humidity' : .., 'vpd' : ..} -> {channel: duty %}"""
+        self._reload()
+        duties = self.curves.duties(values)
+        if self.tuned is not None and fanCurve.finite(values.get('tempF')):
+            duties[self.channel] = self.tuned.update(values['tempF'])
+        return duties
+
+
+class ControlCore(object):
+
+    def __init__(self, readSensor, setDuty, readRPM, control, period=10.0, safeDuty=30,
+                 rampSeconds=8, path=CORE_PATH, poll=None, channel=1):
+        """
+        readSensor - () -> (tempC, pressure hPa, humidity %)
+        setDuty    - ({channel: duty %}, ramp seconds) commands the fans
+        readRPM    - () -> rpm of `channel`
+        control    - {'tempF', 'humidity', 'vpd'} -> {channel: duty %}
+        poll       - called once per cycle after the fan command (ramps)
+        channel    - the channel published as duty / rpm
+        """
+        self.readSensor = readSensor
+        self.setDuty = setDuty
+        self.readRPM = readRPM
+        self.control = control
+        self.period = period
+        self.safeDuty = safeDuty
+        self.rampSeconds = rampSeconds
+        self.poll = poll
+        self.channel = channel
+        self.health = deviceHealth.DeviceHealth()
+        self.health.add('bme', maxFailures=3, staleAfter=60)
+        self.health.add('max', maxFailures=3)
+        self.filters = filters.FilterBank({'tempF' : TEMP_FILTER, 'humidity' : HUMIDITY_FILTER})
+        self.snap = snapshot.Snapshot(FIELDS, path)
+        self.written = {}             # channel -> last duty sent
+        self.cycles = 0
+        self.maxLatency = 0.0
+        self.maxLateness = 0.0
+
+    def cycle(self, lateness=0.0):
+        start = _now()
+        reading = self.health.call('bme', self.readSensor)
+        if reading is None:
+            # No fresh BME280 data - every fan to the safe duty, no ramp
+            tempC = pressure = humidity = tempF = None
+            duties = dict.fromkeys(set(self.written) | set([self.channel]), self.safeDuty)
+            seconds = 0
+        else:
+            tempC, pressure, humidity = reading
+            tempF = self.filters.update('tempF', derived.toF(tempC))
+            rh = self.filters.update('humidity', humidity)     # raw humidity is published
+            duties = self.control({'tempF' : tempF, 'humidity' : rh, 'vpd' : derived.vpd(tempC, rh)})
+            seconds = self.rampSeconds
+        # Only touch the registers of channels whose duty changed
+        changed = dict((ch, d) for ch, d in duties.items() if self.written.get(ch) != d)
+        if changed:
+            self.health.call('max', self.setDuty, changed, seconds)
+            if self.health.breakers['max'].failures == 0:
+                self.written.update(changed)
+        latency = _now() - start
+        duty = duties.get(self.channel, self.safeDuty)
+
+        rpm = self.health.call('max', self.readRPM, default=0, key='rpm')     # 0, never NaN
+        if self.poll is not None:
+            self.health.call('max', self.poll)
+        self.cycles += 1
+        self.maxLatency = max(self.maxLatency, latency)
+        self.maxLateness = max(self.maxLateness, lateness)
+        self.snap.publish({'tempC' : tempC, 'humidity' : humidity, 'pressure' : pressure,
+                           'tempF' : tempF, 'rpm' : rpm, 'duty' : duty, 'pwm' : pwmShown(duty),
+                           'safe' : int(reading is None), 'latency' : latency,
+                           'maxLatency' : self.maxLatency, 'lateness' : lateness,
+                           'maxLateness' : self.maxLateness, 'cycles' : self.cycles})
+        return latency
+
+    def run(self, cycles=None, alive=None):
+        """Cycle every period until `cycles` are done or alive() is False"""
+        deadline = _now()
+        n = 0
+        while (cycles is None or n < cycles) and (alive is None or alive()):
+            self.cycle(max(0.0, _now() - deadline))
+            n += 1
+            deadline += self.period
+            delay = deadline - _now()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = _now()         # overran - do not try to catch up
+
+
+def profileSettings(profiles):
+    """{channel: MAX31790.FanProfile} as settings for fromSettings"""
+    return dict((str(ch), {'pulsePerRev' : p.pulsePerRev, 'tachPeriods' : p.tachPeriods,
+                           'spinUp' : p.spinUp, 'pwmFreq' : p.pwmFreq,
+                           'minRPM' : p.minRPM, 'maxRPM' : p.maxRPM})
+                for ch, p in profiles.items())
+
+
+def fromSettings(settings):
+    """ControlCore on the real hardware from CoreProcess' settings"""
+    import bme280
+    import fanRamp
+    import MAX31790
+    channel = settings.get('channel', 1)
+    for ch, kw in settings.get('profiles', {}).items():
+        MAX31790._default.profiles[int(ch)] = MAX31790.FanProfile(**kw)    # already applied
+    ramp = fanRamp.RampEngine(MAX31790._default, slowDown=True)
+    addr = settings.get('bme', 0x76)
+
+    def setDuty(duties, seconds):
+        ramp.start(duties, seconds)
+
+    def poll():
+        if ramp.busy():
+            ramp.poll()
+
+    return ControlCore(lambda: bme280.readBME280All(addr), setDuty,
+                       lambda: MAX31790.readRPM(channel),
+                       Control(settings.get('tuning'), settings.get('curves'), channel, log=print),
+                       period=settings.get('period', 10.0), safeDuty=settings.get('safeDuty', 30),
+                       rampSeconds=settings.get('rampSeconds', 8),
+                       path=settings.get('path', CORE_PATH), poll=poll, channel=channel)
+
+
+class CoreProcess(object):
+    """The parent's handle on the core: start, read, restart"""
+
+    def __init__(self, settings, log=None, staleAfter=None):
+        self.settings = dict(settings)
+        self.path = self.settings.setdefault('path', CORE_PATH)
+        self.log = log
+        self.staleAfter = staleAfter or 3 * self.settings.get('period', 10.0) + 5
+        self.proc = None
+        self.reader = None
+        self.restarts = 0
+
+    def _say(self, message):
+        if self.log is not None:
+            self.log('control core: ' + message)
+
+    def start(self):
+        import subprocess
+        script = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+        self.proc = subprocess.Popen([sys.executable, script, json.dumps(self.settings)])
+        self.started = _now()
+        self._say('started, pid {:d}'.format(self.proc.pid))
+        return self
+
+    def _restart(self, why):
+        self._say(why + ' - restarting')
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        self.restarts += 1
+        self.start()
+
+    def latest(self):
+        """{field: value} from the core, None while it is not publishing"""
+        if self.proc.poll() is not None:
+            self._restart('exited with {}'.format(self.proc.returncode))
+            return None
+        try:
+            if self.reader is None:
+                self.reader = snapshot.Reader(self.path)
+            values = self.reader.read()
+        except (IOError, OSError, ValueError, snapshot.Busy):
+            values = None
+        if values is None or time.time() - values['time'] > self.staleAfter:
+            if _now() - self.started > self.staleAfter:
+                self._restart('no update for {:.0f} s'.format(self.staleAfter))
+            return None
+        return values
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            self.proc.wait()
+
+
+# ------------------------------------------------------------ bench
+def _busy(stop):
+    # A neighbour that never blocks: LCD bit-banging, JSON encoding ...
+    x = 0
+    while not stop:
+        for i in range(1000):
+            x += i * i
+
+
+def _simCore(path, period, cycles):
+    # I2C transactions block in the kernel, releasing the GIL - getting it
+    # back is where a busy neighbour costs the core
+    def readSensor():
+        time.sleep(0.001)
+        return (25.0, 1003.0, 55.0)
+
+    def setDuty(duties, seconds):
+        time.sleep(0.0005)
+
+    def readRPM():
+        time.sleep(0.0005)
+        return 1200
+
+    step = itertools.count()
+    control = lambda values: {1 : (next(step) % 5) * 10 + 30}       # new duty each cycle
+    return ControlCore(readSensor, setDuty, readRPM, control, period, path=path)
+
+
+def _runCore(path, period, cycles):
+    elevate()
+    _simCore(path, period, cycles).run(cycles)
+
+
+def bench(period=0.02, cycles=250, neighbours=2):
+    import multiprocessing
+    import tempfile
+    import threading
+    folder = tempfile.mkdtemp()
+    results = []
+    for label, separate in (('same process, busy threads ', False),
+                            ('core process, busy parent  ', True)):
+        path = os.path.join(folder, 'core.snap')
+        stop = []
+        threads = [threading.Thread(target=_busy, args=(stop,)) for i in range(neighbours)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        if separate:
+            proc = multiprocessing.Process(target=_runCore, args=(path, period, cycles))
+            proc.start()
+            proc.join()
+        else:
+            _simCore(path, period, cycles).run(cycles)
+        stop.append(True)
+        for t in threads:
+            t.join()
+        values = snapshot.Reader(path).read()
+        results.append(values)
+        print('{}: latency max {:6.1f} ms | start lateness max {:6.1f} ms ({:d} cycles)'.format(
+            label, values['maxLatency'] * 1000, values['maxLateness'] * 1000, int(values['cycles'])))
+    print('nominal work per cycle 2.0 ms; core priority: {}'.format(
+        'SCHED_FIFO / nice when root' if hasattr(os, 'sched_setscheduler') else 'nice when root'))
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        bench()
+        return
+    settings = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+    core = fromSettings(settings)
+    print('control core: ' + elevate())
+    parent = os.getppid()
+    core.run(alive=lambda: os.getppid() == parent)      # no orphan left fighting a new daemon
+
+if __name__=="__main__":
+   main()
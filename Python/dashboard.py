@@ -0,0 +1,290 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           dashboard.py
+#  Live web dashboard on the Pi:  http://growpi.local:8080/
+#
+#  The control loop add()s each sample to a fixed size ring; the sample is
+#  JSON encoded once, there and then.  Browsers get
+#    /history   every sample in the ring in one response (gzipped when the
+#               browser allows) - {"fields": [...], "seq": n, "rows": [[t, ...], ...]}
+#    /events    server-sent events, one `data:` line per new sample.
+#               /events?since=n starts at sample n - the page passes the
+#               "seq" of its /history, so nothing added between the two
+#               requests is missed.  A reconnecting browser sends
+#               Last-Event-ID and resumes from there.  Either only as far
+#               back as the ring still holds; an id past the ring's end
+#               (one from before a restart) starts at the oldest sample.
+#  Every viewer is sent the same pre-encoded bytes, so viewers add no
+#  sensor reads or encoding work, and a viewer only holds its position
+#  in the ring - a slow one falls behind and skips ahead, nothing queues
+#  up for it.  At most `maxClients` streams are served.
+#
+#  python dashboard.py   serves a simulated tent for testing the page
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import gzip
+import io
+import json
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs
+except ImportError:          # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs
+
+FIELDS = ('tempF', 'humidity', 'vpd', 'pressure', 'rpm', 'duty')
+KEEPALIVE = 15.0         # s between SSE comments on a quiet stream
+
+
+class Ring(object):
+    """Last `size` samples, each stored as its encoded JSON row.
+
+    add() only stores the row and sets one event; fanout() (the
+    dashboard's own thread) wakes the viewers, so the cost of add() does
+    not grow with the number of viewers.
+    """
+
+    def __init__(self, size=4320, fields=FIELDS):
+        self.size = size
+        self.fields = tuple(fields)
+        self.seq = 0                       # seq of the next sample
+        self._rows = [None] * size
+        self._lock = threading.Lock()
+        self._new = threading.Event()
+        self._cond = threading.Condition()
+
+    def add(self, values, ts=None):
+        if ts is None:
+            ts = time.time()
+        row = [round(ts, 1)]
+        for f in self.fields:
+            v = values.get(f)
+            row.append(round(v, 2) if isinstance(v, float) else v)
+        data = json.dumps(row, separators=(',', ':'))
+        with self._lock:
+            self._rows[self.seq % self.size] = data
+            self.seq += 1
+        self._new.set()
+
+    def fanout(self, stopping):
+        while not stopping():
+            if self._new.wait(1.0):
+                self._new.clear()
+                with self._cond:
+                    self._cond.notify_all()
+
+    def since(self, seq):
+        """(first seq, [rows]) from seq on - clipped to what is still held"""
+        with self._lock:
+            end = self.seq
+            start = max(seq, end - self.size, 0)
+            return start, [self._rows[i % self.size] for i in range(start, end)]
+
+    def wait(self, seq, timeout):
+        # Block until there is a sample with seq >= `seq`
+        with self._cond:
+            if self.seq <= seq:
+                self._cond.wait(timeout)
+            return self.seq
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path == '/':
+            self._send(200, 'text/html', PAGE.encode())
+        elif path == '/history':
+            ring = self.server.ring
+            start, rows = ring.since(0)
+            body = ('{"fields":' + json.dumps(('t',) + ring.fields) + ',"seq":' + str(start + len(rows))
+                    + ',"rows":[' + ','.join(rows) + ']}').encode()
+            self._send(200, 'application/json', body)
+        elif path == '/events':
+            self._events(parse_qs(query).get('since', [None])[0])
+        else:
+            self._send(404, 'text/plain', b'not found')
+
+    def _send(self, code, kind, body):
+        gzipped = len(body) > 1024 and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6) as f:
+                f.write(body)
+            body = buf.getvalue()
+        self.send_response(code)
+        self.send_header('Content-Type', kind)
+        self.send_header('Content-Length', str(len(body)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _events(self, since=None):
+        server = self.server
+        with server.lock:
+            if server.clients >= server.maxClients:
+                self._send(503, 'text/plain', b'too many viewers')
+                return
+            server.clients += 1
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.connection.settimeout(server.sendTimeout)   # drop stuck viewers
+            ring = server.ring
+            try:
+                seq = int(self.headers.get('Last-Event-ID')) + 1
+            except (TypeError, ValueError):
+                try:
+                    seq = int(since)
+                except (TypeError, ValueError):
+                    seq = ring.seq
+            if seq > ring.seq:
+                seq = ring.since(0)[0]    # an id from before a restart - send all we hold
+            while not server.stopping:
+                if ring.wait(seq, KEEPALIVE) <= seq:
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                start, rows = ring.since(seq)
+                out = []
+                for i, row in enumerate(rows):
+                    out.append('id: {:d}\ndata: {}\n\n'.format(start + i, row))
+                self.wfile.write(''.join(out).encode())
+                self.wfile.flush()
+                seq = start + len(rows)
+        except (IOError, OSError):
+            pass                          # viewer went away
+        finally:
+            with server.lock:
+                server.clients -= 1
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        pass                              # viewers closing tabs mid-write
+
+
+class Dashboard(object):
+
+    def __init__(self, port=8080, host='', size=4320, fields=FIELDS,
+                 maxClients=16, sendTimeout=30.0):
+        self.ring = Ring(size, fields)
+        self.server = _Server((host, port), _Handler)
+        self.server.ring = self.ring
+        self.server.lock = threading.Lock()
+        self.server.clients = 0
+        self.server.maxClients = maxClients
+        self.server.sendTimeout = sendTimeout
+        self.server.stopping = False
+        self.port = self.server.server_address[1]
+
+    def add(self, values, ts=None):
+        self.ring.add(values, ts)
+
+    def viewers(self):
+        return self.server.clients
+
+    def start(self):
+        for name, target in (('dashboard', self.server.serve_forever),
+                             ('dashboard-fanout', lambda: self.ring.fanout(lambda: self.server.stopping))):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self):
+        self.server.stopping = True
+        self.server.shutdown()
+
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width">
+<title>growPi</title>
+<style>
+body{font-family:sans-serif;margin:1em;background:#111;color:#ddd}
+#now span{display:inline-block;min-width:9em;font-size:1.3em}
+canvas{width:100%;height:200px;background:#1b1b1b;margin-top:.5em}
+</style></head><body>
+<div id="now"></div>
+<canvas id="tempF"></canvas><canvas id="humidity"></canvas><canvas id="rpm"></canvas>
+<script>
+var fields = [], rows = [], idx = {}, MAX = 4320;
+var units = {tempF:' F', humidity:' %', vpd:' kPa', pressure:' hPa', rpm:' rpm', duty:' %'};
+function draw(name) {
+  var c = document.getElementById(name), g = c.getContext('2d'), k = idx[name];
+  c.width = c.clientWidth; c.height = c.clientHeight;
+  var pts = rows.filter(function (r) { return r[k] !== null; });
+  if (pts.length < 2) return;
+  var lo = Infinity, hi = -Infinity;
+  pts.forEach(function (r) { lo = Math.min(lo, r[k]); hi = Math.max(hi, r[k]); });
+  if (hi - lo < 1e-6) { hi += 1; lo -= 1; }
+  var t0 = pts[0][0], span = pts[pts.length - 1][0] - t0 || 1;
+  g.strokeStyle = '#6c6'; g.beginPath();
+  pts.forEach(function (r, i) {
+    var x = (r[0] - t0) / span * c.width, y = c.height - (r[k] - lo) / (hi - lo) * (c.height - 20) - 10;
+    if (i) g.lineTo(x, y); else g.moveTo(x, y);
+  });
+  g.stroke(); g.fillStyle = '#aaa';
+  g.fillText(name + '  ' + lo.toFixed(1) + ' - ' + hi.toFixed(1), 5, 12);
+}
+function show() {
+  var last = rows[rows.length - 1], html = '';
+  if (last) fields.forEach(function (f, i) {
+    if (i && last[i] !== null) html += '<span>' + f + ' ' + last[i] + (units[f] || '') + '</span>';
+  });
+  document.getElementById('now').innerHTML = html;
+  ['tempF', 'humidity', 'rpm'].forEach(draw);
+}
+fetch('history').then(function (r) { return r.json(); }).then(function (h) {
+  fields = h.fields; rows = h.rows;
+  fields.forEach(function (f, i) { idx[f] = i; });
+  show();
+  var es = new EventSource('events?since=' + h.seq);
+  es.onmessage = function (e) {
+    rows.push(JSON.parse(e.data));
+    if (rows.length > MAX) rows.splice(0, rows.length - MAX);
+    show();
+  };
+});
+</script></body></html>
+"""
+
+
+if __name__ == "__main__":
+    import math
+    import random
+    dash = Dashboard().start()
+    print("http://localhost:{:d}/".format(dash.port))
+    t = time.time() - 3600
+    while True:
+        dash.add({'tempF' : 77 + 2 * math.sin(t / 900.0) + random.gauss(0, 0.1),
+                  'humidity' : 55 + random.gauss(0, 0.5), 'vpd' : 1.2, 'pressure' : 1003.0,
+                  'rpm' : 1200 + random.randint(-20, 20), 'duty' : 50}, t)
+        t += 10
+        if t > time.time():
+            time.sleep(2)           # history filled, now live
+            t = time.time()
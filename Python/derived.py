@@ -0,0 +1,126 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           derived.py
+#  Metrics derived from temperature + relative humidity.
+#
+#  derive(tempC, rh) works out everything once per sample so the LCD, fan
+#  control and upload all use the same numbers:
+#    temperatureF      F
+#    vpd               vapour pressure deficit, kPa (leaf or air)
+#    dewPoint          C (Magnus, Sonntag constants)
+#    absHumidity       g/m3
+#    heatIndex         F (NWS Rothfusz regression)
+#
+#  deriveArrays() does the same on NumPy arrays for recomputing stored
+#  history in one go.
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Magnus constants over water (Sonntag 1990)
+MAGNUS_A = 17.62
+MAGNUS_B = 243.12    # C
+MAGNUS_E = 0.6112    # kPa at 0 C
+
+LEAF_OFFSET = 0.0    # C the leaf is cooler than the air (2 under HPS is common)
+
+
+def toF(tempC):
+    return tempC * 9 / 5.0 + 32
+
+def toC(tempF):
+    return (tempF - 32) * 5 / 9.0
+
+def svp(tempC):
+    # Saturation vapour pressure (kPa)
+    return MAGNUS_E * math.exp(MAGNUS_A * tempC / (MAGNUS_B + tempC))
+
+def vpd(tempC, rh, leafOffset=LEAF_OFFSET):
+    # Vapour pressure deficit (kPa) between the leaf and the air
+    return svp(tempC - leafOffset) - svp(tempC) * rh / 100.0
+
+def dewPoint(tempC, rh):
+    rh = max(rh, 0.01)                  # ln(0) - bone dry air
+    gamma = math.log(rh / 100.0) + MAGNUS_A * tempC / (MAGNUS_B + tempC)
+    return MAGNUS_B * gamma / (MAGNUS_A - gamma)
+
+def absoluteHumidity(tempC, rh):
+    # g of water per m3 of air (ideal gas, Rw = 461.5 J/kg/K)
+    return svp(tempC) * rh / 100.0 * 1000 / (0.4615 * (273.15 + tempC))
+
+def heatIndex(tempF, rh):
+    # NWS heat index (F).  Below ~80 F the simple formula is used.
+    simple = 0.5 * (tempF + 61.0 + (tempF - 68.0) * 1.2 + rh * 0.094)
+    if (simple + tempF) / 2 < 80:
+        return simple
+    hi = (-42.379 + 2.04901523 * tempF + 10.14333127 * rh
+          - 0.22475541 * tempF * rh - 0.00683783 * tempF * tempF
+          - 0.05481717 * rh * rh + 0.00122874 * tempF * tempF * rh
+          + 0.00085282 * tempF * rh * rh - 0.00000199 * tempF * tempF * rh * rh)
+    if rh < 13 and 80 <= tempF <= 112:
+        hi -= (13 - rh) / 4.0 * math.sqrt((17 - abs(tempF - 95)) / 17.0)
+    elif rh > 85 and 80 <= tempF <= 87:
+        hi += (rh - 85) / 10.0 * (87 - tempF) / 5.0
+    return hi
+
+
+def derive(tempC, rh, leafOffset=LEAF_OFFSET):
+    """All derived metrics for one sample as a dict"""
+    es = svp(tempC)
+    ea = es * rh / 100.0
+    tempF = toF(tempC)
+    leaf = es if leafOffset == 0 else svp(tempC - leafOffset)
+    return {
+        'temperatureF' : tempF,
+        'vpd'          : leaf - ea,
+        'dewPoint'     : dewPoint(tempC, rh),
+        'absHumidity'  : ea * 1000 / (0.4615 * (273.15 + tempC)),
+        'heatIndex'    : heatIndex(tempF, rh),
+    }
+
+
+def deriveArrays(tempC, rh, leafOffset=LEAF_OFFSET):
+    """Vectorised derive() over NumPy arrays (or sequences) of history"""
+    if numpy is None:
+        raise ImportError('deriveArrays needs numpy (sudo apt-get install python-numpy)')
+    t = numpy.asarray(tempC, dtype=float)
+    h = numpy.asarray(rh, dtype=float)
+    es = MAGNUS_E * numpy.exp(MAGNUS_A * t / (MAGNUS_B + t))
+    ea = es * h / 100.0
+    tl = t - leafOffset
+    leaf = MAGNUS_E * numpy.exp(MAGNUS_A * tl / (MAGNUS_B + tl))
+    gamma = numpy.log(numpy.maximum(h, 0.01) / 100.0) + MAGNUS_A * t / (MAGNUS_B + t)
+    f = t * 9 / 5.0 + 32
+
+    hi = 0.5 * (f + 61.0 + (f - 68.0) * 1.2 + h * 0.094)
+    full = (-42.379 + 2.04901523 * f + 10.14333127 * h
+            - 0.22475541 * f * h - 0.00683783 * f * f
+            - 0.05481717 * h * h + 0.00122874 * f * f * h
+            + 0.00085282 * f * h * h - 0.00000199 * f * f * h * h)
+    dry = (h < 13) & (f >= 80) & (f <= 112)
+    full = numpy.where(dry, full - (13 - h) / 4.0 * numpy.sqrt(
+        numpy.clip(17 - numpy.abs(f - 95), 0, None) / 17.0), full)
+    wet = (h > 85) & (f >= 80) & (f <= 87)
+    full = numpy.where(wet, full + (h - 85) / 10.0 * (87 - f) / 5.0, full)
+    hi = numpy.where((hi + f) / 2 < 80, hi, full)
+
+    return {
+        'temperatureF' : f,
+        'vpd'          : leaf - ea,
+        'dewPoint'     : MAGNUS_B * gamma / (MAGNUS_A - gamma),
+        'absHumidity'  : ea * 1000 / (0.4615 * (273.15 + t)),
+        'heatIndex'    : hi,
+    }
@@ -0,0 +1,186 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           deviceHealth.py
+#  Per-device circuit breakers.
+#
+#  Each device (BME280, MAX31790, LCD, ...) gets its own breaker:
+#    closed    - normal, every call goes through
+#    open      - maxFailures in a row, calls are skipped until the next probe
+#    half-open - one probe call allowed; success closes, failure re-opens
+#                with the retry delay doubled (up to maxDelay)
+#
+#  While a device is skipped or failing, call() hands back the last good
+#  value of the same call (same function, or the same `key=`) so the rest
+#  of the loop keeps going - a failing rpm read never gets a ramp's
+#  result.
+#
+#  A device can also answer but read nonsense (stuck, out of range);
+#  anomaly.Monitor flag()s those, they show in status() next to the
+#  breaker state.
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import time
+
+try:
+    _now = time.monotonic
+except AttributeError:       # Python 2
+    _now = time.time
+
+CLOSED    = 'closed'
+OPEN      = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+    """Failure counter + exponential re-probe schedule for one device"""
+
+    def __init__(self, name, maxFailures=3, baseDelay=5.0, maxDelay=300.0,
+                 staleAfter=None):
+        self.name = name
+        self.maxFailures = maxFailures
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.staleAfter = staleAfter   # seconds a last good value stays usable
+        self.state = CLOSED
+        self.failures = 0              # consecutive failures
+        self.totalFailures = 0
+        self.trips = 0                 # times the breaker has opened
+        self.delay = baseDelay
+        self.nextProbe = 0.0
+        self.lastError = None
+        self.lastFailure = None
+        self.lastSuccess = None
+        self.lastGood = {}             # call key -> (value, time)
+        self.anomalies = {}            # check name -> reason, from flag()
+
+    def allow(self, now=None):
+        if self.state == CLOSED:
+            return True
+        if now is None:
+            now = _now()
+        if now >= self.nextProbe:
+            self.state = HALF_OPEN
+            return True
+        return False
+
+    def success(self, value=None, now=None, key=None):
+        if now is None:
+            now = _now()
+        self.state = CLOSED
+        self.failures = 0
+        self.delay = self.baseDelay
+        self.lastSuccess = now
+        self.lastGood[key] = (value, now)
+
+    def failure(self, error, now=None):
+        if now is None:
+            now = _now()
+        self.failures += 1
+        self.totalFailures += 1
+        self.lastFailure = now
+        self.lastError = "{}: {}".format(type(error).__name__, error)
+        if self.state == HALF_OPEN:
+            self.delay = min(self.delay * 2, self.maxDelay)
+            self._trip(now)
+        elif self.failures >= self.maxFailures:
+            self._trip(now)
+
+    def _trip(self, now):
+        self.state = OPEN
+        self.trips += 1
+        self.nextProbe = now + self.delay
+
+    def fallback(self, default=None, now=None, key=None):
+        # Last good value of this call if it is still fresh enough, else default
+        good = self.lastGood.get(key)
+        if good is None:
+            return default
+        value, then = good
+        if self.staleAfter is not None:
+            if now is None:
+                now = _now()
+            if now - then > self.staleAfter:
+                return default
+        return value
+
+    def status(self, now=None):
+        if now is None:
+            now = _now()
+        return {
+            'name'          : self.name,
+            'state'         : self.state,
+            'failures'      : self.failures,
+            'totalFailures' : self.totalFailures,
+            'trips'         : self.trips,
+            'lastError'     : self.lastError,
+            'retryIn'       : max(0.0, self.nextProbe - now) if self.state == OPEN else 0.0,
+            'anomalies'     : sorted('{}: {}'.format(c, r) for c, r in self.anomalies.items()),
+        }
+
+
+class DeviceHealth(object):
+    """Registry of CircuitBreakers, one per device name"""
+
+    def __init__(self, log=None):
+        self.breakers = {}
+        self.log = log           # called with a message on state changes
+
+    def add(self, name, **kwargs):
+        self.breakers[name] = CircuitBreaker(name, **kwargs)
+        return self.breakers[name]
+
+    def call(self, name, fn, *args, **kwargs):
+        """Run fn(*args) through name's breaker.
+
+        Returns fn's result, or the breaker's fallback (last good value of
+        the same fn / `key=`, else the `default=` keyword) when the device
+        is isolated or the call fails.
+        """
+        default = kwargs.pop('default', None)
+        key = kwargs.pop('key', fn)
+        breaker = self.breakers[name]
+        now = _now()
+        if not breaker.allow(now):
+            return breaker.fallback(default, now, key)
+        before = breaker.state
+        try:
+            value = fn(*args, **kwargs)
+        except Exception as e:
+            breaker.failure(e, now)
+            if breaker.state != before and self.log is not None:
+                self.log("{} breaker {} ({})".format(name, breaker.state, breaker.lastError))
+            return breaker.fallback(default, now, key)
+        breaker.success(value, now, key)
+        if before != CLOSED and self.log is not None:
+            self.log("{} breaker closed".format(name))
+        return value
+
+    def flag(self, name, check, reason):
+        """Set (reason) or clear (None) an anomaly on a device"""
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.add(name)
+        if reason is None:
+            breaker.anomalies.pop(check, None)
+        else:
+            breaker.anomalies[check] = reason
+
+    def suspect(self, name):
+        breaker = self.breakers.get(name)
+        return breaker is not None and bool(breaker.anomalies)
+
+    def healthy(self, name):
+        return self.breakers[name].state == CLOSED
+
+    def status(self):
+        # Structured breaker state for every device, sorted by name
+        now = _now()
+        return [self.breakers[name].status(now) for name in sorted(self.breakers)]
@@ -0,0 +1,305 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           fanCurve.py
+#  Fan duty from curves in a config file instead of a hard-coded ladder.
+#
+#  Each MAX31790 channel has one curve per input (tempF, humidity, vpd -
+#  any value the loop hands in) and combines them:
+#    "max"      the input asking for the most airflow wins
+#    "weighted" weighted mean of the curves' duties ("weight", default 1)
+#  then clamps to lo / hi and rounds to whole %, or moves in `step` %
+#  steps (only once the demand is 3/4 step away, like
+#  autoTune.PIController).
+#  An input that is missing, NaN or infinite is skipped; a channel with
+#  none of its inputs gets no duty (the caller's default).
+#
+#  A curve is one of
+#    "ladder" : [[82, 30], [80, 40], [null, 70]]   steps as in zones.py -
+#               the first step whose value is exceeded wins
+#    "points" : [[72, 70], [82, 30]]               piecewise linear
+#    "points" : [...], "spline" : true             monotone cubic through
+#               the points (no overshoot between them)
+#  flat beyond the first / last point.
+#
+#  Every curve is compiled once into a lookup table (about `size` cells
+#  over its points, sampled at the middle of each cell), so evaluating it
+#  is one multiply and one index.  Cells are a power of two wide and open
+#  at their low end, like the ladder's "exceeded" test, so a ladder whose
+#  thresholds are multiples of the width (whole, half, quarter degrees
+#  ...) gives exactly the duties of autoTune.ladder, also for a reading
+#  right on a threshold.
+#
+#  Duty is as written to the MAX31790 (inverted: 30% = MAX fan speed), so
+#  "most airflow" is the lowest duty; set "inverted" : false for fans
+#  wired the other way.
+#
+#  fanCurves.json
+#  {
+#    "channels" : {
+#      "1" : { "combine" : "max", "lo" : 30, "hi" : 70, "step" : 5,
+#              "curves" : [ { "input" : "tempF",
+#                             "ladder" : [[82, 30], [80, 40], [76, 50], [72, 60], [null, 70]] },
+#                           { "input" : "vpd", "points" : [[1.2, 70], [1.6, 40]],
+#                             "spline" : true } ] }
+#    }
+#  }
+#  Without a file channel 1 runs the fullbucket_v3 ladder (DEFAULT).
+#
+#  python fanCurve.py [fanCurves.json]   print the curves' duties
+#  python fanCurve.py bench              six channels, timing + table error
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import bisect
+import json
+import math
+import sys
+from array import array
+
+import autoTune
+
+SIZE = 1024          # lookup table entries per curve
+_INF = float('inf')
+
+DEFAULT = {'channels' : {'1' : {'curves' : [{'input' : 'tempF', 'ladder' : autoTune.LADDER}]}}}
+
+
+def finite(x):
+    """True for a usable input - None, NaN and +-inf count as missing"""
+    return x is not None and -_INF < x < _INF
+
+
+def _ladderFn(steps):
+    steps = [(limit, duty) for limit, duty in steps]
+    if None not in [limit for limit, _ in steps]:
+        raise ValueError('a ladder needs a [null, duty] step for below its thresholds')
+    def fn(x):
+        return autoTune.ladder(x, steps)
+    limits = [limit for limit, _ in steps if limit is not None] or [0.0]   # [[null, d]] = flat
+    return fn, min(limits), max(limits)
+
+
+def _linearFn(points):
+    xs = [float(x) for x, _ in points]
+    ys = [float(y) for _, y in points]
+    def fn(x):
+        if x <= xs[0]:
+            return ys[0]
+        if x >= xs[-1]:
+            return ys[-1]
+        i = bisect.bisect_right(xs, x) - 1
+        return ys[i] + (ys[i + 1] - ys[i]) * (x - xs[i]) / (xs[i + 1] - xs[i])
+    return fn, xs[0], xs[-1]
+
+
+def _splineFn(points):
+    # Monotone cubic Hermite (Fritsch-Carlson): slopes are limited so the
+    # curve never overshoots between two points
+    xs = [float(x) for x, _ in points]
+    ys = [float(y) for _, y in points]
+    n = len(xs)
+    d = [(ys[i + 1] - ys[i]) / (xs[i + 1] - xs[i]) for i in range(n - 1)]
+    m = [d[0]] + [0.0 if d[i - 1] * d[i] <= 0 else (d[i - 1] + d[i]) / 2.0
+                  for i in range(1, n - 1)] + [d[-1]]
+    for i in range(n - 1):
+        if d[i] == 0:
+            m[i] = m[i + 1] = 0.0
+            continue
+        a, b = m[i] / d[i], m[i + 1] / d[i]
+        if a * a + b * b > 9:
+            t = 3 / (a * a + b * b) ** 0.5
+            m[i], m[i + 1] = t * a * d[i], t * b * d[i]
+    def fn(x):
+        if x <= xs[0]:
+            return ys[0]
+        if x >= xs[-1]:
+            return ys[-1]
+        i = bisect.bisect_right(xs, x) - 1
+        h = xs[i + 1] - xs[i]
+        t = (x - xs[i]) / h
+        return ((2 * t ** 3 - 3 * t * t + 1) * ys[i] + (t ** 3 - 2 * t * t + t) * h * m[i]
+                + (-2 * t ** 3 + 3 * t * t) * ys[i + 1] + (t ** 3 - t * t) * h * m[i + 1])
+    return fn, xs[0], xs[-1]
+
+
+class Curve(object):
+    """One input -> duty %, compiled to a lookup table (None for a
+    missing or non-finite input)"""
+
+    def __init__(self, ladder=None, points=None, spline=False, size=SIZE):
+        if ladder is not None:
+            self.exact, lo, hi = _ladderFn(ladder)
+        elif points is None or len(points) < 2:
+            raise ValueError('a curve needs a ladder or at least two points')
+        elif sorted(x for x, _ in points) != [x for x, _ in points]:
+            raise ValueError('curve points must be in increasing order')
+        elif spline:
+            self.exact, lo, hi = _splineFn(points)
+        else:
+            self.exact, lo, hi = _linearFn(points)
+        # Cells a power of two wide from a multiple of the width, so
+        # whole / half / quarter thresholds fall exactly on cell edges.
+        # Cell i is (x0 - (i + 1) * res, x0 - i * res]: the table runs
+        # down from x0 (negative scale) so int() leaves each cell open at
+        # its low end.  One cell spare at each end for the flat parts
+        res = 2.0 ** math.floor(math.log((hi - lo) / float(size - 3), 2)) if hi > lo else 1.0
+        self.x0 = math.ceil(hi / res) * res + res
+        self.scale = -1.0 / res
+        self.last = int(math.ceil((self.x0 - lo) / res))
+        self.table = array('d', [self.exact(self.x0 - (i + 0.5) * res) for i in range(self.last + 1)])
+
+    def __call__(self, x):
+        if x is None or not -_INF < x < _INF:
+            return None
+        i = int((x - self.x0) * self.scale)
+        if i < 0:
+            i = 0
+        elif i > self.last:
+            i = self.last
+        return self.table[i]
+
+
+class FanCurve(object):
+    """The curves of one channel -> duty %"""
+
+    def __init__(self, curves, combine='max', lo=30, hi=70, step=None, inverted=True):
+        """curves - [(input name, Curve, weight)]"""
+        if combine not in ('max', 'weighted'):
+            raise ValueError('combine must be "max" or "weighted"')
+        self.sources = curves
+        self.curves = [(name, c.x0, c.scale, c.last, c.table, weight) for name, c, weight in curves]
+        self.combine = combine
+        self.lo = lo
+        self.hi = hi
+        self.step = step
+        self.inverted = inverted
+        self.duty = None
+
+    def __call__(self, values):
+        """{input: value} -> duty %, None when none of its inputs is there"""
+        get = values.get
+        most = self.combine == 'max'
+        inverted = self.inverted
+        best = None
+        total = weights = 0.0
+        for name, x0, scale, last, table, weight in self.curves:
+            x = get(name)
+            if x is None or not -_INF < x < _INF:
+                continue                  # missing, or NaN / inf from a bad reading
+            i = int((x - x0) * scale)
+            duty = table[0 if i < 0 else last if i > last else i]
+            if not most:
+                total += duty * weight
+                weights += weight
+            elif best is None or (duty < best if inverted else duty > best):
+                best = duty
+        if not most:
+            best = total / weights if weights else None
+        if best is None:
+            return None
+        best = min(max(best, self.lo), self.hi)
+        if not self.step:
+            self.duty = int(round(best))
+        elif self.duty is None or abs(best - self.duty) >= 0.75 * self.step:
+            level = self.lo + round((best - self.lo) / self.step) * self.step
+            self.duty = int(min(max(level, self.lo), self.hi))
+        return self.duty
+
+
+class CurveSet(object):
+    """Every channel's FanCurve"""
+
+    def __init__(self, channels):
+        self.channels = channels        # {channel: FanCurve}
+        self._items = sorted(channels.items())
+
+    def duties(self, values):
+        """{input: value} -> {channel: duty %}, channels without inputs left out"""
+        out = {}
+        for channel, curve in self._items:
+            duty = curve(values)
+            if duty is not None:
+                out[channel] = duty
+        return out
+
+    def inputs(self):
+        return sorted(set(c[0] for curve in self.channels.values() for c in curve.curves))
+
+
+def fromConfig(config):
+    """CurveSet from a parsed config (see top of file)"""
+    channels = {}
+    for channel, c in config['channels'].items():
+        curves = []
+        for spec in c['curves']:
+            curves.append((spec['input'], Curve(spec.get('ladder'), spec.get('points'),
+                                                spec.get('spline', False), spec.get('size', SIZE)),
+                           spec.get('weight', 1.0)))
+        channels[int(channel)] = FanCurve(curves, c.get('combine', 'max'), c.get('lo', 30),
+                                          c.get('hi', 70), c.get('step'), c.get('inverted', True))
+    return CurveSet(channels)
+
+
+def load(path):
+    with open(path) as f:
+        return fromConfig(json.load(f))
+
+
+def bench(n=20000):
+    import random
+    import time
+    config = {'channels' : {}}
+    for ch in range(1, 7):
+        config['channels'][str(ch)] = {
+            'combine' : 'max' if ch % 2 else 'weighted', 'step' : 5 if ch < 4 else None,
+            'curves' : [{'input' : 'tempF', 'ladder' : autoTune.LADDER},
+                        {'input' : 'humidity', 'points' : [[55, 70], [65, 50], [75, 30]]},
+                        {'input' : 'vpd', 'points' : [[0.4, 40], [0.8, 70], [1.2, 70], [1.6, 30]],
+                         'spline' : True}]}
+    curves = fromConfig(config)
+    rnd = random.Random(1)
+    rows = [{'tempF' : rnd.uniform(65, 90), 'humidity' : rnd.uniform(40, 85),
+             'vpd' : rnd.uniform(0.2, 2.0)} for i in range(n)]
+    start = time.time()
+    for values in rows:
+        curves.duties(values)
+    elapsed = time.time() - start
+    print('6 channels x 3 inputs: {:.1f} us per duties()'.format(elapsed / n * 1e6))
+
+    start = time.time()
+    for values in rows:
+        for channel, curve in curves._items:
+            duty = min(c.exact(values[name]) for name, c, weight in curve.sources)
+            min(max(duty, curve.lo), curve.hi)
+    direct = time.time() - start
+    print('the same curves evaluated directly      : {:.1f} us'.format(direct / n * 1e6))
+
+    for name, c, weight in curves.channels[1].sources:
+        worst = max(abs(c(v[name]) - c.exact(v[name])) for v in rows)
+        print('  {:8s}: {:5d} table entries, worst table error {:.3f} % duty'.format(
+            name, c.last + 1, worst))
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        bench()
+        return
+    curves = load(sys.argv[1]) if len(sys.argv) > 1 else fromConfig(DEFAULT)
+    for channel, curve in sorted(curves.channels.items()):
+        print('channel {:d} ({}):'.format(channel, curve.combine))
+        for name, x0, scale, last, table, weight in curve.curves:
+            res = -1.0 / scale
+            print('  {:10s} {:g} .. {:g}: {}'.format(name, x0 - last * res, x0 - res, ' '.join(
+                '{:.0f}'.format(table[i]) for i in range(last, -1, -max(1, (last + 1) // 16)))))
+
+if __name__=="__main__":
+   main()
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           fanRamp.py
+#  Smooth fan speed changes done by the MAX31790 itself.
+#
+#  The chip moves each PWM output towards its target one 1/511 step at a
+#  time, every 0 - 125 ms (timeBtwDutyCycleIncr), optionally at half that
+#  rate going down (rateofChangeSymmetry).  start() picks the slowest step
+#  time per channel that still arrives within `seconds` (step times go in
+#  powers of two, so a channel lands between seconds/2 and seconds),
+#  programs all six rates in one block write and the targets in another -
+#  then returns.  Nothing waits or spins: poll() compares one
+#  block read of the live duties with the targets and returns the
+#  channels that have arrived.
+#
+#  softStart() brings several fans up from standby using the chip's
+#  sequential start delay, so they do not all draw start-up current at
+#  once.
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import time
+
+import MAX31790
+
+
+class RampEngine(object):
+
+    def __init__(self, ctrl=None, slowDown=False, log=None):
+        """
+        ctrl     - MAX31790.Controller, default is the module's chip
+        slowDown - ramp down at half the rate up (rateofChangeSymmetry)
+        """
+        self.ctrl = ctrl if ctrl is not None else MAX31790._default
+        self.slowDown = slowDown
+        self.log = log
+        self.active = {}          # channel -> (target 0-511, eta)
+        self.finished = 0
+
+    def _say(self, message):
+        if self.log is not None:
+            self.log("fan ramp: " + message)
+
+    def start(self, targets, seconds=10.0):
+        """Ramp {channel: duty %} over about `seconds`, returns the eta.
+
+        seconds=0 steps straight to the targets (e.g. safe duty on a fault).
+        """
+        current = self.ctrl.readAllPWM()
+        now = time.time()
+        goal = {}
+        rates = {}
+        eta = now
+        for channel, percent in targets.items():
+            target = (percent * 511) // 100
+            steps = abs(target - current[channel - 1])
+            if self.slowDown and target < current[channel - 1]:
+                steps *= 2                      # chip goes down at half rate
+            code = MAX31790.rampCode(steps, seconds) if seconds > 0 else MAX31790.incr_1
+            rates[channel] = code
+            goal[channel] = target
+            arrive = now + steps * MAX31790.INCR_MS[code] / 1000.0
+            self.active[channel] = (target, arrive)
+            eta = max(eta, arrive)
+        self.ctrl.setRampRates(rates, self.slowDown)
+        self.ctrl.setPWMTargets(goal)
+        return eta
+
+    def stop(self, channels, seconds=10.0):
+        return self.start(dict((ch, 0) for ch in channels), seconds)
+
+    def softStart(self, targets, delay=MAX31790.t_500ms, seconds=5.0):
+        """Start {channel: duty %} from standby, one fan every `delay` (t_*)"""
+        self.ctrl.standbyMode()
+        self.ctrl.setSeqStartDelay(delay)
+        eta = self.start(targets, seconds)
+        self.ctrl.runMode()
+        return eta + len(targets) * MAX31790.SEQ_DELAY_S[delay]
+
+    def busy(self):
+        return bool(self.active)
+
+    def poll(self, duties=None):
+        """Channels whose ramp finished since the last poll.
+
+        duties - six live duties from a bulk read already made this cycle;
+                 otherwise one block read is done (only while ramping)
+        """
+        if not self.active:
+            return []
+        if duties is None:
+            duties = self.ctrl.readAllPWM()
+        done = []
+        now = time.time()
+        for channel, (target, eta) in list(self.active.items()):
+            if duties[channel - 1] == target:
+                del self.active[channel]
+                done.append(channel)
+                self.finished += 1
+                self._say('channel {:d} at {:d}/511 ({:+.1f} s vs eta)'.format(channel, target, now - eta))
+        return done
+
+    def status(self):
+        now = time.time()
+        return dict((ch, {'target' : t, 'remaining' : max(0.0, eta - now)})
+                    for ch, (t, eta) in self.active.items())
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           filters.py
+#  Streaming filters that sit between the sensor reads and whatever uses
+#  the values (fan control, LCD, upload).
+#
+#    Ewma(alpha)       exponentially weighted moving average
+#    Median(window)    moving median, rejects single-sample spikes
+#    Deadband(band)    output only moves once the input has moved more
+#                      than `band` away from it (hysteresis)
+#    Chain(f1, f2..)   run filters in order
+#
+#  Every filter has update(x) -> filtered x and reset().  State is a few
+#  floats or a fixed-size array, so the cost per sample does not grow.
+#
+#  FilterBank keeps one chain per channel name so the same setup can be
+#  used for BME280, Chirp and tach readings:
+#
+#    bank = FilterBank({'temperatureF' : lambda: Chain(Median(3), Ewma(0.3), Deadband(0.5)),
+#                       'rpm'          : lambda: Median(5)})
+#    tempF = bank.update('temperatureF', raw)
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from array import array
+from bisect import bisect_left, insort
+
+
+class Ewma(object):
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, x):
+        if self.value is None:
+            self.value = float(x)
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+
+class Median(object):
+    """Moving median over the last `window` samples (use an odd window).
+
+    Keeps a ring of raw samples and a sorted copy; each update removes the
+    oldest sample and inserts the new one with bisect, O(window) with no
+    allocation.
+    """
+
+    def __init__(self, window=5):
+        self.window = window
+        self._ring = array('d', [0.0]) * window
+        self._sorted = array('d')
+        self._head = 0
+
+    def update(self, x):
+        x = float(x)
+        if len(self._sorted) == self.window:
+            old = self._ring[self._head]
+            del self._sorted[bisect_left(self._sorted, old)]
+        self._ring[self._head] = x
+        self._head = (self._head + 1) % self.window
+        insort(self._sorted, x)
+        n = len(self._sorted)
+        if n % 2:
+            return self._sorted[n // 2]
+        return (self._sorted[n // 2 - 1] + self._sorted[n // 2]) / 2.0
+
+    def reset(self):
+        self._sorted = array('d')
+        self._head = 0
+
+
+class Deadband(object):
+    """Hold the output until the input moves more than `band` from it"""
+
+    def __init__(self, band=0.5):
+        self.band = band
+        self.value = None
+
+    def update(self, x):
+        if self.value is None or abs(x - self.value) > self.band:
+            self.value = x
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+
+class Chain(object):
+    def __init__(self, *filters):
+        self.filters = filters
+
+    def update(self, x):
+        for f in self.filters:
+            x = f.update(x)
+        return x
+
+    def reset(self):
+        for f in self.filters:
+            f.reset()
+
+
+class FilterBank(object):
+    """One filter per channel, built from a {channel: factory} config.
+
+    Channels with no factory pass values through unchanged.
+    """
+
+    def __init__(self, config=None):
+        self.config = dict(config or {})
+        self.filters = {}
+        self.last = {}          # channel -> last filtered value
+
+    def update(self, channel, x):
+        f = self.filters.get(channel)
+        if f is None:
+            factory = self.config.get(channel)
+            if factory is None:
+                self.last[channel] = x
+                return x
+            f = self.filters[channel] = factory()
+        x = self.last[channel] = f.update(x)
+        return x
+
+    def reset(self, channel=None):
+        for name, f in self.filters.items():
+            if channel is None or name == channel:
+                f.reset()
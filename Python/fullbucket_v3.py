@@ -49,6 +49,8 @@
 import smbus
 import time
 import os
+import atexit
+import threading
 import sys
 import urllib            # URL functions
 import urllib2           # URL functions
@@ -56,27 +58,136 @@ import RPi.GPIO as GPIO  # Raspberry Pi GPIO library
 import bme280            # Temp / Humis Sensor library
 import lcd_i2c           # i2C LCD library
 import MAX31790          # MAX31790
-import bmp280
+import bmp280            # Pressure / Temp sensor library
+import coldStart         # Startup probing / background device init
+import deviceHealth      # Per-device circuit breakers
+import filters           # Streaming sensor filters
+import derived           # VPD, dew point, abs humidity, heat index
+import reportPolicy      # When to upload to ThingSpeak
+import chirp             # Soil moisture sensor
+import irrigation        # Soil moisture driven pump control
+import relayScheduler    # Light / fan relay timers
+import growLog           # Buffered structured log file
+import history           # Local sensor history + rollups
+import busReplay         # Bus / GPIO traffic recorder
+import fanRamp           # Hardware fan speed ramps
+import dashboard         # Live web dashboard
+import snapshot          # Latest readings for other local programs
+import sensorSleep       # Chirp deep sleep with planned wake-ups
+import anomaly           # Stuck / out of range / disagreeing sensors
+import sample            # Reading record + ring buffers
+import controlCore       # Fan loop in its own high priority process
+import pulseCounter      # Flow meter pulses
+import zones             # More tents / fan channels from zones.json
+import telemetry         # Binary frames to a local collector
 #----------------------------------------------
 ###############i2c params######################
 I2C_ADDR  = 0x27 # LCD I2C device address
 BME_ADDR  = 0x76 #BME280  I2C address
-BMP_ADDR  = 0x68 #BMP280 I2C Adress
+BMP_ADDR  = 0x77 #BMP280 I2C Adress (SDO high, BME280 has 0x76)
+CHIRP_ADDR = 0x21 #Soil moisture sensor I2C address
 
 SMBUSID   = 1    # 1: Pi 3 B SMBUS
 ###############################################
 #----------------------------------------------
 pushButton = 26   # Button BCM  
 PUMP       = 13   # Pump BCM
-counter    = 0    # For button press
+LIGHTS     = None # Lights relay BCM (set to enable the photoperiod)
+LIGHTS_ON    = '06:00'  # Lights on time (local)
+LIGHTS_HOURS = 18       # Hours of light per day
+pumpManual = False  # Pump switched on with the push button
+SAFE_DUTY  = 30   # Fan duty written first on startup (= MAX fan speed)
+FAN_PROFILES = {  # MAX31790 channel -> fan tach / spin-up settings
+    1 : MAX31790.FanProfile(pulsePerRev=2, tachPeriods=4, spinUp=MAX31790.spin_500ms,
+                            pwmFreq=MAX31790.PWMFREQ_25kHz, minRPM=300),
+}
+RAMP_SECONDS = 8  # Time the MAX31790 takes to move between fan duty steps
+TUNING_PATH  = '/var/lib/growPi/tuning.json'   # PI replaces channel 1's curve when present
+CURVES_PATH  = '/var/lib/growPi/fanCurves.json'  # fanCurve.py curves, the ladder when absent
+CONTROL_CORE = True   # BME280 -> fan loop in controlCore.py's own process, False = in this loop
+CONTROL_PERIOD = 10   # Control core cycle (s)
+ZONES_PATH   = '/var/lib/growPi/zones.json'   # zones.py tents served by this loop when present
+#----------------------------------------------
+###############Irrigation######################
+# These values needs to be calibrated for the percentage to work!
+min_moist = 335   # Chirp reading in dry soil
+max_moist = 700   # Chirp reading in wet soil
+MOIST_LOW   = 35    # Start dosing below (%)
+MOIST_HIGH  = 45    # Stop dosing above (%)
+PUMP_PULSE  = 5     # Pump on time per dose (s)
+PUMP_SETTLE = 120   # Wait after each dose before re-reading (s)
+PUMP_FLOW   = 1.5   # Pump flow rate (L/min), used without a flow meter
+FLOW_PIN    = None  # Flow meter BCM (set to measure water instead of estimating it)
+FLOW_K      = 450.0 # Flow meter pulses per litre (YF-S201)
+DAILY_CAP   = 2.0   # Max water per day (L)
+IRRIGATION_STATE = '/var/lib/growPi/irrigation.json'   # today's litres, kept over restarts
+CHIRP_SLEEP = True  # Chirp in deep sleep between reads, woken ahead of each one
+CHIRP_WAKE  = 1.0   # Chirp wake-up time (s)
+irrigator   = None
+soilProbe   = None
+###############################################
+#----------------------------------------------
+###############Sensor filters##################
+# Median drops spikes, EWMA smooths, deadband stops the fan
+# stepping up and down around a threshold
+SENSOR_FILTERS = {
+    'temperatureF' : controlCore.TEMP_FILTER,
+    'humidity'     : controlCore.HUMIDITY_FILTER,
+    'rpm'          : lambda: filters.Median(3),
+}
+# Checks on the raw readings (10 s apart) - channel: (device, checks)
+# A steady tent can hold a reading for minutes, so Stuck waits an hour
+# and only alerts (ANOMALY_ALERT_ONLY) - it never sends the fans to safe duty
+ANOMALY_CHECKS = {
+    'tempC'    : ('bme', lambda: [anomaly.Range(-40, 85), anomaly.Stuck(360), anomaly.Rate(0.2)]),
+    'humidity' : ('bme', lambda: [anomaly.Range(-1, 101), anomaly.Stuck(360), anomaly.Rate(2.0)]),
+    'pressure' : ('bme', lambda: [anomaly.Range(300, 1100), anomaly.Stuck(360)]),
+    'rpm'      : ('max', lambda: [anomaly.Range(-1, 5000), anomaly.Stuck(60)]),
+    'moisture' : ('chirp', lambda: [anomaly.Range(-1, 101)]),
+}
+ANOMALY_ALERT_ONLY = ('stuck',)
+# Redundant sensors - tolerance C / hPa.  With two, the BME280 stays the
+# control sensor and only the BMP280 is flagged.  The Chirp's thermistor
+# reads the soil, not the air, so it is not a third temperature source.
+ANOMALY_GROUPS = {
+    'temperature' : (lambda: anomaly.Consensus(1.5, primary='bme'), {'bme' : 'bme', 'bmp' : 'bmp'}),
+    'pressure'    : (lambda: anomaly.Consensus(1.5, primary='bme'), {'bme' : 'bme', 'bmp' : 'bmp'}),
+}
+###############################################
 #----------------------------------------------
 ###############Thingspeak info#################
-INTERVAL      = 1                                     # Delay between each reading (mins)
+INTERVAL      = 1                                     # Min delay between uploads of small changes (mins)
+HEARTBEAT     = 15                                    # Upload at least this often (mins)
 THINGSPEAKKEY = 'ZEX2JMIAZHUXTG58'                    # API Write Key
 THINGSPEAKURL = 'https://api.thingspeak.com/update'   # API URL
 tz_local      = 'America/Chicago'                     # Local Timezone
 ###############################################
 #----------------------------------------------
+################Log file#####################
+LOG_PATH   = '/var/log/growPi/growPi.log'   # JSON lines, rotated + gzipped
+LOG_SCHEMA = {
+    'fan'    : ['tempF', 'rpm', 'duty', 'pwm'],
+    'upload' : ['tempC', 'tempF', 'pres', 'humid', 'vpd', 'result'],
+    'bmp'    : ['bmeC', 'bmeHPa', 'bmpC', 'bmpHPa'],
+    'event'  : ['message'],
+}
+LOG = None
+HISTORY_PATH = '/var/lib/growPi/history.db'     # query with history.py
+RECORD_PATH  = None     # e.g. '/var/lib/growPi/tape.gz' to record bus traffic for busReplay.py
+DASHBOARD_PORT = 8080   # http://growpi.local:8080/ , None = off
+SNAPSHOT_PATH  = snapshot.PATH   # read with snapshot.Reader() / python snapshot.py
+TELEMETRY_HOST = None   # telemetryCollector.py host, None = off
+TELEMETRY_PORT = 5005
+TELEMETRY_NODE = 1      # this Pi's node id at the collector
+# One Reading per loop is shared by control, LCD, log, history, dashboard,
+# snapshot and upload; the last RING_SIZE of each field stay in memory
+Reading = sample.schema('Reading', ['tempC', 'tempF', 'humidity', 'pressure', 'vpd', 'dewPoint',
+                                    'absHumidity', 'heatIndex', 'bmpC', 'bmpHPa', 'rpm', 'duty',
+                                    'pwm', 'ramping', 'moisture', 'waterL'])
+RING_SIZE = 360         # 1 hour at 10 s
+SNAPSHOT_FIELDS = Reading.fields
+###############################################
+#----------------------------------------------
 ################LCD stuff######################
 LCD_WIDTH  = 20     # Maximum characters per line
 LCD_LINE_1 = 0x80   # LCD RAM address for the 1st line
@@ -85,47 +196,107 @@ LCD_LINE_3 = 0x94   # LCD RAM address for the 3rd line
 LCD_LINE_4 = 0xD4   # LCD RAM address for the 4th line
 ###############################################
 
-def sendData(url,key,field1,field2,field3,field4,temp,pres,humid,tempf):
+def sendData(url,key,s):
     """
     Send event to Thingspeak internet site
     """
-    values = {'api_key' : key,'field1' : temp,'field2' : pres,'field3' : humid,'field4' : tempf,'timezone' : tz_local}
+    tempf = derived.toF(s.tempC)            # unfiltered, as always uploaded
+    values = {'api_key' : key,'field1' : s.tempC,'field2' : s.pressure,'field3' : s.humidity,'field4' : tempf,'field5' : s.vpd,'timezone' : tz_local}
 
     postdata = urllib.urlencode(values)     #encode values in url format  ------> (postdata) = api_key=key&field1=temp&field2=pres ....
     req = urllib2.Request(url, postdata)    #attach to URL request  ------> (req) = http://www.thingspeak.com/update?(postdata)
 
-    log = time.strftime("%Y-%m-%d %H:%M:%S") + " | " 
-    log = log + "{:.2f} C".format(temp) + " | "
-    log = log + "{:.2f} F".format(tempf) + " | "
-    log = log + "{:.2f} mBar".format(pres) + " | "
-    log = log + "{:.2f} %".format(humid) + " | "
-    
     try:
         # Send data to Thingspeak
         response = urllib2.urlopen(req, None, 5)  #open URL (req) to post data to server
-        html_string = response.read()             # server returns update number
+        result = 'Update ' + response.read()      # server returns update number
         response.close()
-        log = log + 'Update ' + html_string
     # Error handling so script doesnt break
     except urllib2.HTTPError, e:
-        log = log + 'Server could not fulfill the request. Error code: ' + e.code
+        result = 'Server could not fulfill the request. Error code: {}'.format(e.code)
     except urllib2.URLError, e:
-        log = log + 'Failed to reach server. Reason: ' + e.reason
+        result = 'Failed to reach server. Reason: {}'.format(e.reason)
     except:
-        log = log + 'Unknown error'
+        result = 'Unknown error'
 
-    print log
+    LOG.record('upload', s.tempC, tempf, s.pressure, s.humidity, s.vpd, result)
 
 def BUTTON(channel):
-    global counter
+    global pumpManual
     if GPIO.input(26) == 1:
-        if counter % 2 == 0:        #check if even
-            GPIO.output(PUMP,1)
-        else:
-            GPIO.output(PUMP,0)
-        counter += 1
-        if counter == 100:           #keep counter low
-            counter =0
+        pumpManual = not pumpManual     #each press toggles the pump
+        GPIO.output(PUMP, 1 if pumpManual else 0)
+        if irrigator is not None:
+            irrigator.hold = pumpManual     #manual pump pauses auto dosing
+
+def printLog(message):
+    LOG.event(message)
+
+def refreshLCD(s, rings):
+    # Trend over the last 5 minutes from the ring, no extra reads
+    _, temps = rings.window('tempF', 31)
+    trend = ' '
+    if len(temps) > 1 and temps[-1] - temps[0] > 0.5:
+        trend = '^'
+    elif len(temps) > 1 and temps[-1] - temps[0] < -0.5:
+        trend = 'v'
+    lcd_i2c.lcd_string("PWM  = {:.0f} | [{}]".format(s.pwm, time.strftime("%H:%M", time.localtime(s.wall))),LCD_LINE_1)  #update the time
+    lcd_i2c.lcd_string("Tach = {:d} rpm".format(int(s.rpm)),LCD_LINE_2)
+    lcd_i2c.lcd_string("Temp = {:.1f} F{}| {:.0f}C".format(s.tempF,trend,s.tempC),LCD_LINE_3)
+    lcd_i2c.lcd_string("Hum  = {:.1f}% {:.2f}k".format(s.humidity, s.vpd),LCD_LINE_4)
+
+def initFans(boot):
+    MAX31790.initializeMAX(1)
+    MAX31790.setPWMTargetDuty(1, SAFE_DUTY)     # reset() cleared the safe duty
+    boot.firstControl()
+    MAX31790.applyProfiles(FAN_PROFILES)
+    return True
+
+def initBMP280():
+    sensW = bmp280.bmp280Wrapper(BMP_ADDR)
+    printLog("Found BMP280 : (%s)" %hex(sensW.chipID))
+    sensW.resetSensor()
+    # configuration byte contains standby time, filter, and SPI enable.
+    bmp280Config = sensW.tSb62t5 | sensW.filt4
+    # measurement byte contains temperature + pressure oversampling and mode.
+    bmp280Meas = sensW.osP16 | sensW.osT2 | sensW.modeNormal
+    # Set sensor mode.
+    sensW.setMode(config = bmp280Config, meas = bmp280Meas)
+    return sensW
+
+def initIrrigation(health):
+    global irrigator
+    global soilProbe
+    soil = chirp.Chirp(address=CHIRP_ADDR, read_temp=False, read_light=False,
+                       min_moist=min_moist, max_moist=max_moist)
+    def readMoisture():
+        soil.trigger()
+        return soil.moist_percent
+    nextRead = None
+    if CHIRP_SLEEP:
+        soilProbe = sensorSleep.SleepySensor(soil.send_wake, soil.sleep, CHIRP_WAKE, 'chirp')
+        wakes = sensorSleep.WakeScheduler().start()
+        awake = readMoisture
+        readMoisture = lambda: soilProbe.read(awake)
+        nextRead = lambda at: wakes.plan(soilProbe, at)
+    meter = None
+    if FLOW_PIN is not None:
+        meter = pulseCounter.attach(pulseCounter.FlowMeter(FLOW_K), FLOW_PIN)
+    irrigator = irrigation.IrrigationController(readMoisture, PUMP, low=MOIST_LOW, high=MOIST_HIGH,
+                                                pulse=PUMP_PULSE, settle=PUMP_SETTLE, flowRate=PUMP_FLOW,
+                                                dailyCap=DAILY_CAP, flowMeter=meter, log=printLog,
+                                                nextRead=nextRead, statePath=IRRIGATION_STATE,
+                                                mayDose=lambda: not health.suspect('chirp'))
+    return irrigator
+
+def startIrrigation(boot, health):
+    # A Chirp left in deep sleep by the last run NACKs the probe, but the
+    # probe wakes it - ask again once it is up
+    if CHIRP_SLEEP and 'chirp' not in boot.present:
+        time.sleep(CHIRP_WAKE)
+        boot.probe({'chirp' : CHIRP_ADDR})
+    if 'chirp' in boot.present:
+        initIrrigation(health).start()
 
 def main():
 
@@ -135,96 +306,233 @@ def main():
     global INTERVAL
     global THINGSPEAKKEY
     global THINGSPEAKURL
-    global errors
     global I2C_ADDR
     global LCD_WIDTH
-    global pwm_live
+    global LOG
 
     #Setup
     errors = 0    #exception counter
+    LOG = growLog.GrowLog(LOG_PATH, schema=LOG_SCHEMA)
+    atexit.register(LOG.close)      # write what is still queued on exit
+    if RECORD_PATH is not None:
+        busReplay.record(RECORD_PATH, quiet=[I2C_ADDR])
+    # Cold start: probe bus once, fans to a safe duty, then init the rest
+    # in the background so airflow comes back before the LCD is ready
+    boot = coldStart.ColdStart(SMBUSID)
+    boot.probe({'lcd' : I2C_ADDR, 'bme' : BME_ADDR, 'bmp' : BMP_ADDR, 'max' : MAX31790.maxAddr, 'chirp' : CHIRP_ADDR})
+    if 'max' in boot.present:
+        MAX31790.setPWMTargetDuty(1, SAFE_DUTY)     # until initFans resets the chip
+    boot.launch('max', initFans, boot)
+    boot.launch('lcd', lcd_i2c.lcd_init)
+    boot.launch('bmp', initBMP280)
+
     GPIO.setwarnings(False)
     GPIO.setmode(GPIO.BCM)      #Use BCM numbering for pins
     GPIO.setup(pushButton, GPIO.IN, pull_up_down=GPIO.PUD_UP)
     GPIO.setup(PUMP, GPIO.OUT, initial=GPIO.LOW)
     GPIO.add_event_detect(pushButton, GPIO.BOTH)
     GPIO.add_event_callback(pushButton, BUTTON)
+    reported = False
 
-    bus = smbus.SMBus(SMBUSID)  
-    lcd_i2c.lcd_init()
-    MAX31790.initializeMAX(1)
-    try:
-        sensW = bmp280.bmp280Wrapper()
-    except:
-        print BMP280 init FAIL
-    print("Found BMP280 : (%s)" %hex(sensW.chipID))
-    sensW.resetSensor()
-    # configuration byte contains standby time, filter, and SPI enable.
-    bmp280Config = sensW.tSb62t5 | sensW.filt4
-    # measurement byte contains temperature + pressure oversampling and mode.
-    bmp280Meas = sensW.osP16 | sensW.osT2 | sensW.modeNormal
-    # Set sensor mode.
-    sensW.setMode(config = bmp280Config, meas = bmp280Meas)
+    # One breaker per device - a flaky sensor no longer stalls the others
+    health = deviceHealth.DeviceHealth(log=printLog)
+    health.add('bme', maxFailures=3, staleAfter=60)
+    health.add('bmp', maxFailures=3)
+    health.add('max', maxFailures=3)
+    health.add('lcd', maxFailures=3)
+    health.add('chirp')
+
+    # Irrigation runs on its own thread once the pump pin is set up,
+    # started from another one so a sleeping Chirp does not hold up the loop
+    irrigationStart = threading.Thread(target=startIrrigation, args=(boot, health), name='irrigation init')
+    irrigationStart.daemon = True
+    irrigationStart.start()
+
+    # Lights photoperiod - after a restart the relay is set from the
+    # schedule, not from whatever happened while we were down
+    if LIGHTS is not None:
+        relays = relayScheduler.RelayScheduler(relayScheduler.gpioRelay({'lights' : LIGHTS}), log=printLog)
+        relays.add('lights', relayScheduler.Photoperiod(LIGHTS_ON, LIGHTS_HOURS))
+        relays.start()
+
+    monitor = anomaly.Monitor(ANOMALY_CHECKS, ANOMALY_GROUPS, health=health, log=printLog,
+                              alertOnly=ANOMALY_ALERT_ONLY)
+    ramp = fanRamp.RampEngine(MAX31790._default, slowDown=True, log=printLog)   # initializeMAX sets slow-down
+    control = controlCore.Control(TUNING_PATH, CURVES_PATH, 1, log=printLog)
+    if control.tuned is not None:
+        printLog("Fan PI from {} : setpoint {:.1f} F".format(TUNING_PATH, control.tuned.setpoint))
+    core = None
+    zoneManager = None
+    if os.path.exists(ZONES_PATH):
+        zoneManager = zones.loadZones(ZONES_PATH, log=printLog,
+                                      shared={(SMBUSID, MAX31790.maxAddr) : MAX31790._default})
+        for zone in zoneManager.zones:
+            if zoneManager.controllers[zone.controller] is MAX31790._default and 1 in zone.channels:
+                printLog("Zones from {} not used: zone {} claims channel 1".format(ZONES_PATH, zone.name))
+                zoneManager = None
+                break
+    bank = filters.FilterBank(SENSOR_FILTERS)
+    duty_written = {}       # channel -> last duty sent to the MAX31790
+    policy = reportPolicy.ReportPolicy(interval=INTERVAL*60, heartbeat=HEARTBEAT*60)
+    hist = history.History(HISTORY_PATH)
+    hist.prune()
+    dash = None
+    if DASHBOARD_PORT is not None:
+        try:
+            dash = dashboard.Dashboard(DASHBOARD_PORT).start()
+        except Exception as e:
+            printLog("Dashboard not started: {}".format(e))
+    snap = snapshot.Snapshot(SNAPSHOT_FIELDS, SNAPSHOT_PATH)
+    sender = None
+    if TELEMETRY_HOST is not None:
+        sender = telemetry.Sender(TELEMETRY_NODE, TELEMETRY_HOST, TELEMETRY_PORT)
+    rings = sample.Rings(RING_SIZE)
 
     while True:
         try:
-            #pull data from BME
-            lcd_i2c.lcd_string("      UPDATING      ",LCD_LINE_1)   #display "updating" during thingspeak update
-            (temperature,pressure,humidity)=bme280.readBME280All(BME_ADDR)
-            temperatureF=temperature*(9)/(5)+32
-            #send to thingspeak server
-            sendData(THINGSPEAKURL,THINGSPEAKKEY,'field1','field2','field3','field4',temperature,pressure,humidity,temperatureF)
-            sys.stdout.flush()
-
-            # DO THINGS HERE while Waiting for next ThingsSpeak update
-            for i in range(0,INTERVAL*6):
-  
-                (temperature,pressure,humidity)=bme280.readBME280All(BME_ADDR)
-                temperatureF=temperature*(9)/(5)+32
-                rpm = MAX31790.readRPM(1)
-                #BMP280 TEST
-                sensW.readSensor()
-                print("Pressure   : %s Pa" %sensW.pressure)
-                print("Temperature: %s C" %sensW.temperature)
-
-                #Fan  Speed Control Loop
-                templog = "Temp = {:.2f} F | RPM = {:d}".format(temperatureF,rpm) + " | "
-                if temperatureF > 82:
-                    MAX31790.setPWMTargetDuty(1, 30)            # MAX fan speed
-                    templog = templog + "PWM = 70"
-                    pwm_live = 80
-                    print templog
-                elif temperatureF > 80:
-                    MAX31790.setPWMTargetDuty(1, 40)
-                    templog = templog + "PWM = 60"
-                    pwm_live = 60
-                    print templog
-                elif temperatureF > 76:
-                    MAX31790.setPWMTargetDuty(1, 50)
-                    templog = templog + "PWM = 50"
-                    pwm_live = 50
-                    print templog
-                elif temperatureF > 72:
-                    MAX31790.setPWMTargetDuty(1, 60)
-                    templog = templog + "PWM = 40"
-                    pwm_live = 40
-                    print templog  
-                else:
-                    MAX31790.setPWMTargetDuty(1, 70)              # MIN fan speed
-                    templog = templog + "PWM = 30"
-                    pwm_live = 30
-                    print templog
-                # Refresh LCD screen
-                lcd_i2c.lcd_string("PWM  = {:.0f} | [{}]".format(pwm_live, time.strftime("%H:%M")),LCD_LINE_1)  #update the time         
-                lcd_i2c.lcd_string("Tach = {:d} rpm".format(rpm),LCD_LINE_2)         
-                lcd_i2c.lcd_string("Temp = {:.1f} F | {:.0f}C".format(temperatureF,temperature),LCD_LINE_3)
-                lcd_i2c.lcd_string("Hum  = {:.2f} %".format(humidity),LCD_LINE_4)
+            if not reported and boot.done():
+                printLog(boot.report())
+                reported = True
+            fansUp = boot.ready('max')
+            if not fansUp and boot.failed('max'):
+                # MAX31790 missing at boot or its init failed - try again,
+                # the breaker spaces the attempts out.  Sensing, LCD and
+                # uploads carry on without it
+                fansUp = health.call('max', boot.retry, 'max', initFans, boot, default=False, key='init')
+                if fansUp:
+                    printLog("MAX31790 initialised on retry")
+            if CONTROL_CORE and core is None and fansUp:
+                # The MAX31790 is set up - hand the fans to the core
+                core = controlCore.CoreProcess({'bme' : BME_ADDR, 'channel' : 1, 'safeDuty' : SAFE_DUTY,
+                                                'rampSeconds' : RAMP_SECONDS, 'tuning' : TUNING_PATH,
+                                                'curves' : CURVES_PATH, 'period' : CONTROL_PERIOD,
+                                                'profiles' : controlCore.profileSettings(FAN_PROFILES)},
+                                               log=printLog).start()
+            fromCore = None
+            if core is not None:
+                fromCore = core.latest()
+                if fromCore is None:
+                    time.sleep(1)           # core (re)starting, it holds the fans itself
+                    continue
+                reading = None
+                if not fromCore['safe']:
+                    reading = (fromCore['tempC'], fromCore['pressure'], fromCore['humidity'])
+                rawRPM = fromCore['rpm'] or 0        # None if an old core published NaN
+            else:
+                reading = health.call('bme', bme280.readBME280All, BME_ADDR)
+                rawRPM = health.call('max', MAX31790.readRPM, 1, default=0) if fansUp else 0
+            monitor.check('rpm', rawRPM)
+            rpm = int(bank.update('rpm', rawRPM))
+            if core is None and ramp.busy():
+                health.call('max', ramp.poll)        # logs when the ramp lands
+            # Other tents / channels have their own sensors.  Only after
+            # initFans - its reset would undo their setup on the shared chip
+            if zoneManager is not None and fansUp:
+                zoneManager.poll()
+            #BMP280 - second temperature / pressure source
+            sensW = boot.result('bmp')
+            bmpReading = None
+            if sensW is not None:
+                bmpReading = health.call('bmp', sensW.readSensor)
+                if bmpReading is not None:
+                    bmpReading = (bmpReading[0], bmpReading[1]/100.0)    # Pa -> hPa
+
+            # Checks run on every reading, also the ones not used, so a
+            # flagged sensor can clear itself
+            if irrigator is not None:
+                monitor.check('moisture', irrigator.moisture)
+            if reading is not None:
+                monitor.check('tempC', reading[0])
+                monitor.check('humidity', reading[2])
+                monitor.check('pressure', reading[1])
+                # no BMP280 reading = agreement, an old disagreement clears
+                monitor.agree('temperature', {'bme' : reading[0], 'bmp' : bmpReading and bmpReading[0]})
+                monitor.agree('pressure', {'bme' : reading[1], 'bmp' : bmpReading and bmpReading[1]})
+                if core is None and health.suspect('bme'):
+                    reading = None          # stuck / out of range - don't steer the fans by it
+            if reading is None:
+                # No fresh or trustworthy BME280 data - hold the fans at the safe duty
+                if core is None and fansUp:
+                    safe = dict.fromkeys(set(duty_written) | set([1]), SAFE_DUTY)
+                    health.call('max', ramp.start, safe, 0)     # no ramp
+                    duty_written.update(safe)
+                s = Reading('safe', rpm=rpm, duty=SAFE_DUTY, pwm=controlCore.pwmShown(SAFE_DUTY),
+                           ramping=int(ramp.busy()))
+                rings.add(s)
+                LOG.record('fan', None, s.rpm, s.duty, s.pwm)
+                snap.publish(s.asdict(), s.wall)
                 time.sleep(10)
-        #Error Handling
-        except :
+                continue
+            (temperature,pressure,humidity) = reading
+            # BME280 stays the control temperature, pressure is averaged
+            # and the two are cross-checked
+            (_,pressure,agree) = bmp280.fuse((temperature,pressure), bmpReading)
+            if agree is False:
+                LOG.record('bmp', reading[0], reading[1], bmpReading[0], bmpReading[1])
+            humidity = bank.update('humidity', humidity)
+            metrics = derived.derive(temperature, humidity)     # once per sample
+            s = Reading('bme', tempC=temperature, humidity=humidity, pressure=pressure,
+                        tempF=bank.update('temperatureF', metrics['temperatureF']), vpd=metrics['vpd'],
+                        dewPoint=metrics['dewPoint'], absHumidity=metrics['absHumidity'],
+                        heatIndex=metrics['heatIndex'], rpm=rpm)
+            if bmpReading is not None:
+                s.bmpC, s.bmpHPa = bmpReading
+            if irrigator is not None:
+                s.moisture = irrigator.moisture
+                s.waterL = irrigator.litresToday
+
+            #Fan  Speed Control Loop
+            if fromCore is not None:
+                s.duty, s.pwm = int(fromCore['duty']), int(fromCore['pwm'])     # what the core wrote
+            else:
+                duties = control({'tempF' : s.tempF, 'humidity' : s.humidity, 'vpd' : s.vpd})
+                s.duty = duties.get(1, SAFE_DUTY)
+                s.pwm = controlCore.pwmShown(s.duty)
+                s.ramping = int(ramp.busy())
+            rings.add(s)
+            LOG.record('fan', s.tempF, s.rpm, s.duty, s.pwm)
+            hist.add({'temperature' : s.tempC, 'pressure' : s.pressure,
+                      'humidity' : s.humidity, 'vpd' : s.vpd, 'rpm' : s.rpm}, s.wall)
+            current = s.asdict()
+            if dash is not None:
+                dash.add(current, s.wall)
+            snap.publish(current, s.wall)
+            if sender is not None:
+                sender.add(dict((f, v) for f, v in (('temperature', s.tempC), ('pressure', s.pressure),
+                                                    ('humidity', s.humidity), ('rpm', s.rpm),
+                                                    ('duty', s.duty), ('moisture', s.moisture))
+                                if v is not None), s.wall)
+            # Only touch the registers of channels whose duty changed
+            if core is None and fansUp:
+                changed = dict((ch, d) for ch, d in duties.items() if duty_written.get(ch) != d)
+                if changed:
+                    health.call('max', ramp.start, changed, RAMP_SECONDS)
+                    if health.breakers['max'].failures == 0:
+                        duty_written.update(changed)
+            # Refresh LCD screen
+            if boot.ready('lcd'):
+                health.call('lcd', refreshLCD, s, rings)
+            #send to thingspeak server when something changed (or heartbeat)
+            if policy.check({'temperature' : s.tempC, 'pressure' : s.pressure,
+                             'humidity' : s.humidity, 'vpd' : s.vpd}):
+                sendData(THINGSPEAKURL,THINGSPEAKKEY,s)
+                printLog("Uploads: " + policy.summary())
+                if soilProbe is not None:
+                    st = soilProbe.stats()
+                    printLog("Chirp: awake {:.1f}% | {:d} reads, {:d} waited for wake-up (max {:.2f} s)".format(
+                        st['awake'] * 100, st['reads'], st['lateReads'], st['maxWait']))
+                if fromCore is not None:
+                    printLog("Control core: latency {:.1f} ms (max {:.1f}) | start late max {:.1f} ms | "
+                             "{:d} cycles, {:d} restarts".format(
+                        fromCore['latency'] * 1000, fromCore['maxLatency'] * 1000,
+                        fromCore['maxLateness'] * 1000, int(fromCore['cycles']), core.restarts))
+            time.sleep(10)
+        #Error Handling - device errors are handled by the breakers above,
+        #this only catches bugs in the loop itself
+        except Exception as e:
             errors += 1
-            print "err cnt: {:d}  , delay 5s -> try again".format(errors)
-            #lcd_i2c.lcd_string("   err = {:d}   ERROR".format(errors),LCD_LINE_1)   #display that an error occured      
-            time.sleep(5)
+            printLog("err cnt: {:d} ({}) | {}".format(errors, e, health.status()))
+            time.sleep(1)
             continue
 
 if __name__=="__main__":
@@ -0,0 +1,177 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           growLog.py
+#  Buffered structured logging that is kind to the SD card.
+#
+#  log.record('fan', tempF, rpm, duty) only appends a tuple to a deque.
+#  A background thread turns records into JSON lines and writes them in
+#  batches - when `flushBytes` are waiting or every `flushEvery` seconds -
+#  so the card sees a few large writes instead of one per print.
+#
+#  Each line is a compact array  [unix time, kind, field, field, ...]
+#  The first line of every file maps kinds to field names:
+#    {"schema": {"fan": ["tempF", "rpm", "duty"], ...}}
+#
+#  Files rotate at `maxBytes`; the old file is gzipped to growPi.log.1.gz
+#  and older ones shift up to `backups`.
+#
+#  A failed write (card full, read-only remount) is reported on stderr
+#  and counted in `errors`; its lines are kept and written with the next
+#  batch.
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import collections
+import gzip
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+
+class GrowLog(object):
+
+    def __init__(self, path='growPi.log', schema=None, flushBytes=64 * 1024,
+                 flushEvery=60.0, maxBytes=4 * 1024 * 1024, backups=5,
+                 echo=False):
+        self.path = path
+        self.schema = dict(schema or {})
+        self.flushBytes = flushBytes
+        self.flushEvery = flushEvery
+        self.maxBytes = maxBytes
+        self.backups = backups
+        self.echo = echo               # also print each line (debugging)
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self._queue = collections.deque(maxlen=100000)
+        self._unwritten = []           # lines of a failed write
+        self._wake = threading.Event()
+        self._flushNow = threading.Event()
+        self._stop = threading.Event()
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name='growLog')
+        self._thread.daemon = True
+        self._thread.start()
+
+    # ------------------------------------------------------------ hot path
+    def record(self, kind, *fields):
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1          # writer stuck - oldest record is lost
+        self._queue.append((time.time(), kind, fields))
+
+    def event(self, message):
+        self.record('event', message)
+
+    # ------------------------------------------------------------ writer
+    def _open(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, 'a')
+        if new:
+            self._file.write(json.dumps({'schema' : self.schema}) + '\n')
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            old = '{}.{:d}.gz'.format(self.path, i)
+            if os.path.exists(old):
+                os.rename(old, '{}.{:d}.gz'.format(self.path, i + 1))
+        with open(self.path, 'rb') as src:
+            with gzip.open(self.path + '.1.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        os.remove(self.path)
+        self._open()
+
+    def _drain(self):
+        lines, self._unwritten = self._unwritten, []
+        queue = self._queue
+        while queue:
+            ts, kind, fields = queue.popleft()
+            lines.append(json.dumps([round(ts, 3), kind] + list(fields),
+                                    separators=(',', ':'), default=str))
+        if not lines:
+            return
+        try:
+            if self._file is None:
+                self._open()
+            self._file.write('\n'.join(lines) + '\n')
+            self._file.flush()
+        except (IOError, OSError):
+            # Keep the lines for the next batch, reopen the file then
+            self._unwritten = lines[-self._queue.maxlen:]
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except (IOError, OSError):
+                    pass
+                self._file = None
+            raise
+        self.written += len(lines)
+        if self.echo:
+            print('\n'.join(lines))
+        if self._file.tell() >= self.maxBytes:
+            self._rotate()
+
+    def _pendingBytes(self):
+        # Rough size of what is queued, without formatting it
+        return len(self._queue) * 48
+
+    def _write(self):
+        try:
+            self._drain()
+        except (IOError, OSError) as e:
+            self.errors += 1
+            sys.stderr.write('growLog: {} not written ({})\n'.format(self.path, e))
+
+    def _run(self):
+        lastFlush = time.time()
+        while not self._stop.is_set():
+            self._wake.wait(1.0)
+            self._wake.clear()
+            if (self._flushNow.is_set() or self._pendingBytes() >= self.flushBytes
+                    or time.time() - lastFlush >= self.flushEvery):
+                self._flushNow.clear()
+                self._write()
+                lastFlush = time.time()
+        self._write()
+        if self._file is not None:
+            self._file.close()
+
+    def flush(self):
+        # Ask the writer to write now (e.g. before exit)
+        self._flushNow.set()
+        self._wake.set()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    # Hot path cost: time to record 100k fan samples
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), 'bench.log')
+    log = GrowLog(path, schema={'fan' : ['tempF', 'rpm', 'duty']}, maxBytes=1 << 20)
+    n = 100000
+    start = time.time()
+    for i in range(n):
+        log.record('fan', 77.5, 1200, 50)
+    hot = time.time() - start
+    log.close()
+    files = sorted(os.listdir(os.path.dirname(path)))
+    print("record(): {:.2f} us each | {:d} written | files {}".format(
+        hot / n * 1e6, log.written, files))
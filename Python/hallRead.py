@@ -18,9 +18,11 @@
 #--------------------------------------
 
 # Import required libraries
+import sys
 import time
 import datetime
 import RPi.GPIO as GPIO
+import pulseCounter
 
 def sensorCallback(channel):
   # Called if sensor output changes
@@ -41,6 +43,11 @@ def main():
   # messages.
 
   try:
+    if counter is not None:
+      # Pulse counting mode - report once a second instead of every edge
+      while True :
+        time.sleep(1)
+        print("{:8.1f} Hz | {:d} pulses".format(counter.rate(), counter.total))
     # Loop until users quits with CTRL-C
     while True :
       time.sleep(0.1)
@@ -54,10 +61,16 @@ GPIO.setmode(GPIO.BCM)
 
 print("Setup GPIO pin as input on GPIO17")
 
-# Set Switch GPIO as input
-# Pull high by default
-GPIO.setup(17 , GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.add_event_detect(17, GPIO.BOTH, callback=sensorCallback, bouncetime=200)
+# Run "hallRead.py count" to count pulses (flow meter / tach) instead
+# of printing every edge
+counter = None
+if len(sys.argv) > 1 and sys.argv[1] == 'count':
+  counter = pulseCounter.attach(pulseCounter.PulseCounter(), 17)
+else:
+  # Set Switch GPIO as input
+  # Pull high by default
+  GPIO.setup(17 , GPIO.IN, pull_up_down=GPIO.PUD_UP)
+  GPIO.add_event_detect(17, GPIO.BOTH, callback=sensorCallback, bouncetime=200)
 
 if __name__=="__main__":
    main()
\ No newline at end of file
@@ -0,0 +1,306 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           history.py
+#  Local sensor history with min/max/mean rollups, so questions like
+#  "max temperature per hour last month" are answered on the Pi without
+#  downloading from ThingSpeak.
+#
+#  Raw samples go in a sqlite table; every sample also updates one bucket
+#  per rollup level (1 minute, 1 hour, 1 day) holding min, max, sum and
+#  count.  Buckets are UTC aligned.
+#
+#    series(field, start, end, step)  one row per step, read from the
+#                                     coarsest level that divides `step`
+#    aggregate(field, start, end)     one min/max/mean/count for the range;
+#                                     whole days come from the day level,
+#                                     the ragged ends from hours, minutes
+#                                     and finally raw samples
+#
+#  Usage:
+#    python history.py db field start end [step]   query (unix times)
+#    python history.py bench [days]                insert + query timing
+#    python historyExport.py db out.csv ...        bulk CSV / columnar export
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import os
+import sqlite3
+import sys
+import time
+
+MINUTE = 60
+HOUR   = 3600
+DAY    = 86400
+LEVELS = (MINUTE, HOUR, DAY)       # rollup bucket sizes, finest first
+
+# How long each level is kept by prune() (seconds, None = forever).
+# commit() runs prune() every `pruneEvery` seconds (a day by default)
+RETENTION = {
+    0      : 14 * DAY,             # raw samples
+    MINUTE : 90 * DAY,
+    HOUR   : None,
+    DAY    : None,
+}
+
+
+class History(object):
+
+    def __init__(self, path='history.db', commitEvery=60.0, pruneEvery=DAY):
+        self.path = path
+        self.commitEvery = commitEvery
+        self.pruneEvery = pruneEvery          # None = only when prune() is called
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.db = sqlite3.connect(path)
+        # Write-ahead log: readers (historyExport, the dashboard) never
+        # block the daemon's commits and the other way round
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS samples (field TEXT, ts REAL, value REAL, '
+                        'PRIMARY KEY (field, ts))')
+        self.db.execute('CREATE TABLE IF NOT EXISTS rollups (size INTEGER, field TEXT, '
+                        'bucket INTEGER, min REAL, max REAL, sum REAL, count INTEGER, '
+                        'PRIMARY KEY (size, field, bucket))')
+        self.db.commit()
+        self._pending = []            # (field, ts, value) not yet written
+        self._lastCommit = time.time()
+        self._lastPrune = self._lastCommit
+
+    # ------------------------------------------------------------ writing
+    def add(self, values, ts=None):
+        """Record {field: value} taken at ts (unix time, default now)"""
+        if ts is None:
+            ts = time.time()
+        for field, value in values.items():
+            if value is not None:
+                self._pending.append((field, ts, float(value)))
+        if time.time() - self._lastCommit >= self.commitEvery:
+            self.commit()
+
+    def commit(self):
+        """Write pending samples and fold them into the rollups, and prune
+        once `pruneEvery` has passed"""
+        added = self._write()
+        if self.pruneEvery is not None and self._lastCommit - self._lastPrune >= self.pruneEvery:
+            try:
+                self.prune(self._lastCommit)
+            except sqlite3.OperationalError:
+                pass                          # locked - tried again after pruneEvery
+        return added
+
+    def _write(self):
+        self._lastCommit = time.time()
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, []
+
+        # Fold the batch per bucket first, then touch each bucket once
+        buckets = {}
+        for field, ts, value in pending:
+            for size in LEVELS:
+                key = (size, field, int(ts) // size * size)
+                b = buckets.get(key)
+                if b is None:
+                    buckets[key] = [value, value, value, 1]
+                else:
+                    if value < b[0]:
+                        b[0] = value
+                    if value > b[1]:
+                        b[1] = value
+                    b[2] += value
+                    b[3] += 1
+
+        try:
+            with self.db:
+                cur = self.db.executemany('INSERT OR IGNORE INTO samples VALUES (?, ?, ?)', pending)
+                if cur.rowcount != len(pending) and cur.rowcount >= 0:
+                    # Some samples were already stored (re-import) - only roll
+                    # up the new ones
+                    self.db.rollback()
+                    return self._commitSlow(pending)
+                self._fold(buckets)
+        except sqlite3.OperationalError:
+            # Database locked by another process - keep the batch for the
+            # next commit instead of losing it
+            self._pending = pending + self._pending
+            return 0
+        return len(pending)
+
+    def _commitSlow(self, pending):
+        added = 0
+        with self.db:
+            for field, ts, value in pending:
+                cur = self.db.execute('INSERT OR IGNORE INTO samples VALUES (?, ?, ?)',
+                                      (field, ts, value))
+                if cur.rowcount == 1:
+                    self._fold(dict(((size, field, int(ts) // size * size),
+                                     [value, value, value, 1]) for size in LEVELS))
+                    added += 1
+        return added
+
+    def _fold(self, buckets):
+        rows = [key + tuple(b) for key, b in buckets.items()]
+        self.db.executemany('INSERT OR IGNORE INTO rollups VALUES (?, ?, ?, ?, ?, 0, 0)',
+                            [r[:5] for r in rows])
+        self.db.executemany('UPDATE rollups SET min = MIN(min, ?), max = MAX(max, ?), '
+                            'sum = sum + ?, count = count + ? '
+                            'WHERE size = ? AND field = ? AND bucket = ?',
+                            [r[3:] + r[:3] for r in rows])
+
+    def prune(self, now=None):
+        """Drop raw samples and rollups older than RETENTION"""
+        if now is None:
+            now = time.time()
+        self._lastPrune = time.time()
+        self._write()
+        with self.db:
+            for size, keep in RETENTION.items():
+                if keep is None:
+                    continue
+                if size == 0:
+                    self.db.execute('DELETE FROM samples WHERE ts < ?', (now - keep,))
+                else:
+                    self.db.execute('DELETE FROM rollups WHERE size = ? AND bucket < ?',
+                                    (size, now - keep))
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+    # ------------------------------------------------------------ queries
+    def series(self, field, start, end, step=HOUR):
+        """[(bucket start, min, max, mean, count)] per `step` s in [start, end)"""
+        size = 0
+        for s in LEVELS:
+            if s <= step and step % s == 0:
+                size = s
+        if size == 0:
+            # Finer than a minute - group raw samples
+            rows = self.db.execute(
+                'SELECT CAST(ts / ? AS INTEGER) * ?, MIN(value), MAX(value), SUM(value), COUNT(*) '
+                'FROM samples WHERE field = ? AND ts >= ? AND ts < ? GROUP BY 1 ORDER BY 1',
+                (step, step, field, start, end))
+        else:
+            rows = self.db.execute(
+                'SELECT bucket / ? * ?, MIN(min), MAX(max), SUM(sum), SUM(count) '
+                'FROM rollups WHERE size = ? AND field = ? AND bucket >= ? AND bucket < ? '
+                'GROUP BY 1 ORDER BY 1',
+                (int(step), int(step), size, field, start, end))
+        return [(t, lo, hi, total / n, n) for t, lo, hi, total, n in rows]
+
+    def aggregate(self, field, start, end):
+        """{'min', 'max', 'mean', 'count'} over [start, end)"""
+        lo = hi = None
+        total = 0.0
+        count = 0
+        for size, a, b in _cover(start, end, len(LEVELS) - 1):
+            if size == 0:
+                row = self.db.execute(
+                    'SELECT MIN(value), MAX(value), SUM(value), COUNT(*) FROM samples '
+                    'WHERE field = ? AND ts >= ? AND ts < ?', (field, a, b)).fetchone()
+            else:
+                row = self.db.execute(
+                    'SELECT MIN(min), MAX(max), SUM(sum), SUM(count) FROM rollups '
+                    'WHERE size = ? AND field = ? AND bucket >= ? AND bucket < ?',
+                    (size, field, a, b)).fetchone()
+            if not row[3]:
+                continue
+            lo = row[0] if lo is None else min(lo, row[0])
+            hi = row[1] if hi is None else max(hi, row[1])
+            total += row[2]
+            count += row[3]
+        return {'min' : lo, 'max' : hi,
+                'mean' : total / count if count else None, 'count' : count}
+
+    def fields(self):
+        return [r[0] for r in self.db.execute('SELECT DISTINCT field FROM rollups WHERE size = ?', (DAY,))]
+
+
+def _cover(start, end, level):
+    # Split [start, end) into (size, a, b) pieces: whole buckets of the
+    # coarsest level that fits, the ends recursively from finer levels,
+    # size 0 = raw samples
+    if start >= end:
+        return []
+    if level < 0:
+        return [(0, start, end)]
+    size = LEVELS[level]
+    a = -(-int(start) // size) * size         # first bucket boundary >= start
+    if a < start:
+        a += size
+    b = int(end) // size * size
+    if a >= b:
+        return _cover(start, end, level - 1)
+    return (_cover(start, a, level - 1) + [(size, a, b)]
+            + _cover(b, end, level - 1))
+
+
+def bench(days=31):
+    import math
+    import random
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    hist = History(path, commitEvery=1e9)
+    rnd = random.Random(1)
+    t0 = (int(time.time()) // DAY - days) * DAY
+    n = days * DAY // 10
+    start = time.time()
+    for i in range(n):
+        t = t0 + i * 10
+        hist.add({'temperature' : 24 + 3 * math.sin(2 * math.pi * t / DAY) + rnd.gauss(0, 0.1)}, t)
+        if i % 8640 == 8639:
+            hist.commit()
+    hist.commit()
+    insert = time.time() - start
+    print('{:d} samples ({:d} days at 10 s) inserted in {:.1f} s ({:.0f} us each)'.format(
+        n, days, insert, insert / n * 1e6))
+
+    end = t0 + days * DAY
+    for label, fn in (
+            ('hourly max, month', lambda: hist.series('temperature', t0, end, HOUR)),
+            ('daily series, month', lambda: hist.series('temperature', t0, end, DAY)),
+            ('aggregate, month', lambda: hist.aggregate('temperature', t0 + 1234, end - 567))):
+        start = time.time()
+        result = fn()
+        elapsed = time.time() - start
+        print('  {:22s}: {:7.2f} ms ({} rows)'.format(label, elapsed * 1000,
+                                                    len(result) if isinstance(result, list) else 1))
+    start = time.time()
+    row = hist.db.execute('SELECT MIN(value), MAX(value), AVG(value), COUNT(*) FROM samples '
+                          'WHERE field = ? AND ts >= ? AND ts < ?',
+                          ('temperature', t0 + 1234, end - 567)).fetchone()
+    elapsed = time.time() - start
+    agg = hist.aggregate('temperature', t0 + 1234, end - 567)
+    print('  {:22s}: {:7.2f} ms (same answer: {})'.format(
+        'raw scan, month', elapsed * 1000,
+        row[3] == agg['count'] and abs(row[2] - agg['mean']) < 1e-9 and row[1] == agg['max']))
+    hist.close()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        bench(int(sys.argv[2]) if len(sys.argv) > 2 else 31)
+        return
+    if len(sys.argv) < 5:
+        print('python history.py db field start end [step] | bench [days]')
+        return
+    hist = History(sys.argv[1])
+    field, start, end = sys.argv[2], float(sys.argv[3]), float(sys.argv[4])
+    if len(sys.argv) > 5:
+        for t, lo, hi, mean, n in hist.series(field, start, end, int(sys.argv[5])):
+            print('{} | min {:.2f} | max {:.2f} | mean {:.2f} | n {:d}'.format(
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(t)), lo, hi, mean, n))
+    else:
+        print(hist.aggregate(field, start, end))
+
+if __name__=="__main__":
+   main()
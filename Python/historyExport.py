@@ -0,0 +1,392 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           historyExport.py
+#  Bulk export of history.py's database for offline analysis, instead of
+#  ThingSpeak's CSV download.
+#
+#  Everything is streamed: each field walks the (field, ts) primary key
+#  in time order a PAGE at a time, the fields are merged into rows, and
+#  rows go out in blocks of CHUNK.  Memory stays the same for a day or a
+#  year.  Every page is its own query read to the end (keyset paging), so
+#  no statement stays open on the database between pages and the daemon
+#  can keep committing while a long export runs.
+#
+#    fields=a,b,c      columns (default: every field in the database)
+#    start= / end=     unix time or 'YYYY-MM-DD[ HH:MM]' (local), [start, end)
+#    step=seconds      resample: one row per step.  A multiple of a
+#                      minute reads history.py's rollups (kept longer than
+#                      raw samples), anything else groups raw samples
+#    how=mean          mean / min / max per step (last: raw samples only)
+#
+#  Output by file name:
+#    .csv   time,field,...   unix time, empty = no value
+#    .gpc   columnar, little endian (version 1):
+#              4s 'GPCL' | H version | H n columns | n x 16s names
+#           then blocks of
+#              I rows | rows x d time | per field rows x f (NaN = none)
+#           so a reader can seek straight past the columns it does not
+#           want - columns(path, fields) does that.
+#
+#  Usage:
+#    python historyExport.py db out.csv|out.gpc [fields=..] [start=..]
+#                                     [end=..] [step=..] [how=..]
+#    python historyExport.py bench [days] [fields]   export timing and
+#                                     memory on 1 Hz data (default a year)
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import math
+import os
+import sqlite3
+import struct
+import sys
+import time
+from array import array
+
+import history
+
+CHUNK    = 65536          # rows per write block
+PAGE     = 4096           # rows per query, per field
+MAGIC    = b'GPCL'
+VERSION  = 1
+NAME_LEN = 16
+NAN      = float('nan')
+HOW      = ('mean', 'min', 'max', 'last')
+
+_HEAD  = struct.Struct('<4sHH')
+_BLOCK = struct.Struct('<I')
+_SWAP  = sys.byteorder != 'little'
+
+
+def _paged(db, query, args, start, end):
+    # query orders by its first column, which is unique, and ends with
+    # "first column {} ? AND first column < ? ... LIMIT ?" - each page
+    # starts after the last key of the one before
+    page = db.execute(query.format('>='), args + (start, end, PAGE)).fetchall()
+    while True:
+        for row in page:
+            yield row
+        if len(page) < PAGE:
+            return
+        page = db.execute(query.format('>'), args + (page[-1][0], end, PAGE)).fetchall()
+
+
+def _raw(db, field, start, end):
+    return _paged(db, 'SELECT ts, value FROM samples WHERE field = ? AND ts {} ? AND ts < ? '
+                      'ORDER BY ts LIMIT ?', (field,), start, end)
+
+
+def _resampleRaw(rows, step, how):
+    # Consecutive samples of one field folded per step
+    bucket = None
+    for ts, value in rows:
+        b = ts // step * step
+        if b != bucket:
+            if bucket is not None:
+                yield bucket, (total / n if how == 'mean' else acc)
+            bucket, acc, total, n = b, value, 0.0, 0
+        if how == 'min':
+            if value < acc:
+                acc = value
+        elif how == 'max':
+            if value > acc:
+                acc = value
+        elif how == 'last':
+            acc = value
+        total += value
+        n += 1
+    if bucket is not None:
+        yield bucket, (total / n if how == 'mean' else acc)
+
+
+def _rollups(db, field, start, end, size, step, how):
+    cur = _paged(db, 'SELECT bucket, min, max, sum, count FROM rollups WHERE size = ? AND field = ? '
+                     'AND bucket {} ? AND bucket < ? ORDER BY bucket LIMIT ?', (size, field), start, end)
+    bucket = None
+    for t, lo, hi, total, n in cur:
+        b = t // step * step
+        if b != bucket:
+            if bucket is not None:
+                yield bucket, (acc[2] / acc[3] if how == 'mean' else acc[0] if how == 'min' else acc[1])
+            bucket, acc = b, [lo, hi, total, n]
+        else:
+            if lo < acc[0]:
+                acc[0] = lo
+            if hi > acc[1]:
+                acc[1] = hi
+            acc[2] += total
+            acc[3] += n
+    if bucket is not None:
+        yield bucket, (acc[2] / acc[3] if how == 'mean' else acc[0] if how == 'min' else acc[1])
+
+
+def _merge(sources):
+    # [(t, value)] iterators, each in time order -> (t, [value or None, ...])
+    end = (float('inf'), None)
+    sources = [iter(src) for src in sources]
+    heads = [next(src, end) for src in sources]
+    k = range(len(sources))
+    while True:
+        t = min([head[0] for head in heads])
+        if t == end[0]:
+            return
+        row = []
+        for i in k:
+            head = heads[i]
+            if head[0] == t:
+                row.append(head[1])
+                heads[i] = next(sources[i], end)
+            else:
+                row.append(None)
+        yield t, row
+
+
+def rows(hist, fields=None, start=None, end=None, step=None, how='mean'):
+    """(time, [value per field]) in time order; fields default to all"""
+    if how not in HOW:
+        raise ValueError('how must be one of ' + ', '.join(HOW))
+    db = hist.db
+    if fields is None:
+        fields = sorted(hist.fields())
+    start = -1e18 if start is None else start
+    end = 1e18 if end is None else end
+    size = 0
+    if step and how != 'last':
+        for s in history.LEVELS:
+            if s <= step and step % s == 0:
+                size = s
+    sources = []
+    for field in fields:
+        if size:
+            sources.append(_rollups(db, field, start, end, size, step, how))
+        elif step:
+            sources.append(_resampleRaw(_raw(db, field, start, end), step, how))
+        else:
+            sources.append(_raw(db, field, start, end))
+    return _merge(sources)
+
+
+# ------------------------------------------------------------ writers
+def writeCSV(out, fields, rows):
+    out.write(','.join(['time'] + list(fields)) + '\n')
+    full = '%.3f' + ',%.7g' * len(fields) + '\n'
+    n = 0
+    lines = []
+    for t, values in rows:
+        if None in values:
+            lines.append('%.3f,' % t + ','.join('' if v is None else '%.7g' % v for v in values) + '\n')
+        else:
+            lines.append(full % ((t,) + tuple(values)))
+        if len(lines) == CHUNK:
+            out.write(''.join(lines))
+            n += len(lines)
+            lines = []
+    out.write(''.join(lines))
+    return n + len(lines)
+
+
+def writeColumns(out, fields, rows):
+    out.write(_HEAD.pack(MAGIC, VERSION, len(fields) + 1))
+    for f in ['time'] + list(fields):
+        if len(f.encode()) > NAME_LEN:
+            raise ValueError('field name too long: ' + f)
+        out.write(f.encode().ljust(NAME_LEN, b'\0'))
+    times = []
+    block = []
+    n = 0
+
+    def flush():
+        out.write(_BLOCK.pack(len(times)))
+        # transposed per block, array() converts each column in C
+        for a in [array('d', times)] + [array('f', column) for column in zip(*block)]:
+            if _SWAP:
+                a.byteswap()
+            out.write(a.tobytes() if hasattr(a, 'tobytes') else a.tostring())
+        del times[:]
+        del block[:]
+
+    for t, values in rows:
+        times.append(t)
+        block.append([NAN if v is None else v for v in values] if None in values else values)
+        if len(times) == CHUNK:
+            n += CHUNK
+            flush()
+    if times:
+        n += len(times)
+        flush()
+    return n
+
+
+def columns(path, fields=None):
+    """Blocks of a .gpc file: (times, {field: values}) as arrays, only
+    the fields asked for are read"""
+    with open(path, 'rb') as f:
+        magic, version, count = _HEAD.unpack(f.read(_HEAD.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{}: not a version {:d} export'.format(path, VERSION))
+        names = [f.read(NAME_LEN).rstrip(b'\0').decode() for i in range(count)][1:]
+        want = names if fields is None else list(fields)
+        for name in want:
+            if name not in names:
+                raise KeyError(name)
+        while True:
+            head = f.read(_BLOCK.size)
+            if len(head) < _BLOCK.size:
+                return
+            n = _BLOCK.unpack(head)[0]
+            times = array('d')
+            times.fromfile(f, n)
+            block = {}
+            for name in names:
+                if name in want:
+                    a = array('f')
+                    a.fromfile(f, n)
+                    if _SWAP:
+                        a.byteswap()
+                    block[name] = a
+                else:
+                    f.seek(4 * n, 1)
+            if _SWAP:
+                times.byteswap()
+            yield times, block
+
+
+def export(hist, path, fields=None, start=None, end=None, step=None, how='mean'):
+    """Write rows() to path (.csv or .gpc), returns the row count"""
+    if fields is None:
+        fields = sorted(hist.fields())
+    source = rows(hist, fields, start, end, step, how)
+    if path.endswith('.gpc'):
+        with open(path, 'wb') as out:
+            return writeColumns(out, fields, source)
+    with open(path, 'w') as out:
+        return writeCSV(out, fields, source)
+
+
+def _time(value):
+    try:
+        return float(value)
+    except ValueError:
+        for fmt in ('%Y-%m-%d %H:%M', '%Y-%m-%d'):
+            try:
+                return time.mktime(time.strptime(value, fmt))
+            except ValueError:
+                pass
+    raise ValueError('not a time: ' + value)
+
+
+# ------------------------------------------------------------ bench
+def _fill(path, days, fields):
+    # A year at 1 Hz is far past history.py's raw retention - bulk load
+    # raw samples directly, then build the rollups in SQL
+    history.History(path).close()
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA journal_mode = OFF')
+    db.execute('PRAGMA synchronous = OFF')
+    t0 = (int(time.time()) // history.DAY - days) * history.DAY
+    n = days * history.DAY
+    for j, field in enumerate(fields):
+        base = 20.0 + 10 * j
+        with db:
+            db.executemany('INSERT INTO samples VALUES (?, ?, ?)',
+                           ((field, t0 + i + 0.25, base + 3 * math.sin(i * 7.27e-5) + (i * 7919 % 101) * 0.001)
+                            for i in range(n)))
+    with db:
+        for size in history.LEVELS:
+            db.execute('INSERT INTO rollups SELECT ?, field, CAST(ts / ? AS INTEGER) * ?, '
+                       'MIN(value), MAX(value), SUM(value), COUNT(*) FROM samples GROUP BY 2, 3',
+                       (size, size, size))
+    db.close()
+    return t0, t0 + n
+
+
+def _timed(path, out, kwargs, queue):
+    import resource
+    hist = history.History(path)
+    start = time.time()
+    n = export(hist, out, **kwargs)
+    queue.put((n, time.time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def bench(days=365, count=5):
+    import multiprocessing
+    import tempfile
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'year.db')
+    fields = ['temperature', 'humidity', 'pressure', 'vpd', 'rpm'][:count]
+    start = time.time()
+    t0, t1 = _fill(path, days, fields)
+    print('{:d} days x {:d} fields at 1 Hz: {:d} samples, {:.1f} GB, filled in {:.0f} s'.format(
+        days, len(fields), days * history.DAY * len(fields), os.path.getsize(path) / 1e9,
+        time.time() - start))
+
+    runs = (('csv, all raw rows', 'all.csv', {}),
+            ('gpc, all raw rows', 'all.gpc', {}),
+            ('gpc, one week raw', 'week.gpc', {'start' : t1 - 7 * history.DAY}),
+            ('gpc, 2 fields raw', 'two.gpc', {'fields' : fields[:2]}),
+            ('csv, 10 s mean (raw)', 'ten.csv', {'step' : 10}),
+            ('csv, 5 min max (rollups)', 'five.csv', {'step' : 300, 'how' : 'max'}))
+    for label, name, kwargs in runs:
+        out = os.path.join(folder, name)
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=_timed, args=(path, out, kwargs, queue))
+        proc.start()
+        n, elapsed, rss = queue.get()
+        proc.join()
+        print('  {:26s}: {:9d} rows in {:6.1f} s ({:7.0f} k rows/s) | {:7.1f} MB | peak RSS {:5.1f} MB'.format(
+            label, n, elapsed, n / elapsed / 1e3, os.path.getsize(out) / 1e6, rss / 1024.0))
+
+    # Column reads of the columnar file, and a check against the db
+    start = time.time()
+    total = 0.0
+    n = 0
+    for times, block in columns(os.path.join(folder, 'all.gpc'), [fields[0]]):
+        total += sum(block[fields[0]])
+        n += len(times)
+    elapsed = time.time() - start
+    hist = history.History(path)
+    agg = hist.aggregate(fields[0], t0, t1)
+    print('  read one column of all.gpc: {:.1f} s, {:d} values, mean {:.4f} (db {:.4f})'.format(
+        elapsed, n, total / n, agg['mean']))
+    hist.close()
+    for name in os.listdir(folder):
+        os.remove(os.path.join(folder, name))
+    os.rmdir(folder)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        bench(int(sys.argv[2]) if len(sys.argv) > 2 else 365,
+              int(sys.argv[3]) if len(sys.argv) > 3 else 5)
+        return
+    if len(sys.argv) < 3:
+        print('python historyExport.py db out.csv|out.gpc [fields=a,b] [start=..] [end=..] '
+              '[step=s] [how=mean|min|max|last] | bench [days] [fields]')
+        return
+    options = dict(arg.split('=', 1) for arg in sys.argv[3:])
+    kwargs = {}
+    if 'fields' in options:
+        kwargs['fields'] = options['fields'].split(',')
+    for key in ('start', 'end'):
+        if key in options:
+            kwargs[key] = _time(options[key])
+    if 'step' in options:
+        kwargs['step'] = int(options['step'])
+    if 'how' in options:
+        kwargs['how'] = options['how']
+    hist = history.History(sys.argv[1])
+    start = time.time()
+    n = export(hist, sys.argv[2], **kwargs)
+    print('{:d} rows to {} in {:.1f} s'.format(n, sys.argv[2], time.time() - start))
+
+if __name__=="__main__":
+   main()
@@ -0,0 +1,305 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           irrigation.py
+#  Soil moisture driven watering with pulsed dosing.
+#
+#  Runs in its own thread so pump timing does not depend on the 10 s
+#  sensor loop:
+#    idle     - check moisture every `checkEvery` s, start dosing below `low` %
+#    dose     - pump on for `pulse` s
+#    settle   - pump off, wait `settle` s for the water to reach the probe
+#               then re-read; dose again until moisture reaches `high` %
+#    fault    - moisture did not rise by `minRise` % over `maxDryPulses`
+#               pulses (empty reservoir, blocked line, probe out of soil) -
+#               pump stays off until reset().  `maxSensorErrors` failed
+#               reads in a row are a fault too, cleared by the next good
+#               read (checked every `checkEvery` s)
+#  No dosing starts while `mayDose()` says no (e.g. the probe's readings
+#  look stuck or out of range).
+#  The daily volume cap stops dosing until local midnight.  With a
+#  `statePath` the day's volume survives a restart.
+#
+#  Volume is measured with a pulseCounter.FlowMeter when one is given,
+#  otherwise estimated from pump time x `flowRate`.
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import datetime
+import json
+import os
+import threading
+import time
+
+try:
+    _now = time.monotonic
+except AttributeError:       # Python 2
+    _now = time.time
+
+IDLE   = 'idle'
+DOSE   = 'dose'
+SETTLE = 'settle'
+FAULT  = 'fault'
+CAPPED = 'capped'
+
+
+class IrrigationController(object):
+
+    def __init__(self, readMoisture, pumpPin=13, low=35.0, high=45.0,
+                 pulse=5.0, settle=120.0, checkEvery=60.0, flowRate=1.5,
+                 dailyCap=2.0, minRise=1.0, maxDryPulses=4, flowMeter=None,
+                 log=None, nextRead=None, maxSensorErrors=3, statePath=None,
+                 mayDose=None):
+        """
+        readMoisture - function returning soil moisture in %
+        flowRate     - pump flow in L/min, used when there is no flowMeter
+        dailyCap     - litres per day
+        nextRead     - called with the monotonic time of the next moisture
+                       read, so a sleeping probe can be woken ahead of it
+        statePath    - json file keeping today's litres across restarts
+        mayDose      - returns False while the moisture readings are not
+                       to be trusted
+        """
+        self.readMoisture = readMoisture
+        self.pumpPin = pumpPin
+        self.low = low
+        self.high = high
+        self.pulse = pulse
+        self.settle = settle
+        self.checkEvery = checkEvery
+        self.flowRate = flowRate
+        self.dailyCap = dailyCap
+        self.minRise = minRise
+        self.maxDryPulses = maxDryPulses
+        self.maxSensorErrors = maxSensorErrors
+        self.statePath = statePath
+        self.mayDose = mayDose
+        self.flowMeter = flowMeter
+        self.log = log
+        self.nextRead = nextRead
+
+        self.state = IDLE
+        self.moisture = None
+        self.fault = None
+        self.hold = False            # manual override (push button)
+        self.litresToday = 0.0
+        self.pulses = 0
+        self.pulseErrors = []        # actual - requested pump-on time (s)
+        self._day = datetime.date.today()
+        self._sensorErrors = 0       # failed reads in a row
+        self._sensorFault = False
+        self._distrusted = False
+        self._dryPulses = 0
+        self._startMoisture = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._load()
+
+    # ------------------------------------------------------------ state file
+    def _load(self):
+        if self.statePath is None:
+            return
+        try:
+            with open(self.statePath) as f:
+                saved = json.load(f)
+            if saved['date'] == self._day.isoformat():
+                self.litresToday = float(saved['litres'])
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def _save(self):
+        if self.statePath is None:
+            return
+        try:
+            folder = os.path.dirname(self.statePath)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            tmp = self.statePath + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'date' : self._day.isoformat(), 'litres' : self.litresToday}, f)
+            os.rename(tmp, self.statePath)
+        except (IOError, OSError) as e:
+            self._say('state not saved: {}'.format(e))
+
+    # ------------------------------------------------------------ pump
+    def _pump(self, on):
+        import RPi.GPIO as GPIO
+        GPIO.output(self.pumpPin, 1 if on else 0)
+
+    def _dosePulse(self):
+        # Pump on for exactly `pulse` seconds against the monotonic clock
+        meterStart = self.flowMeter.litres() if self.flowMeter else None
+        start = _now()
+        self._pump(True)
+        try:
+            self._stop.wait(self.pulse)
+        finally:
+            if not self.hold:        # button pressed mid-pulse - leave it on
+                self._pump(False)
+        onTime = _now() - start
+        self.pulseErrors.append(onTime - self.pulse)
+        del self.pulseErrors[:-100]
+        if meterStart is not None:
+            litres = self.flowMeter.litres() - meterStart
+        else:
+            litres = onTime * self.flowRate / 60.0
+        self.litresToday += litres
+        self.pulses += 1
+        self._save()
+        return litres
+
+    # ------------------------------------------------------------ control
+    def _say(self, message):
+        if self.log is not None:
+            self.log("irrigation: " + message)
+
+    def _read(self):
+        try:
+            self.moisture = self.readMoisture()
+        except Exception as e:
+            self.moisture = None
+            self._sensorErrors += 1
+            if self._sensorErrors >= self.maxSensorErrors and self.state != FAULT:
+                self._setFault('sensor error: {} ({:d} reads in a row)'.format(e, self._sensorErrors))
+                self._sensorFault = True
+            elif self._sensorErrors < self.maxSensorErrors:
+                self._say('sensor error: {}'.format(e))
+            return None
+        self._sensorErrors = 0
+        if self._sensorFault:
+            self._say('sensor back ({:.1f}%) - fault cleared'.format(self.moisture))
+            self.reset()
+        return self.moisture
+
+    def _trusted(self):
+        # Ask mayDose(), say so once when it changes its mind
+        ok = self.mayDose is None or self.mayDose()
+        if ok == self._distrusted:
+            self._distrusted = not ok
+            self._say('moisture readings suspect - not dosing' if not ok
+                      else 'moisture readings trusted again')
+        return ok
+
+    def _setFault(self, reason):
+        self.state = FAULT
+        self.fault = reason
+        self._say('FAULT - ' + reason)
+
+    def step(self):
+        """Run one state transition, returns seconds until the next one"""
+        today = datetime.date.today()
+        if today != self._day:
+            self._day = today
+            self.litresToday = 0.0
+            self._save()
+            if self.state == CAPPED:
+                self.state = IDLE
+
+        if self.hold:
+            return self.checkEvery
+
+        if self.state == FAULT:
+            if self._sensorFault:
+                self._read()         # a good read clears it
+            return self.checkEvery
+
+        if self.state == CAPPED:
+            return self.checkEvery
+
+        if self.state == IDLE:
+            moisture = self._read()
+            if moisture is None or moisture >= self.low or not self._trusted():
+                return self.checkEvery
+            self._startMoisture = moisture
+            self._dryPulses = 0
+            self.state = DOSE
+            self._say('moisture {:.1f}% < {:.1f}% - start dosing'.format(moisture, self.low))
+
+        if self.state == DOSE:
+            if not self._trusted():
+                self.state = IDLE
+                return self.checkEvery
+            if self.litresToday >= self.dailyCap:
+                self.state = CAPPED
+                self._say('daily cap {:.2f} L reached'.format(self.dailyCap))
+                return self.checkEvery
+            litres = self._dosePulse()
+            self._say('pulse {:d}: {:.3f} L ({:.2f} L today)'.format(self.pulses, litres, self.litresToday))
+            self.state = SETTLE
+            return self.settle
+
+        if self.state == SETTLE:
+            moisture = self._read()
+            if moisture is None:
+                return self.checkEvery
+            if moisture >= self.high:
+                self.state = IDLE
+                self._say('moisture {:.1f}% - done'.format(moisture))
+                return self.checkEvery
+            if moisture - self._startMoisture < self.minRise:
+                self._dryPulses += 1
+                if self._dryPulses >= self.maxDryPulses:
+                    self._setFault('moisture stuck at {:.1f}% after {:d} pulses'.format(moisture, self._dryPulses))
+                    return self.checkEvery
+            else:
+                self._startMoisture = moisture
+                self._dryPulses = 0
+            self.state = DOSE
+            return 0.0
+        return self.checkEvery
+
+    def reset(self):
+        # Clear a fault (after refilling the reservoir etc.)
+        self.fault = None
+        self._sensorFault = False
+        self.state = IDLE
+
+    # ------------------------------------------------------------ thread
+    def _willRead(self):
+        # The next step() reads the probe
+        return (self.state in (IDLE, SETTLE) or self._sensorFault) and not self.hold
+
+    def _run(self):
+        deadline = _now()
+        while not self._stop.is_set():
+            try:
+                delay = self.step()
+            except Exception as e:
+                if not self.hold:
+                    self._pump(False)
+                self._setFault('controller error: {}'.format(e))
+                delay = self.checkEvery
+            deadline = max(deadline + delay, _now())
+            if self.nextRead is not None and self._willRead():
+                self.nextRead(deadline)
+            self._stop.wait(max(0.0, deadline - _now()))
+        self._pump(False)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='irrigation')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def status(self):
+        return {
+            'state'       : self.state,
+            'moisture'    : self.moisture,
+            'fault'       : self.fault,
+            'hold'        : self.hold,
+            'litresToday' : self.litresToday,
+            'pulses'      : self.pulses,
+            'maxPulseErr' : max([abs(e) for e in self.pulseErrors] or [0.0]),
+        }
@@ -0,0 +1,177 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           pulseCounter.py
+#  Count hall-effect / flow meter pulses on a GPIO input and estimate
+#  frequency without allocating or printing on every edge.
+#
+#  Edge timestamps go into a fixed-size array ring buffer.  Two estimators
+#  are available:
+#    - windowed   : edges seen in the last N seconds / N  (good at high rates)
+#    - reciprocal : (edges - 1) / time between first and last edge kept in
+#                   the buffer (good at low rates, resolution of one period)
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from array import array
+import threading
+import time
+
+try:
+    _now = time.monotonic
+except AttributeError:       # Python 2
+    _now = time.time
+
+DEFAULT_DEPTH = 4096   # edges kept (~1 s of history at 4 kHz)
+
+
+class PulseCounter(object):
+    """Ring buffer of edge timestamps plus a running total count.
+
+    The edge callback only stores a float into a preallocated array and
+    bumps two integers under an uncontended lock, so it is safe to call at a
+    few kHz from the RPi.GPIO event thread.
+    """
+
+    def __init__(self, depth=DEFAULT_DEPTH):
+        self.depth = depth
+        self._stamps = array('d', [0.0]) * depth
+        self._head = 0           # next write index
+        self.total = 0           # edges since reset()
+        self._lock = threading.Lock()
+
+    def edge(self, channel=None):
+        # GPIO callback - keep this as small as possible.  The lock keeps
+        # reset() and _window() from seeing a half-written edge
+        with self._lock:
+            self._stamps[self._head] = _now()
+            self._head = (self._head + 1) % self.depth
+            self.total += 1
+
+    def reset(self):
+        with self._lock:
+            self._head = 0
+            self.total = 0
+
+    def _window(self):
+        # Returns (stamps oldest -> newest) as a copy taken under the lock
+        with self._lock:
+            n = min(self.total, self.depth)
+            head = self._head
+            if n < self.depth:
+                return self._stamps[:n]
+            return self._stamps[head:] + self._stamps[:head]
+
+    def frequency(self, window=1.0, now=None):
+        """Windowed estimate: edges in the last `window` seconds / window (Hz)"""
+        if now is None:
+            now = _now()
+        start = now - window
+        stamps = self._window()
+        n = len(stamps)
+        count = 0
+        for i in range(n - 1, -1, -1):
+            if stamps[i] < start:
+                break
+            count += 1
+        if count == self.depth:
+            # Buffer is shorter than the window - measure over the buffer
+            span = stamps[-1] - stamps[0]
+            return (n - 1) / span if span > 0 else 0.0
+        return count / float(window)
+
+    def reciprocal(self, maxAge=2.0, now=None):
+        """Reciprocal estimate from the period of the buffered edges (Hz).
+
+        Only edges younger than `maxAge` seconds are used; returns 0.0 when
+        fewer than two such edges exist (stalled input).
+        """
+        if now is None:
+            now = _now()
+        stamps = self._window()
+        n = len(stamps)
+        if n < 2 or now - stamps[-1] > maxAge:
+            return 0.0
+        first = n - 1
+        oldest = now - maxAge
+        while first > 0 and stamps[first - 1] >= oldest:
+            first -= 1
+        edges = n - 1 - first
+        if edges < 1:
+            return 0.0
+        span = stamps[-1] - stamps[first]
+        return edges / span if span > 0 else 0.0
+
+    def rate(self, window=1.0, lowRate=20.0, now=None):
+        """Pick the estimator that suits the input rate.
+
+        Below `lowRate` Hz the windowed count only has a handful of edges so
+        the reciprocal estimate is more precise.
+        """
+        freq = self.frequency(window, now)
+        if freq < lowRate:
+            return self.reciprocal(now=now)
+        return freq
+
+
+class FlowMeter(PulseCounter):
+    """PulseCounter that converts pulses into water volume.
+
+    pulsesPerLitre is the K-factor printed on the flow sensor
+    (e.g. 450 for the common YF-S201).
+    """
+
+    def __init__(self, pulsesPerLitre=450.0, depth=DEFAULT_DEPTH):
+        PulseCounter.__init__(self, depth)
+        self.pulsesPerLitre = float(pulsesPerLitre)
+
+    def litres(self):
+        # Total volume since reset()
+        return self.total / self.pulsesPerLitre
+
+    def litresPerMinute(self, window=1.0):
+        return self.rate(window) * 60.0 / self.pulsesPerLitre
+
+
+def attach(counter, pin, edge=None, pull=None):
+    # Hook a PulseCounter to a BCM pin.  No bouncetime: hall and flow sensors
+    # have clean push-pull / open-collector outputs and debounce would cap
+    # the countable rate.
+    import RPi.GPIO as GPIO
+    if edge is None:
+        edge = GPIO.FALLING
+    if pull is None:
+        pull = GPIO.PUD_UP
+    GPIO.setup(pin, GPIO.IN, pull_up_down=pull)
+    GPIO.add_event_detect(pin, edge, callback=counter.edge)
+    return counter
+
+
+def detach(pin):
+    import RPi.GPIO as GPIO
+    GPIO.remove_event_detect(pin)
+
+
+"""
+def main():
+  # Print flow from a YF-S201 on GPIO17 every second
+  import RPi.GPIO as GPIO
+  GPIO.setmode(GPIO.BCM)
+  meter = attach(FlowMeter(450), 17)
+  try:
+    while True:
+      time.sleep(1)
+      print "{:6.1f} Hz | {:5.2f} L/min | {:7.3f} L".format(
+        meter.rate(), meter.litresPerMinute(), meter.litres())
+  except KeyboardInterrupt:
+    GPIO.cleanup()
+
+if __name__=="__main__":
+   main()
+"""
@@ -0,0 +1,219 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           relayScheduler.py
+#  Time based control of the board's relays (lights, fan, pump).
+#
+#  Schedules
+#    Photoperiod('06:00', 18)     on at 06:00 local time for 18 h every day
+#    Cycle(on=900, off=2700)      15 min on / 45 min off, forever
+#    OneShot(at, duration)        on once from `at` (unix time) for duration s
+#
+#  Every schedule can say what state it is in at any time (stateAt) and
+#  when it next changes (nextChange).  So
+#    - the scheduler keeps one heap entry per schedule, keyed by its next
+#      change; a tick only pops what is due, O(log n) each
+#    - after a restart each relay is set from stateAt(now), nothing is
+#      replayed
+#  A relay with several schedules is on while any of them is on.
+#
+#  Switching latency (time the relay was set - time it was due) is kept
+#  for every change.
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import datetime
+import heapq
+import threading
+import time
+
+DAY = 86400
+
+
+def _localMidnight(t):
+    d = datetime.datetime.fromtimestamp(t).date()
+    return time.mktime(datetime.datetime.combine(d, datetime.time()).timetuple())
+
+
+class Photoperiod(object):
+    def __init__(self, on='06:00', hours=18.0):
+        h, m = on.split(':')
+        self.onSec = int(h) * 3600 + int(m) * 60
+        self.duration = hours * 3600.0
+
+    def _windows(self, t):
+        # on/off windows starting yesterday, today and tomorrow (local time,
+        # so DST days are handled by mktime)
+        midnight = _localMidnight(t)
+        for days in (-1, 0, 1, 2):
+            day = _localMidnight(midnight + days * DAY + 3600 * 3)
+            start = day + self.onSec
+            yield start, start + self.duration
+
+    def stateAt(self, t):
+        for start, end in self._windows(t):
+            if start <= t < end:
+                return True
+        return False
+
+    def nextChange(self, t):
+        best = None
+        for start, end in self._windows(t):
+            for edge in (start, end):
+                if edge > t and (best is None or edge < best):
+                    best = edge
+        return best
+
+
+class Cycle(object):
+    def __init__(self, on, off, anchor=0.0):
+        self.on = float(on)
+        self.period = float(on + off)
+        self.anchor = anchor
+
+    def stateAt(self, t):
+        return (t - self.anchor) % self.period < self.on
+
+    def nextChange(self, t):
+        phase = (t - self.anchor) % self.period
+        if phase < self.on:
+            return t + self.on - phase
+        return t + self.period - phase
+
+
+class OneShot(object):
+    def __init__(self, at, duration):
+        self.at = at
+        self.end = at + duration
+
+    def stateAt(self, t):
+        return self.at <= t < self.end
+
+    def nextChange(self, t):
+        if t < self.at:
+            return self.at
+        if t < self.end:
+            return self.end
+        return None           # finished - dropped from the heap
+
+
+def gpioRelay(pins):
+    # Returns setRelay(name, on) driving BCM pins {name: pin}
+    import RPi.GPIO as GPIO
+    for pin in pins.values():
+        GPIO.setup(pin, GPIO.OUT)
+    def setRelay(name, on):
+        GPIO.output(pins[name], 1 if on else 0)
+    return setRelay
+
+
+class RelayScheduler(object):
+
+    def __init__(self, setRelay, clock=time.time, log=None):
+        self.setRelay = setRelay
+        self.clock = clock
+        self.log = log
+        self.schedules = {}       # relay -> [schedule]
+        self.state = {}           # relay -> bool
+        self.latency = []         # seconds late for each switch (last 1000)
+        self._heap = []
+        self._count = 0           # heap tie breaker
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def add(self, relay, schedule):
+        with self._lock:
+            self.schedules.setdefault(relay, []).append(schedule)
+            now = self.clock()
+            self._push(relay, schedule, now)
+            self._apply(relay, now, now)
+        self._wake.set()
+        return schedule
+
+    def _push(self, relay, schedule, now):
+        due = schedule.nextChange(now)
+        if due is not None:
+            self._count += 1
+            heapq.heappush(self._heap, (due, self._count, relay, schedule))
+
+    def _apply(self, relay, now, due):
+        on = any(s.stateAt(now) for s in self.schedules[relay])
+        if self.state.get(relay) != on:
+            self.setRelay(relay, on)
+            self.state[relay] = on
+            late = self.clock() - due
+            self.latency.append(late)
+            del self.latency[:-1000]
+            if self.log is not None:
+                self.log("relay {} {} ({:+.1f} ms)".format(relay, 'ON' if on else 'OFF', late * 1000))
+
+    def resync(self):
+        # Set every relay from its schedules - used at start up
+        with self._lock:
+            now = self.clock()
+            for relay in self.schedules:
+                self.state.pop(relay, None)
+                self._apply(relay, now, now)
+
+    def tick(self):
+        """Apply everything that is due, returns the next due time or None"""
+        with self._lock:
+            now = self.clock()
+            while self._heap and self._heap[0][0] <= now:
+                due, n, relay, schedule = heapq.heappop(self._heap)
+                self._apply(relay, max(now, due), due)
+                self._push(relay, schedule, max(now, due))
+            return self._heap[0][0] if self._heap else None
+
+    def latencyStats(self):
+        if not self.latency:
+            return {'count' : 0, 'mean' : 0.0, 'max' : 0.0}
+        return {'count' : len(self.latency),
+                'mean'  : sum(self.latency) / len(self.latency),
+                'max'   : max(self.latency)}
+
+    def _run(self):
+        self.resync()
+        while not self._stop.is_set():
+            due = self.tick()
+            delay = 60.0 if due is None else max(0.0, due - self.clock())
+            self._wake.wait(min(delay, 60.0))   # re-check at least every minute
+            self._wake.clear()
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name='relays')
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+if __name__ == "__main__":
+    # Benchmark: 500 schedules, simulated clock, one day in 1 s ticks
+    clock = [time.time()]
+    switches = [0]
+    def setRelay(name, on):
+        switches[0] += 1
+    sched = RelayScheduler(setRelay, clock=lambda: clock[0])
+    for i in range(500):
+        if i % 2:
+            sched.add('r{}'.format(i), Cycle(60 + i, 120 + i))
+        else:
+            sched.add('r{}'.format(i), Photoperiod('{:02d}:{:02d}'.format(i % 24, i % 60), 12))
+    start = time.time()
+    for s in range(DAY):
+        clock[0] += 1
+        sched.tick()
+    elapsed = time.time() - start
+    print("{:d} ticks, {:d} switches in {:.2f} s ({:.1f} us/tick)".format(
+        DAY, switches[0], elapsed, elapsed / DAY * 1e6))
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           reportPolicy.py
+#  Decides when a reading is worth uploading to ThingSpeak.
+#
+#  A post is sent when
+#    - a field moved past its deadband since the last post (absolute and/or
+#      relative), no more often than `interval` seconds
+#    - a field moved `burst` x its deadband (fast change) - then posts may
+#      go out every `minInterval` seconds (ThingSpeak's rate limit)
+#    - nothing was sent for `heartbeat` seconds, so a quiet tent still
+#      shows it is alive
+#  Everything else is suppressed and counted.
+#
+#  python reportPolicy.py trace.csv   replays a recorded trace (csv with a
+#                                     unix time column then one column per
+#                                     field) and prints upload volume and
+#                                     worst-case error vs posting everything
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import collections
+import time
+
+# field -> (absolute deadband, relative deadband or None)
+DEFAULT_DEADBANDS = {
+    'temperature' : (0.3, None),     # C
+    'humidity'    : (1.0, None),     # %
+    'pressure'    : (0.5, None),     # hPa
+    'vpd'         : (0.05, None),    # kPa
+}
+
+
+class ReportPolicy(object):
+
+    def __init__(self, deadbands=DEFAULT_DEADBANDS, interval=60, minInterval=15,
+                 heartbeat=900, burst=4.0):
+        self.deadbands = dict(deadbands)
+        self.interval = interval
+        self.minInterval = minInterval
+        self.heartbeat = heartbeat
+        self.burst = burst
+        self.last = {}           # field -> last reported value
+        self.lastSent = None
+        self.stats = collections.Counter()
+
+    def _excess(self, field, value):
+        # How many deadbands the field has moved since the last report
+        old = self.last.get(field)
+        if old is None:
+            return float('inf')
+        absBand, relBand = self.deadbands.get(field, (0.0, None))
+        band = absBand
+        if relBand is not None:
+            band = max(band, abs(old) * relBand) if band else abs(old) * relBand
+        delta = abs(value - old)
+        if band <= 0:
+            return float('inf') if delta > 0 else 0.0
+        return delta / band
+
+    def check(self, values, now=None):
+        """True if `values` should be sent now (recorded as the last report)"""
+        if now is None:
+            now = time.time()
+        if self.lastSent is None:
+            return self._send('first', values, now)
+        elapsed = now - self.lastSent
+        if elapsed >= self.heartbeat:
+            return self._send('heartbeat', values, now)
+        if elapsed >= self.minInterval:
+            worst = max(self._excess(f, v) for f, v in values.items())
+            if worst >= self.burst:
+                return self._send('burst', values, now)
+            if worst > 1.0 and elapsed >= self.interval:
+                return self._send('change', values, now)
+        self.stats['suppressed'] += 1
+        return False
+
+    def _send(self, reason, values, now):
+        self.stats['sent'] += 1
+        self.stats[reason] += 1
+        self.last.update(values)
+        self.lastSent = now
+        return True
+
+    def summary(self):
+        total = self.stats['sent'] + self.stats['suppressed']
+        return "sent {:d} / {:d} ({:.0f}% suppressed) | {}".format(
+            self.stats['sent'], total,
+            100.0 * self.stats['suppressed'] / total if total else 0.0,
+            ", ".join("{} {:d}".format(k, self.stats[k])
+                      for k in ('first', 'change', 'burst', 'heartbeat')))
+
+
+def replay(rows, policy, interval=60):
+    """Run a trace [(ts, {field: value}), ...] through a policy.
+
+    Returns (policy, baseline posts, worst error, baseline worst error),
+    where the baseline posts every `interval` seconds like sendData() used
+    to and the error per field is the largest gap between a value and the
+    last one reported.
+    """
+    worst = collections.defaultdict(float)
+    baseWorst = collections.defaultdict(float)
+    baseLast = {}
+    baseline = 0
+    nextBaseline = None
+    for ts, values in rows:
+        if nextBaseline is None or ts >= nextBaseline:
+            baseline += 1
+            nextBaseline = ts + interval
+            baseLast.update(values)
+        policy.check(values, ts)
+        for f, v in values.items():
+            worst[f] = max(worst[f], abs(v - policy.last[f]))
+            baseWorst[f] = max(baseWorst[f], abs(v - baseLast[f]))
+    return policy, baseline, dict(worst), dict(baseWorst)
+
+
+def readTrace(path):
+    import csv
+    with open(path) as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        fields = header[1:]
+        for row in reader:
+            yield float(row[0]), dict((k, float(v)) for k, v in zip(fields, row[1:]) if v != '')
+
+
+def syntheticTrace(hours=24, step=10):
+    # Day/night temperature swing, sensor noise and a door-open event
+    import math
+    import random
+    rnd = random.Random(1)
+    for i in range(int(hours * 3600 / step)):
+        t = i * step
+        temp = 24 + 3 * math.sin(2 * math.pi * t / 86400) + rnd.gauss(0, 0.05)
+        hum = 55 - 5 * math.sin(2 * math.pi * t / 86400) + rnd.gauss(0, 0.3)
+        if 43200 <= t < 43800:
+            temp -= 4
+            hum -= 10
+        yield t, {'temperature' : temp, 'humidity' : hum}
+
+
+if __name__=="__main__":
+    import sys
+    rows = readTrace(sys.argv[1]) if len(sys.argv) > 1 else syntheticTrace()
+    policy, baseline, worst, baseWorst = replay(rows, ReportPolicy())
+    print("every-interval posts : {:d}".format(baseline))
+    print("policy               : " + policy.summary())
+    print("upload volume        : {:.0f}% of baseline".format(
+        100.0 * policy.stats['sent'] / baseline if baseline else 0.0))
+    for f in sorted(worst):
+        print("worst error {:11s}: {:.2f} (every-interval {:.2f}, deadband {})".format(
+            f, worst[f], baseWorst[f], policy.deadbands.get(f, (0,))[0]))
@@ -0,0 +1,196 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           sample.py
+#  One reading of everything, shared by control, display, logging and
+#  upload instead of loose variables.
+#
+#    Reading = schema('Reading', ['tempC', 'humidity', 'rpm', ...])
+#    s = Reading('bme', tempC=24.3, humidity=55.1)
+#    s.tempC, s.mono (monotonic time), s.wall (unix time), s.source
+#
+#  A schema is a Sample subclass with __slots__ for exactly its fields -
+#  no per-sample dict - and a struct for pack() / unpack() (missing
+#  values travel as NaN).
+#
+#  Rings keeps the last `size` values of every field in typed arrays.
+#  append is O(1), and each value is written twice (at i and i + size) so
+#  the last n values are always one contiguous slice: window(n) hands
+#  back memoryviews of the arrays, nothing is copied.
+#
+#  python sample.py   append / window timing and allocations per sample
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import math
+import struct
+import time
+from array import array
+
+try:
+    _now = time.monotonic
+except AttributeError:       # Python 2
+    _now = time.time
+
+NAN = float('nan')
+
+try:
+    memoryview(array('d', [0.0]))
+    def _view(a, start, end):
+        return memoryview(a)[start:end]
+except TypeError:            # Python 2 arrays have no memoryview - copy
+    def _view(a, start, end):
+        return a[start:end]
+
+
+class Sample(object):
+    __slots__ = ('mono', 'wall', 'source')
+    fields = ()
+    _struct = struct.Struct('<dd')
+
+    def __init__(self, source='', mono=None, wall=None, **values):
+        self.mono = _now() if mono is None else mono
+        self.wall = time.time() if wall is None else wall
+        self.source = source
+        for f in self.fields:
+            setattr(self, f, values.pop(f, None))
+        if values:
+            raise TypeError('{} has no field {}'.format(type(self).__name__, sorted(values)[0]))
+
+    def get(self, field, default=None):
+        v = getattr(self, field, None)
+        return default if v is None else v
+
+    def asdict(self):
+        return dict((f, getattr(self, f)) for f in self.fields)
+
+    def pack(self):
+        return self._struct.pack(self.mono, self.wall,
+                                 *[NAN if v is None else v for v in (getattr(self, f) for f in self.fields)])
+
+    @classmethod
+    def unpack(cls, data, source=''):
+        row = cls._struct.unpack(data)
+        s = cls(source, row[0], row[1])
+        for f, v in zip(cls.fields, row[2:]):
+            setattr(s, f, None if math.isnan(v) else v)
+        return s
+
+    def __repr__(self):
+        return '{}({!r}, {})'.format(type(self).__name__, self.source,
+                                     ', '.join('{}={!r}'.format(f, getattr(self, f)) for f in self.fields))
+
+
+def schema(name, fields):
+    """Sample subclass with one slot per field"""
+    fields = tuple(fields)
+    return type(name, (Sample,), {'__slots__' : fields, 'fields' : fields,
+                                  '_struct' : struct.Struct('<dd' + 'd' * len(fields))})
+
+
+class Ring(object):
+    """Last `size` (monotonic time, value) pairs of one channel"""
+
+    def __init__(self, size=360, typecode='d'):
+        self.size = size
+        self.times = array('d', [0.0]) * (2 * size)
+        self.values = array(typecode, [0]) * (2 * size)
+        self.head = 0                 # next slot, 0 .. size-1
+        self.count = 0
+
+    def append(self, t, x):
+        h = self.head
+        self.times[h] = self.times[h + self.size] = t
+        self.values[h] = self.values[h + self.size] = x
+        self.head = h + 1 if h + 1 < self.size else 0
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def window(self, n=None):
+        """(times, values) of the last n entries, oldest first, as views"""
+        held = min(self.count, self.size)
+        n = held if n is None else min(n, held)
+        end = self.head + self.size
+        return _view(self.times, end - n, end), _view(self.values, end - n, end)
+
+    def last(self):
+        if not self.count:
+            return None
+        return self.values[self.head + self.size - 1]
+
+
+class Rings(object):
+    """One Ring per field, filled from Samples"""
+
+    def __init__(self, size=360):
+        self.size = size
+        self.rings = {}
+
+    def add(self, sample):
+        rings = self.rings
+        t = sample.mono
+        for f in sample.fields:
+            v = getattr(sample, f)
+            ring = rings.get(f)
+            if ring is None:
+                ring = rings[f] = Ring(self.size)
+            ring.append(t, NAN if v is None else v)
+
+    def __getitem__(self, field):
+        return self.rings[field]
+
+    def __contains__(self, field):
+        return field in self.rings
+
+    def window(self, field, n=None):
+        return self.rings[field].window(n)
+
+
+def bench(n=20000):
+    Reading = schema('Reading', ['tempC', 'tempF', 'humidity', 'pressure', 'vpd', 'rpm', 'duty', 'pwm'])
+    rings = Rings(360)
+    values = dict((f, 1.5) for f in Reading.fields)
+
+    start = _now()
+    for i in range(n):
+        rings.add(Reading('loop', **values))
+    elapsed = _now() - start
+    print('Reading + Rings.add: {:.1f} us per sample'.format(elapsed / n * 1e6))
+
+    start = _now()
+    for i in range(n):
+        times, temps = rings.window('tempC', 60)
+    elapsed = _now() - start
+    print('window(60)         : {:.2f} us ({})'.format(elapsed / n * 1e6, type(temps).__name__))
+
+    import sys
+    s = Reading('loop', **values)
+    d = dict(values, mono=0.0, wall=0.0, source='loop')
+    print('Reading {:d} bytes, the same values in a dict {:d} bytes'.format(
+        sys.getsizeof(s), sys.getsizeof(d)))
+    try:
+        import tracemalloc
+    except ImportError:
+        return
+    tracemalloc.start()
+    rings.add(Reading('loop', **values))       # warm up
+    before = tracemalloc.take_snapshot()
+    for i in range(1000):
+        rings.add(Reading('loop', **values))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    grown = sum(stat.size_diff for stat in after.compare_to(before, 'lineno'))
+    print('memory kept after 1000 more samples: {:d} bytes (rings are preallocated)'.format(grown))
+
+if __name__=="__main__":
+   bench()
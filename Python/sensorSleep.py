@@ -0,0 +1,203 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           sensorSleep.py
+#  Deep sleep between readings without paying the wake-up stall.
+#
+#  A Chirp in deep sleep needs about a second after the wake command
+#  before it measures properly, and Chirp.wake_up() sleeps through that
+#  second on every read.  Here the reader says when it will read next
+#  (plan()); a WakeScheduler thread sends the wake command `wakeTime`
+#  ahead of that, so by the time read() is called the sensor is up and
+#  the read does not block.  After the read the sensor goes straight back
+#  to sleep.  A read that arrives before the sensor is ready (unplanned,
+#  or planned too late) waits out the remainder and is counted.
+#
+#  stats() gives the awake fraction (what the probe draws awake power
+#  for) and the time reads spent waiting for a wake-up.
+#
+#  python sensorSleep.py   compares blocking wake_up() reads with
+#                          scheduled wakes on a dummy sensor
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import heapq
+import threading
+import time
+
+try:
+    _now = time.monotonic
+except AttributeError:       # Python 2
+    _now = time.time
+
+MARGIN = 0.05            # s extra before wakeTime, covers thread wake-up jitter
+
+
+class SleepySensor(object):
+
+    def __init__(self, wake, sleep, wakeTime=1.0, name='sensor'):
+        """
+        wake     - sends the wake command, must not wait (Chirp.send_wake)
+        sleep    - sends the sensor to deep sleep (Chirp.sleep)
+        wakeTime - s from the wake command until readings are good
+        """
+        self._wakeCmd = wake
+        self._sleepCmd = sleep
+        self.wakeTime = wakeTime
+        self.name = name
+        self._lock = threading.Lock()
+        self.awake = False            # unknown after a restart - treat as asleep
+        self.wokeAt = None
+        self.planned = None           # read time the pending wake is for
+        self.started = _now()
+        self.awakeSeconds = 0.0
+        self.reads = 0
+        self.lateReads = 0
+        self.waited = 0.0
+        self.maxWait = 0.0
+
+    def wake(self):
+        with self._lock:
+            if not self.awake:
+                self._wakeCmd()
+                self.awake = True
+                self.wokeAt = _now()
+
+    def read(self, fn, *args):
+        """fn(*args) with the sensor awake, then back to sleep"""
+        with self._lock:
+            if not self.awake:
+                self._wakeCmd()                # nobody planned this read
+                self.awake = True
+                self.wokeAt = _now()
+            wait = self.wokeAt + self.wakeTime - _now()
+            if wait > 0:
+                time.sleep(wait)
+                self.lateReads += 1
+                self.waited += wait
+                self.maxWait = max(self.maxWait, wait)
+            self.reads += 1
+            self.planned = None
+            try:
+                return fn(*args)
+            finally:
+                try:
+                    self._sleepCmd()
+                finally:
+                    self.awake = False
+                    self.awakeSeconds += _now() - self.wokeAt
+
+    def stats(self):
+        # Under the lock, so a read in progress is counted whole
+        with self._lock:
+            now = _now()
+            awake = self.awakeSeconds
+            if self.awake:
+                awake += now - self.wokeAt
+            elapsed = max(now - self.started, 1e-9)
+            return {
+                'reads'     : self.reads,
+                'lateReads' : self.lateReads,
+                'meanWait'  : self.waited / self.reads if self.reads else 0.0,
+                'maxWait'   : self.maxWait,
+                'awake'     : awake / elapsed,           # fraction of time awake
+            }
+
+
+class WakeScheduler(object):
+    """One thread sending planned wake commands for any number of sensors"""
+
+    def __init__(self):
+        self._heap = []                 # (wake time, n, sensor, read time)
+        self._n = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def plan(self, sensor, at):
+        """The next read of `sensor` will be at monotonic time `at`"""
+        with self._cond:
+            sensor.planned = at
+            self._n += 1
+            heapq.heappush(self._heap, (at - sensor.wakeTime - MARGIN, self._n, sensor, at))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if self._heap:
+                        delay = self._heap[0][0] - _now()
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+                if self._stopping:
+                    return
+                _, _, sensor, at = heapq.heappop(self._heap)
+                if sensor.planned != at:
+                    continue                    # replanned or already read
+            try:
+                sensor.wake()
+            except Exception:
+                pass                            # read() wakes it late instead
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sensor-wake')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def demo(reads=10, every=0.5, wakeTime=0.2):
+    def dummyRead():
+        time.sleep(0.005)                  # about a Chirp capacitance read
+        return 42
+
+    # Blocking: sleep(), then wake_up() stalls for wakeTime on each read
+    stall = 0.0
+    start = _now()
+    for i in range(reads):
+        t = _now()
+        time.sleep(wakeTime)
+        dummyRead()
+        stall += _now() - t - 0.005
+        time.sleep(max(0.0, start + (i + 1) * every - _now()))
+    print('wake_up() per read: {:.0f} ms stall per read'.format(stall / reads * 1000))
+
+    wakes = WakeScheduler().start()
+    sensor = SleepySensor(lambda: None, lambda: None, wakeTime, 'dummy')
+    start = _now()
+    latency = 0.0
+    for i in range(reads):
+        if i:
+            deadline = start + i * every
+            time.sleep(max(0.0, deadline - _now()))
+        t = _now()
+        sensor.read(dummyRead)
+        latency += _now() - t
+        wakes.plan(sensor, start + (i + 1) * every)
+    wakes.stop()
+    s = sensor.stats()
+    print('scheduled wakes   : {:.1f} ms per read, {:d} of {:d} reads waited (the first is unplanned), '
+          'awake {:.0f}% of the time'.format(latency / reads * 1000, s['lateReads'], s['reads'],
+                                             s['awake'] * 100))
+
+if __name__=="__main__":
+   demo()
@@ -0,0 +1,255 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           snapshot.py
+#  Latest readings for other programs on the Pi, without touching I2C.
+#
+#  fullbucket_v3 publish()es every sample into a small memory mapped file
+#  (on /dev/shm, so nothing reaches the SD card).  Any number of local
+#  readers map the same file and read it with plain memory loads - no
+#  locks, no syscalls, no bus contention.
+#
+#  Layout (little endian, version 1)
+#     0  4s   magic  'GPSN' ('GONE' once the writer has replaced the file)
+#     4  H    layout version
+#     6  H    n    number of fields
+#     8  Q    seq  odd while the writer is mid-update
+#    16  n x 16s   field names (NUL padded)
+#    ..  n x d     values, NaN = no reading
+#  The first field is always 'time' (unix time of the sample).
+#
+#  Consistency is a seqlock: the writer bumps seq to odd, writes the
+#  values, bumps it to even.  A reader copies the values and keeps the
+#  copy only if seq was even and unchanged around it.
+#
+#    snap = snapshot.Reader()
+#    snap.get('tempF')  ->  77.4         snap.read() -> {'time': ..., ...}
+#
+#  python snapshot.py [path]          print the current snapshot
+#  python snapshot.py bench           writer / reader timing
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+
+PATH     = '/dev/shm/growPi.snap'
+MAGIC    = b'GPSN'
+GONE     = b'GONE'
+VERSION  = 1
+NAME_LEN = 16
+
+_HEAD = struct.Struct('<4sHHQ')
+_SEQ  = struct.Struct('<Q')
+_SEQ_AT = 8
+NAN = float('nan')
+
+
+class Busy(Exception):
+    """The writer kept updating while we tried to read"""
+
+
+def _size(count):
+    return _HEAD.size + count * (NAME_LEN + 8)
+
+
+class Snapshot(object):
+    """The writer side - one per file, publish() from one thread"""
+
+    def __init__(self, fields, path=PATH):
+        self.fields = ('time',) + tuple(f for f in fields if f != 'time')
+        for f in self.fields:
+            if len(f.encode()) > NAME_LEN:
+                raise ValueError('field name too long: ' + f)
+        self.path = path
+        self.index = dict((f, i) for i, f in enumerate(self.fields))
+        self._values = struct.Struct('<{:d}d'.format(len(self.fields)))
+        self._offset = _HEAD.size + len(self.fields) * NAME_LEN
+        self.seq = 0
+        self._row = [NAN] * len(self.fields)
+        self.mm = self._open()
+
+    def _open(self):
+        count = len(self.fields)
+        names = b''.join(f.encode().ljust(NAME_LEN, b'\0') for f in self.fields)
+        try:
+            # Same layout already there (daemon restart) - keep the file
+            # so running readers carry on
+            with open(self.path, 'r+b') as f:
+                mm = mmap.mmap(f.fileno(), 0)
+            if (len(mm) == _size(count) and _HEAD.unpack_from(mm, 0)[:3] == (MAGIC, VERSION, count)
+                    and mm[_HEAD.size:self._offset] == names):
+                self.seq = _SEQ.unpack_from(mm, _SEQ_AT)[0] & ~1
+                return mm
+            old = mm
+        except (IOError, OSError, ValueError):
+            old = None
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_HEAD.pack(MAGIC, VERSION, count, 0) + names
+                    + self._values.pack(*([NAN] * count)))
+        os.rename(tmp, self.path)
+        if old is not None:
+            old[0:4] = GONE            # readers of the old file reopen
+            old.close()
+        with open(self.path, 'r+b') as f:
+            return mmap.mmap(f.fileno(), 0)
+
+    def publish(self, values, ts=None):
+        """Write {field: value}; fields not given are NaN"""
+        row = self._row
+        for i in range(1, len(row)):
+            row[i] = NAN
+        row[0] = time.time() if ts is None else ts
+        index = self.index
+        for field, value in values.items():
+            i = index.get(field)
+            if i is not None and value is not None:
+                row[i] = value
+        mm = self.mm
+        self.seq += 1
+        _SEQ.pack_into(mm, _SEQ_AT, self.seq)               # odd: writing
+        self._values.pack_into(mm, self._offset, *row)
+        self.seq += 1
+        _SEQ.pack_into(mm, _SEQ_AT, self.seq)
+
+    def close(self):
+        self.mm.close()
+
+
+class Reader(object):
+    """The reader side.  Cheap to keep open; read() only touches memory."""
+
+    def __init__(self, path=PATH, retries=1000):
+        self.path = path
+        self.retries = retries
+        self.mm = None
+        self._open()
+
+    def _open(self):
+        if self.mm is not None:
+            self.mm.close()
+        with open(self.path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, seq = _HEAD.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{}: not a version {:d} snapshot'.format(self.path, VERSION))
+        self.count = count
+        self.fields = tuple(n.rstrip(b'\0').decode()
+                            for n in struct.unpack_from('<' + '{:d}s'.format(NAME_LEN) * count,
+                                                        self.mm, _HEAD.size))
+        self.index = dict((f, i) for i, f in enumerate(self.fields))
+        self._values = struct.Struct('<{:d}d'.format(count))
+        self._offset = _HEAD.size + count * NAME_LEN
+
+    def values(self):
+        """Consistent tuple of all values, in self.fields order"""
+        mm = self.mm
+        unpack = self._values.unpack_from
+        tries = 0
+        while tries < self.retries:
+            tries += 1
+            seq = _SEQ.unpack_from(mm, _SEQ_AT)[0]
+            if seq & 1:
+                time.sleep(0)        # writer mid-update, let it finish
+                continue
+            row = unpack(mm, self._offset)
+            if _SEQ.unpack_from(mm, _SEQ_AT)[0] == seq:
+                if mm[0:4] != MAGIC:
+                    self._open()               # writer replaced the file
+                    return self.values()
+                self.seq = seq
+                return row
+        raise Busy(self.path)
+
+    def read(self):
+        """{field: value}, None where there is no reading"""
+        return dict((f, None if math.isnan(v) else v) for f, v in zip(self.fields, self.values()))
+
+    def get(self, field):
+        v = self.values()[self.index[field]]
+        return None if math.isnan(v) else v
+
+    def age(self):
+        """Seconds since the last publish (by the reader's clock)"""
+        return time.time() - self.values()[0]
+
+    def close(self):
+        self.mm.close()
+
+
+def bench(n=100000):
+    import multiprocessing
+    import tempfile
+    fields = ('tempC', 'tempF', 'humidity', 'pressure', 'vpd', 'rpm', 'duty', 'pwm', 'moisture')
+    path = os.path.join(tempfile.mkdtemp(), 'bench.snap')
+    snap = Snapshot(fields, path)
+    values = dict((f, float(i)) for i, f in enumerate(fields))
+    start = time.time()
+    for i in range(n):
+        snap.publish(values)
+    print('publish : {:.2f} us'.format((time.time() - start) / n * 1e6))
+    reader = Reader(path)
+    start = time.time()
+    for i in range(n):
+        reader.values()
+    print('values(): {:.2f} us'.format((time.time() - start) / n * 1e6))
+    start = time.time()
+    for i in range(n):
+        reader.get('tempF')
+    print('get()   : {:.2f} us'.format((time.time() - start) / n * 1e6))
+
+    # Writer in another process publishing ~10000 times a second (the
+    # daemon does once per 10 s) - every read must see one whole sample
+    snap.publish(dict((f, 0.0) for f in fields))
+    snap.close()
+    writer = multiprocessing.Process(target=_busyWriter, args=(fields, path))
+    writer.start()
+    torn = 0
+    try:
+        for i in range(n):
+            row = reader.values()
+            if len(set(row[1:])) != 1:
+                torn += 1
+    finally:
+        writer.terminate()
+        writer.join()
+    print('torn reads with a busy writer: {:d} of {:d}'.format(torn, n))
+    reader.close()
+
+
+def _busyWriter(fields, path):
+    snap = Snapshot(fields, path)
+    i = 0
+    while True:
+        i += 1
+        snap.publish(dict((f, float(i)) for f in fields))
+        time.sleep(0.0001)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        bench()
+        return
+    reader = Reader(sys.argv[1] if len(sys.argv) > 1 else PATH)
+    print('{:d} s old'.format(int(reader.age())))
+    for field, value in sorted(reader.read().items()):
+        print('  {:12s} {}'.format(field, value))
+
+if __name__=="__main__":
+   main()
@@ -0,0 +1,181 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           telemetry.py
+#  Compact binary telemetry frames, sent from each Pi to a local collector
+#  (telemetryCollector.py) instead of one HTTPS post per reading.
+#
+#  Frame (big endian)
+#    header  20 bytes  magic 'GP' | version u8 | flags u8 | node u32 |
+#                      epoch u32 | seq u32 | sample count u16 |
+#                      field count u8 | pad u8
+#    sample  8 + 4*F   timestamp ms u64 | F x float32 (NaN = no value)
+#    crc     4 bytes   crc32 of header + samples
+#
+#  epoch is the sender's start time (unix s): seq starts again at 0 after
+#  a restart, so the collector tells frames apart by (node, epoch, seq).
+#  Version 1 frames have no epoch (16 byte header) and decode as epoch 0.
+#
+#  Fields are listed in FIELDS, in order.  Adding a field means a new
+#  version; receivers ignore trailing fields they don't know.
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import socket
+import struct
+import time
+import zlib
+
+MAGIC   = b'GP'
+VERSION = 2
+
+FIELDS = ('temperature', 'pressure', 'humidity', 'rpm', 'duty',
+          'moisture', 'soilTemp', 'light')
+
+HEADER = struct.Struct('>2sBBIIIHBB')
+HEADER_V1 = struct.Struct('>2sBBIIHBB')
+CRC    = struct.Struct('>I')
+NAN    = float('nan')
+
+MAX_SAMPLES = 1024          # keeps a UDP frame well under 64 kB
+
+
+class FrameError(ValueError):
+    pass
+
+
+def _sampleStruct(fieldCount, _cache={}):
+    s = _cache.get(fieldCount)
+    if s is None:
+        s = _cache[fieldCount] = struct.Struct('>Q{:d}f'.format(fieldCount))
+    return s
+
+
+def frameSize(count, fieldCount=len(FIELDS), version=VERSION):
+    header = HEADER_V1 if version == 1 else HEADER
+    return header.size + count * _sampleStruct(fieldCount).size + CRC.size
+
+
+def encode(node, seq, samples, fields=FIELDS, epoch=0):
+    """Pack [(unix time, {field: value}), ...] into one frame (bytes)"""
+    if len(samples) > MAX_SAMPLES:
+        raise FrameError('too many samples in one frame ({:d})'.format(len(samples)))
+    sample = _sampleStruct(len(fields))
+    parts = [HEADER.pack(MAGIC, VERSION, 0, node, epoch & 0xFFFFFFFF, seq & 0xFFFFFFFF,
+                         len(samples), len(fields), 0)]
+    for ts, values in samples:
+        parts.append(sample.pack(int(ts * 1000),
+                                 *[values.get(f, NAN) for f in fields]))
+    body = b''.join(parts)
+    return body + CRC.pack(zlib.crc32(body) & 0xFFFFFFFF)
+
+
+def decodeHeader(data):
+    """Returns (node, epoch, seq, count, fieldCount, frame size in bytes),
+    raises FrameError"""
+    if len(data) < HEADER_V1.size:
+        raise FrameError('short header')
+    magic, version = struct.unpack_from('>2sB', data)
+    if magic != MAGIC:
+        raise FrameError('bad magic')
+    if version == 1:
+        magic, version, flags, node, seq, count, fieldCount, pad = HEADER_V1.unpack_from(data)
+        epoch = 0
+    elif version == VERSION:
+        if len(data) < HEADER.size:
+            raise FrameError('short header')
+        magic, version, flags, node, epoch, seq, count, fieldCount, pad = HEADER.unpack_from(data)
+    else:
+        raise FrameError('unsupported version {:d}'.format(version))
+    return node, epoch, seq, count, fieldCount, frameSize(count, fieldCount, version)
+
+
+def decode(data):
+    """Unpack a frame -> (node, epoch, seq, [(ms timestamp, (values...)), ...])
+
+    Values are in FIELDS order, NaN where the node had no value.
+    """
+    node, epoch, seq, count, fieldCount, size = decodeHeader(data)
+    if len(data) != size:
+        raise FrameError('length {:d} != {:d}'.format(len(data), size))
+    crc, = CRC.unpack_from(data, size - CRC.size)
+    if zlib.crc32(data[:size - CRC.size]) & 0xFFFFFFFF != crc:
+        raise FrameError('crc mismatch')
+    sample = _sampleStruct(fieldCount)
+    known = min(fieldCount, len(FIELDS))
+    samples = []
+    offset = size - CRC.size - count * sample.size
+    for i in range(count):
+        row = sample.unpack_from(data, offset)
+        samples.append((row[0], row[1:1 + known]))
+        offset += sample.size
+    return node, epoch, seq, samples
+
+
+class Sender(object):
+    """Batches samples on the node and ships them as frames.
+
+    proto 'udp' sends each frame as one datagram; 'tcp' keeps a connection
+    open and reconnects on the next flush after an error.  Frames that
+    could not be sent are kept (up to `backlog`) and retried in order.
+    """
+
+    def __init__(self, node, host='127.0.0.1', port=5005, proto='udp',
+                 batch=60, backlog=100, epoch=None):
+        self.node = node
+        self.epoch = int(time.time()) if epoch is None else epoch
+        self.addr = (host, port)
+        self.proto = proto
+        self.batch = batch
+        self.backlog = backlog
+        self.seq = 0
+        self.sent = 0
+        self.dropped = 0
+        self._samples = []
+        self._pending = []
+        self._sock = None
+
+    def add(self, values, ts=None):
+        self._samples.append((time.time() if ts is None else ts, values))
+        if len(self._samples) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self._samples:
+            self._pending.append(encode(self.node, self.seq, self._samples, epoch=self.epoch))
+            self.seq += 1
+            self._samples = []
+        if len(self._pending) > self.backlog:
+            self.dropped += len(self._pending) - self.backlog
+            del self._pending[:-self.backlog]
+        while self._pending:
+            try:
+                self._send(self._pending[0])
+            except (socket.error, OSError):
+                self.close()
+                return False
+            self._pending.pop(0)
+            self.sent += 1
+        return True
+
+    def _send(self, frame):
+        if self._sock is None:
+            if self.proto == 'tcp':
+                self._sock = socket.create_connection(self.addr, 5)
+            else:
+                self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.proto == 'tcp':
+            self._sock.sendall(frame)
+        else:
+            self._sock.sendto(frame, self.addr)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
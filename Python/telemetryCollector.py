@@ -0,0 +1,269 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           telemetryCollector.py
+#  Receives telemetry frames (telemetry.py) from many growPi nodes over UDP
+#  and TCP on the same port, drops duplicate frames (by node, sender epoch
+#  and sequence number), puts samples back in time order and stores them
+#  in a local sqlite database.
+#
+#  Usage:
+#    python telemetryCollector.py [db] [port]      run the collector
+#    python telemetryCollector.py bench [nodes] [frames] [udp|tcp]
+#                                                  loopback throughput test
+#
+#  The bench floods the collector far faster than real nodes (1 frame/min
+#  each), so udp runs drop frames once the socket buffer fills - raise
+#  net.core.rmem_max or use tcp for bulk backfills.
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+from __future__ import print_function
+
+import collections
+import heapq
+import select
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+import telemetry
+
+REORDER_MS = 5000       # samples are held this long so late frames slot in
+DEDUPE     = 1024       # frame sequence numbers remembered per node
+
+
+class Collector(object):
+    """UDP + TCP frame receiver writing ordered, de-duplicated samples"""
+
+    def __init__(self, dbPath='telemetry.db', host='0.0.0.0', port=5005,
+                 reorderMs=REORDER_MS):
+        self.reorderMs = reorderMs
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        self.udp.bind((host, port))
+        self.port = self.udp.getsockname()[1]
+        self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.tcp.bind((host, self.port))
+        self.tcp.listen(64)
+        self._streams = {}                # tcp socket -> receive buffer
+        self._seen = {}                   # node -> (epoch, set, deque of seqs)
+        self._heap = []                   # (ts ms, node, values)
+        self._running = False
+        self.stats = collections.Counter()
+        self.lastStored = None            # time rows were last written
+
+        self.dbPath = dbPath
+        self.db = None
+
+    def _openDb(self):
+        # sqlite connections must stay on the thread that uses them
+        self.db = sqlite3.connect(self.dbPath)
+        cols = ', '.join('{} REAL'.format(f) for f in telemetry.FIELDS)
+        self.db.execute('CREATE TABLE IF NOT EXISTS samples (node INTEGER, ts INTEGER, '
+                        + cols + ', PRIMARY KEY (node, ts))')
+        self.db.commit()
+
+    def handleFrame(self, data):
+        try:
+            node, epoch, seq, samples = telemetry.decode(data)
+        except telemetry.FrameError:
+            self.stats['bad'] += 1
+            return
+        seen = self._seen.get(node)
+        if seen is None or epoch > seen[0]:
+            # First frame, or the node restarted and seq began again at 0
+            seen = self._seen[node] = (epoch, set(), collections.deque())
+        if epoch == seen[0]:
+            if seq in seen[1]:
+                self.stats['duplicate'] += 1
+                return
+            seen[1].add(seq)
+            seen[2].append(seq)
+            if len(seen[2]) > DEDUPE:
+                seen[1].discard(seen[2].popleft())
+        # a late frame from before the restart is not tracked, the
+        # (node, ts) key still drops its samples if they are repeats
+        self.stats['frames'] += 1
+        self.stats['samples'] += len(samples)
+        for ts, values in samples:
+            heapq.heappush(self._heap, (ts, node, values))
+
+    def flush(self, force=False):
+        """Write samples older than the reorder window (all if force)"""
+        watermark = int(time.time() * 1000) - self.reorderMs
+        rows = []
+        heap = self._heap
+        while heap and (force or heap[0][0] <= watermark):
+            ts, node, values = heapq.heappop(heap)
+            rows.append((node, ts) + tuple(values)
+                        + (None,) * (len(telemetry.FIELDS) - len(values)))
+        if rows:
+            marks = ', '.join('?' * (2 + len(telemetry.FIELDS)))
+            self.db.executemany('INSERT OR IGNORE INTO samples VALUES (' + marks + ')', rows)
+            self.db.commit()
+            self.stats['stored'] += len(rows)
+            self.lastStored = time.time()
+        return len(rows)
+
+    def _readStream(self, sock):
+        try:
+            data = sock.recv(65536)
+        except socket.error:
+            data = b''
+        if not data:
+            del self._streams[sock]
+            sock.close()
+            return
+        buf = self._streams[sock] + data
+        while len(buf) >= telemetry.HEADER.size:
+            try:
+                node, epoch, seq, count, fieldCount, size = telemetry.decodeHeader(buf)
+            except telemetry.FrameError:
+                # Lost framing - drop the connection, the node reconnects
+                self.stats['bad'] += 1
+                del self._streams[sock]
+                sock.close()
+                return
+            if len(buf) < size:
+                break
+            self.handleFrame(buf[:size])
+            buf = buf[size:]
+        self._streams[sock] = buf
+
+    def serveOnce(self, timeout=1.0):
+        ready, _, _ = select.select([self.udp, self.tcp] + list(self._streams), [], [], timeout)
+        for sock in ready:
+            if sock is self.udp:
+                # drain everything already queued before going back to select
+                while True:
+                    try:
+                        data = self.udp.recv(65536, socket.MSG_DONTWAIT)
+                    except socket.error:
+                        break
+                    self.handleFrame(data)
+            elif sock is self.tcp:
+                conn, addr = self.tcp.accept()
+                self._streams[conn] = b''
+                self.stats['connections'] += 1
+            else:
+                self._readStream(sock)
+
+    def serveForever(self, flushEvery=1.0):
+        self._openDb()
+        self._running = True
+        nextFlush = time.time() + flushEvery
+        while self._running:
+            self.serveOnce(flushEvery)
+            if time.time() >= nextFlush:
+                self.flush()
+                nextFlush = time.time() + flushEvery
+        self.flush(force=True)
+        self.db.close()
+
+    def stop(self):
+        self._running = False
+
+
+def _simulateNodes(port, nodes, frames, proto, t0):
+    # Runs in its own process so senders don't share the collector's GIL
+    senders = [telemetry.Sender(n, port=port, proto=proto, batch=60)
+               for n in range(nodes)]
+    for f in range(frames):
+        for s in senders:
+            samples = [(t0 + f * 3600 + i * 60 + s.node * 0.001,
+                        {'temperature' : 24.0, 'humidity' : 55.0, 'rpm' : 1200})
+                       for i in range(60)]
+            for ts, values in samples:
+                s.add(values, ts=ts)          # 60th sample flushes the frame
+            if f % 10 == 0:
+                s._send(telemetry.encode(s.node, s.seq - 1, samples, epoch=s.epoch))
+        time.sleep(0.01)
+    for s in senders:
+        s.close()
+
+
+def bench(nodes=300, frames=20, proto='udp'):
+    # Simulate `nodes` growPis each sending `frames` frames of 60 samples
+    # (one hour at 1/min) to a collector on loopback, with every 10th frame
+    # sent twice to exercise de-duplication.
+    import multiprocessing
+    import os
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    collector = Collector(path, host='127.0.0.1', port=0, reorderMs=0)
+    thread = threading.Thread(target=collector.serveForever, args=(0.2,))
+    thread.start()
+
+    start = time.time()
+    sim = multiprocessing.Process(target=_simulateNodes,
+                                  args=(collector.port, nodes, frames, proto,
+                                        start - frames * 3600))
+    sim.start()
+    sent = nodes * frames
+    dups = nodes * ((frames + 9) // 10)
+    sim.join()
+    # Wait for the collector to catch up: every frame in, or every tcp
+    # stream read to its end.  udp may have dropped some, so a udp run
+    # also ends after 5 s without a new frame.
+    deadline = time.time() + 120
+    last, quiet = -1, time.time()
+    while time.time() < deadline:
+        received = collector.stats['frames']
+        if received >= sent:
+            break
+        if proto == 'tcp':
+            if collector.stats['connections'] >= nodes and not collector._streams:
+                break
+        elif received != last:
+            last, quiet = received, time.time()
+        elif time.time() - quiet >= 5.0:
+            break
+        time.sleep(0.1)
+    collector.stop()
+    thread.join()
+    elapsed = (collector.lastStored or time.time()) - start
+
+    db = sqlite3.connect(path)
+    rows = db.execute('SELECT COUNT(*) FROM samples').fetchone()[0]
+    lastTs = {}
+    ordered = 0
+    for node, ts in db.execute('SELECT node, ts FROM samples ORDER BY rowid'):
+        if ts < lastTs.get(node, 0):
+            ordered += 1
+        lastTs[node] = ts
+    print('{} nodes x {} frames over {}: {:.2f}s'.format(nodes, frames, proto, elapsed))
+    print('  frames sent {} (+{} repeats) | received {} | duplicates dropped {} | bad {}'.format(
+        sent, dups, collector.stats['frames'], collector.stats['duplicate'], collector.stats['bad']))
+    print('  {:.0f} frames/s | {:.0f} samples/s | {} rows stored | {} out of order'.format(
+        collector.stats['frames'] / elapsed, collector.stats['samples'] / elapsed, rows, ordered))
+    print('  frame size {} bytes for 60 samples'.format(telemetry.frameSize(60)))
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        args = sys.argv[2:]
+        bench(int(args[0]) if args else 300,
+              int(args[1]) if len(args) > 1 else 20,
+              args[2] if len(args) > 2 else 'udp')
+        return
+    dbPath = sys.argv[1] if len(sys.argv) > 1 else 'telemetry.db'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 5005
+    collector = Collector(dbPath, port=port)
+    try:
+        collector.serveForever()
+    except KeyboardInterrupt:
+        collector.flush(force=True)
+        print(dict(collector.stats))
+
+if __name__=="__main__":
+   main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           test_anomaly.py
+#  python -m unittest test_anomaly   (or python -m pytest)
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import unittest
+
+import anomaly
+import deviceHealth
+
+
+class ConsensusTest(unittest.TestCase):
+
+    def test_two_sources_both_flagged(self):
+        c = anomaly.Consensus(1.5)
+        for i in range(3):
+            alarms = c.update({'bme' : 24.0, 'bmp' : 26.0})
+        self.assertEqual(sorted(alarms), ['bme', 'bmp'])
+
+    def test_two_sources_primary_trusted(self):
+        c = anomaly.Consensus(1.5, primary='bme')
+        for i in range(3):
+            alarms = c.update({'bme' : 24.0, 'bmp' : 26.0})
+        self.assertEqual(list(alarms), ['bmp'])
+
+    def test_three_sources_outvote_primary(self):
+        c = anomaly.Consensus(1.5, primary='bme')
+        for i in range(3):
+            alarms = c.update({'bme' : 30.0, 'bmp' : 24.0, 'sht' : 24.2})
+        self.assertEqual(list(alarms), ['bme'])
+
+
+class MonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.health = deviceHealth.DeviceHealth()
+        self.logged = []
+        self.monitor = anomaly.Monitor(
+            {'tempC' : ('bme', lambda: [anomaly.Range(-40, 85), anomaly.Stuck(5)])},
+            {'temperature' : (lambda: anomaly.Consensus(1.5, primary='bme'), {'bme' : 'bme', 'bmp' : 'bmp'})},
+            health=self.health, log=self.logged.append, alertOnly=('stuck',))
+
+    def test_stuck_only_alerts(self):
+        for i in range(5):
+            self.monitor.check('tempC', 24.0, now=i * 10.0)
+        self.assertIn('tempC stuck', self.monitor.active())
+        self.assertEqual(len(self.logged), 1)
+        self.assertFalse(self.health.suspect('bme'))
+        self.monitor.check('tempC', 90.0, now=50.0)
+        self.assertTrue(self.health.suspect('bme'))
+
+    def test_disagreement_flags_secondary(self):
+        for i in range(3):
+            self.monitor.agree('temperature', {'bme' : 24.0, 'bmp' : 25.6})
+        self.assertFalse(self.health.suspect('bme'))
+        self.assertTrue(self.health.suspect('bmp'))
+
+if __name__=="__main__":
+   unittest.main()
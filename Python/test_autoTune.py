@@ -0,0 +1,58 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           test_autoTune.py
+#  python -m unittest test_autoTune   (or python -m pytest)
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import autoTune
+
+MODEL = {'K' : 0.25, 'T' : 300.0, 'L' : 40.0, 'bias' : 60.0, 'rmse' : 0.05}
+
+
+class TuningTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'tuning.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_simc_gains(self):
+        kc, ti = autoTune.simcPI(MODEL)
+        self.assertAlmostEqual(kc, 300.0 / (0.25 * 190.0))
+        self.assertEqual(ti, 300.0)
+
+    def test_unusable_fit_refused(self):
+        for model in (None, dict(MODEL, K=0.0), dict(MODEL, K=-0.2),
+                      dict(MODEL, K=float('nan')), dict(MODEL, rmse=2.0)):
+            self.assertRaises(ValueError, autoTune.simcPI, model)
+
+    def test_load_round_trip(self):
+        kc, ti = autoTune.simcPI(MODEL)
+        autoTune.save(self.path, 78.0, MODEL, kc, ti)
+        pi = autoTune.load(self.path)
+        self.assertEqual((pi.setpoint, pi.kc, pi.ti), (78.0, kc, ti))
+
+    def test_load_rejects_non_positive_gains(self):
+        for kc, ti in ((-3.0, 300.0), (3.0, 0.0)):
+            with open(self.path, 'w') as f:
+                json.dump({'setpoint' : 78.0, 'kc' : kc, 'ti' : ti}, f)
+            self.assertRaises(ValueError, autoTune.load, self.path)
+
+if __name__=="__main__":
+   unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           test_dashboard.py
+#  python -m unittest test_dashboard   (or python -m pytest)
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import socket
+import unittest
+
+import dashboard
+
+T0 = 1700000000.0
+
+
+class EventsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dash = dashboard.Dashboard(port=0, host='127.0.0.1', size=8).start()
+        for i in range(5):
+            self.dash.add({'tempF' : 70.0 + i}, T0 + i)
+
+    def tearDown(self):
+        self.dash.stop()
+        self.dash.server.server_close()
+
+    def ids(self, headers, count):
+        s = socket.create_connection(('127.0.0.1', self.dash.port), timeout=5)
+        s.sendall(('GET /events HTTP/1.0\r\n' + headers + '\r\n').encode())
+        data = b''
+        while data.count(b'id: ') < count:
+            chunk = s.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        s.close()
+        return [int(line[4:]) for line in data.decode().splitlines() if line.startswith('id: ')]
+
+    def test_resume_from_last_event_id(self):
+        self.assertEqual(self.ids('Last-Event-ID: 2\r\n', 2), [3, 4])
+
+    def test_stale_id_starts_at_oldest_sample(self):
+        # an id from before the daemon restarted is past the new ring's end
+        self.assertEqual(self.ids('Last-Event-ID: 5000\r\n', 5), [0, 1, 2, 3, 4])
+        for i in range(5, 12):
+            self.dash.add({'tempF' : 70.0 + i}, T0 + i)
+        self.assertEqual(self.ids('Last-Event-ID: 5000\r\n', 8), list(range(4, 12)))
+
+if __name__=="__main__":
+   unittest.main()
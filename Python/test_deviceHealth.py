@@ -0,0 +1,99 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           test_deviceHealth.py
+#  python -m unittest test_deviceHealth   (or python -m pytest)
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import unittest
+
+import deviceHealth
+
+
+def failing():
+    raise IOError('bus error')
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_max_failures_and_probes(self):
+        b = deviceHealth.CircuitBreaker('max', maxFailures=2, baseDelay=5.0)
+        b.failure(IOError('x'), now=0.0)
+        self.assertEqual(b.state, deviceHealth.CLOSED)
+        b.failure(IOError('x'), now=1.0)
+        self.assertEqual(b.state, deviceHealth.OPEN)
+        self.assertFalse(b.allow(now=2.0))
+        self.assertTrue(b.allow(now=6.0))
+        self.assertEqual(b.state, deviceHealth.HALF_OPEN)
+        b.failure(IOError('x'), now=6.0)
+        self.assertEqual(b.delay, 10.0)          # doubled on a failed probe
+        b.success(1, now=20.0)
+        self.assertEqual(b.state, deviceHealth.CLOSED)
+        self.assertEqual(b.delay, 5.0)
+
+    def test_stale_fallback(self):
+        b = deviceHealth.CircuitBreaker('bme', staleAfter=60)
+        b.success((20.0, 1000.0, 50.0), now=0.0)
+        self.assertEqual(b.fallback(None, now=30.0), (20.0, 1000.0, 50.0))
+        self.assertIsNone(b.fallback(None, now=61.0))
+
+
+class DeviceHealthTest(unittest.TestCase):
+
+    def setUp(self):
+        self.health = deviceHealth.DeviceHealth()
+        self.health.add('max', maxFailures=3)
+
+    def test_fallback_is_per_call(self):
+        # A successful ramp call must not become the rpm read's fallback
+        rpm = [1200]
+
+        def readRPM(channel):
+            if rpm[0] is None:
+                raise IOError('nack')
+            return rpm[0]
+
+        def poll():
+            return None
+        self.assertEqual(self.health.call('max', poll), None)
+        rpm[0] = None
+        self.assertEqual(self.health.call('max', readRPM, 1, default=0), 0)
+        rpm[0] = 1200
+        self.assertEqual(self.health.call('max', readRPM, 1, default=0), 1200)
+        self.assertEqual(self.health.call('max', poll), None)
+        rpm[0] = None
+        self.assertEqual(self.health.call('max', readRPM, 1, default=0), 1200)
+
+    def test_key_shares_fallback_between_functions(self):
+        self.health.call('max', lambda: 900, key='rpm')
+        self.assertEqual(self.health.call('max', failing, default=0, key='rpm'), 900)
+        self.assertEqual(self.health.call('max', failing, default=0), 0)
+
+    def test_isolated_device_is_skipped(self):
+        calls = []
+
+        def read():
+            calls.append(1)
+            raise IOError('gone')
+        for i in range(5):
+            self.assertEqual(self.health.call('max', read, default=-1), -1)
+        self.assertEqual(len(calls), 3)          # open after 3, then skipped
+        self.assertFalse(self.health.healthy('max'))
+
+    def test_flag_and_suspect(self):
+        self.assertFalse(self.health.suspect('max'))
+        self.health.flag('max', 'rpm stuck', 'stuck at 0')
+        self.assertTrue(self.health.suspect('max'))
+        self.assertEqual(self.health.status()[0]['anomalies'], ['rpm stuck: stuck at 0'])
+        self.health.flag('max', 'rpm stuck', None)
+        self.assertFalse(self.health.suspect('max'))
+
+if __name__=="__main__":
+   unittest.main()
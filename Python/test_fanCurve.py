@@ -0,0 +1,109 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           test_fanCurve.py
+#  python -m unittest test_fanCurve   (or python -m pytest)
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import unittest
+
+import autoTune
+import fanCurve
+
+
+class CurveTest(unittest.TestCase):
+
+    def test_ladder_matches_autotune(self):
+        c = fanCurve.Curve(autoTune.LADDER)
+        xs = [60 + i / 256.0 for i in range(30 * 256)] + [81.99999, 82.00001, 71.99999, 72.00001]
+        for x in xs:
+            self.assertEqual(c(x), autoTune.ladder(x), x)
+
+    def test_reading_on_a_threshold_keeps_the_lower_step(self):
+        curves = fanCurve.fromConfig(fanCurve.DEFAULT)
+        for tempF, duty in ((82.0, 40), (80.0, 50), (76.0, 60), (72.0, 70), (82.5, 30)):
+            self.assertEqual(curves.duties({'tempF' : tempF}), {1 : duty})
+
+    def test_default_only_ladder(self):
+        c = fanCurve.Curve([[None, 55]])
+        self.assertEqual(c(-40.0), 55)
+        self.assertEqual(c(120.0), 55)
+
+    def test_linear_and_flat_ends(self):
+        c = fanCurve.Curve(points=[[72, 70], [82, 30]])
+        self.assertEqual(c(60), 70)
+        self.assertEqual(c(90), 30)
+        self.assertAlmostEqual(c(77), 50, delta=0.05)
+
+    def test_spline_does_not_overshoot(self):
+        points = [[0.4, 40], [0.8, 70], [1.2, 70], [1.6, 30]]
+        c = fanCurve.Curve(points=points, spline=True)
+        for i in range(201):
+            x = 0.2 + i * 0.01
+            self.assertTrue(30 - 1e-9 <= c.exact(x) <= 70 + 1e-9, x)
+            self.assertAlmostEqual(c(x), c.exact(x), delta=0.1)
+        self.assertEqual(c.exact(1.0), 70)
+
+    def test_non_finite_input_is_missing(self):
+        c = fanCurve.Curve(autoTune.LADDER)
+        for x in (None, float('nan'), float('inf'), -float('inf')):
+            self.assertIsNone(c(x))
+        curves = fanCurve.fromConfig(fanCurve.DEFAULT)
+        self.assertEqual(curves.duties({'tempF' : float('nan')}), {})
+
+    def test_bad_points(self):
+        self.assertRaises(ValueError, fanCurve.Curve, points=[[1, 2]])
+        self.assertRaises(ValueError, fanCurve.Curve, points=[[2, 40], [1, 70]])
+
+
+class FanCurveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = fanCurve.Curve(autoTune.LADDER)
+        self.vpd = fanCurve.Curve(points=[[1.2, 70], [1.6, 40]])
+
+    def test_max_takes_most_airflow(self):
+        fan = fanCurve.FanCurve([('tempF', self.temp, 1.0), ('vpd', self.vpd, 1.0)])
+        self.assertEqual(fan({'tempF' : 74.0, 'vpd' : 1.6}), 40)       # vpd wins
+        self.assertEqual(fan({'tempF' : 83.0, 'vpd' : 1.6}), 30)       # temperature wins
+        self.assertEqual(fan({'tempF' : 74.0}), 60)
+        self.assertIsNone(fan({'humidity' : 50.0}))
+
+    def test_nan_input_skipped(self):
+        fan = fanCurve.FanCurve([('tempF', self.temp, 1.0), ('vpd', self.vpd, 1.0)])
+        self.assertEqual(fan({'tempF' : 74.0, 'vpd' : float('nan')}), 60)
+
+    def test_not_inverted(self):
+        fan = fanCurve.FanCurve([('tempF', self.temp, 1.0), ('vpd', self.vpd, 1.0)], inverted=False)
+        self.assertEqual(fan({'tempF' : 74.0, 'vpd' : 1.6}), 60)
+
+    def test_weighted(self):
+        fan = fanCurve.FanCurve([('tempF', self.temp, 3.0), ('vpd', self.vpd, 1.0)], combine='weighted')
+        self.assertEqual(fan({'tempF' : 83.0, 'vpd' : 1.2}), 40)        # (3 * 30 + 70) / 4
+
+    def test_step_hysteresis(self):
+        fan = fanCurve.FanCurve([('vpd', self.vpd, 1.0)], step=10)
+        self.assertEqual(fan({'vpd' : 1.2}), 70)
+        self.assertEqual(fan({'vpd' : 1.28}), 70)       # 64: less than 3/4 step away
+        self.assertEqual(fan({'vpd' : 1.44}), 50)       # 52: to the nearest lo + n * step
+        self.assertEqual(fan({'vpd' : 1.6}), 40)
+
+    def test_from_config(self):
+        curves = fanCurve.fromConfig({'channels' : {
+            '1' : {'curves' : [{'input' : 'tempF', 'ladder' : [[82, 30], [None, 70]]}]},
+            '2' : {'lo' : 40, 'curves' : [{'input' : 'humidity', 'points' : [[50, 70], [70, 30]]}]}}})
+        self.assertEqual(curves.inputs(), ['humidity', 'tempF'])
+        self.assertEqual(curves.duties({'tempF' : 85.0, 'humidity' : 80.0}), {1 : 30, 2 : 40})
+        self.assertEqual(curves.duties({'tempF' : 70.0}), {1 : 70})
+        self.assertRaises(ValueError, fanCurve.fromConfig, {'channels' : {'1' : {
+            'combine' : 'min', 'curves' : [{'input' : 'tempF', 'ladder' : autoTune.LADDER}]}}})
+
+if __name__=="__main__":
+   unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           test_historyExport.py
+#  python -m unittest test_historyExport   (or python -m pytest)
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import history
+import historyExport
+
+T0 = 1700000000 // history.DAY * history.DAY
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'h.db')
+        self.hist = history.History(self.path, commitEvery=1e9)
+        for i in range(30):
+            values = {'temperature' : 20.0 + i}
+            if i % 3 == 0:
+                values['humidity'] = 50.0 + i
+            self.hist.add(values, T0 + i * 5)
+        self.hist.commit()
+        self.page = historyExport.PAGE
+        historyExport.PAGE = 4              # several pages per field
+
+    def tearDown(self):
+        historyExport.PAGE = self.page
+        self.hist.close()
+        shutil.rmtree(self.folder)
+
+    def test_raw_rows_merge_fields(self):
+        out = list(historyExport.rows(self.hist))
+        self.assertEqual(len(out), 30)
+        self.assertEqual(out[0], (T0, [50.0, 20.0]))          # fields sorted
+        self.assertEqual(out[1], (T0 + 5, [None, 21.0]))
+        self.assertEqual(out[-1][1][1], 49.0)
+
+    def test_range_is_half_open(self):
+        out = list(historyExport.rows(self.hist, ['temperature'], T0 + 10, T0 + 20))
+        self.assertEqual([t for t, v in out], [T0 + 10, T0 + 15])
+
+    def test_resample_raw_and_rollups_agree(self):
+        raw = list(historyExport.rows(self.hist, ['temperature'], step=30, how='max'))
+        self.assertEqual(raw, [(T0, [25.0]), (T0 + 30, [31.0]), (T0 + 60, [37.0]),
+                               (T0 + 90, [43.0]), (T0 + 120, [49.0])])
+        minutes = list(historyExport.rows(self.hist, ['temperature'], step=60, how='mean'))
+        raw = historyExport._resampleRaw(historyExport._raw(self.hist.db, 'temperature', 0, 1e18),
+                                         60, 'mean')
+        self.assertEqual(minutes, [(t, [v]) for t, v in raw])
+        self.assertEqual([t for t, v in minutes], [T0, T0 + 60, T0 + 120])
+        self.assertEqual(minutes[0][1], [25.5])
+
+    def test_csv(self):
+        out = io.StringIO() if str is not bytes else io.BytesIO()
+        n = historyExport.writeCSV(out, ['humidity', 'temperature'],
+                                   historyExport.rows(self.hist, None, T0, T0 + 10))
+        self.assertEqual(n, 2)
+        self.assertEqual(out.getvalue().splitlines(),
+                         ['time,humidity,temperature', '%.3f,50,20' % T0, '%.3f,,21' % (T0 + 5)])
+
+    def test_columns_round_trip(self):
+        out = os.path.join(self.folder, 'all.gpc')
+        self.assertEqual(historyExport.export(self.hist, out), 30)
+        blocks = list(historyExport.columns(out, ['humidity']))
+        self.assertEqual(len(blocks), 1)
+        times, block = blocks[0]
+        self.assertEqual(list(block), ['humidity'])
+        self.assertEqual(times[1], T0 + 5)
+        self.assertEqual(block['humidity'][0], 50.0)
+        self.assertNotEqual(block['humidity'][1], block['humidity'][1])   # NaN
+        self.assertRaises(KeyError, list, historyExport.columns(out, ['rpm']))
+
+    def test_daemon_commits_during_export(self):
+        reader = history.History(self.path)
+        source = historyExport.rows(reader, ['temperature'])
+        first = next(source)
+        self.hist.add({'temperature' : 99.0}, T0 + 1000)
+        self.assertEqual(self.hist.commit(), 1)
+        rest = list(source)
+        self.assertEqual(first, (T0, [20.0]))
+        self.assertEqual(rest[-1], (T0 + 1000, [99.0]))
+        reader.close()
+
+    def test_locked_commit_keeps_batch(self):
+        self.hist.db.execute('PRAGMA busy_timeout = 0')
+        other = sqlite3.connect(self.path)
+        other.execute('BEGIN EXCLUSIVE')
+        self.hist.add({'temperature' : 1.0}, T0 + 2000)
+        self.assertEqual(self.hist.commit(), 0)
+        other.rollback()
+        other.close()
+        self.assertEqual(self.hist.commit(), 1)
+        self.assertEqual(self.hist.aggregate('temperature', T0 + 2000, T0 + 2001)['count'], 1)
+
+
+class PruneTest(unittest.TestCase):
+
+    def test_commit_prunes_after_prune_every(self):
+        folder = tempfile.mkdtemp()
+        hist = history.History(os.path.join(folder, 'h.db'), commitEvery=1e9, pruneEvery=history.DAY)
+        old = hist._lastPrune - 20 * history.DAY
+        hist.add({'temperature' : 20.0}, old)
+        self.assertEqual(hist.commit(), 1)               # not due yet
+        self.assertEqual(hist.aggregate('temperature', old, old + 1)['count'], 1)
+        hist._lastPrune -= history.DAY
+        hist.add({'temperature' : 21.0}, old + 60)
+        self.assertEqual(hist.commit(), 1)
+        self.assertIsNone(hist.db.execute('SELECT ts FROM samples').fetchone())
+        self.assertEqual(hist.db.execute('SELECT count FROM rollups WHERE size = ?',
+                                         (history.HOUR,)).fetchone()[0], 2)
+        hist.close()
+        shutil.rmtree(folder)
+
+if __name__=="__main__":
+   unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           test_telemetryCollector.py
+#  python -m unittest test_telemetryCollector   (or python -m pytest)
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import math
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import unittest
+import zlib
+
+import telemetry
+import telemetryCollector
+
+T0 = 1700000000.0
+
+
+def frame(node, seq, epoch, start=0, count=3):
+    return telemetry.encode(node, seq, [(T0 + start + i * 10, {'temperature' : 20.0 + i})
+                                        for i in range(count)], epoch=epoch)
+
+
+class FrameTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = telemetry.encode(7, 42, [(T0, {'temperature' : 21.5, 'rpm' : 1200})], epoch=99)
+        self.assertEqual(len(data), telemetry.frameSize(1))
+        node, epoch, seq, samples = telemetry.decode(data)
+        self.assertEqual((node, epoch, seq), (7, 99, 42))
+        ts, values = samples[0]
+        self.assertEqual(ts, int(T0 * 1000))
+        self.assertEqual(values[0], 21.5)
+        self.assertEqual(values[3], 1200)
+        self.assertTrue(math.isnan(values[1]))
+
+    def test_version_1_decodes_as_epoch_0(self):
+        sample = struct.pack('>Q8f', int(T0 * 1000), *([20.0] * 8))
+        body = telemetry.HEADER_V1.pack(telemetry.MAGIC, 1, 0, 3, 5, 1, 8, 0) + sample
+        data = body + telemetry.CRC.pack(zlib.crc32(body) & 0xFFFFFFFF)
+        node, epoch, seq, samples = telemetry.decode(data)
+        self.assertEqual((node, epoch, seq, len(samples)), (3, 0, 5, 1))
+
+    def test_corrupt_frame(self):
+        data = bytearray(frame(1, 0, 1))
+        data[-5] ^= 0xFF
+        self.assertRaises(telemetry.FrameError, telemetry.decode, bytes(data))
+        self.assertRaises(telemetry.FrameError, telemetry.decode, b'GP')
+
+
+class CollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.collector = telemetryCollector.Collector(os.path.join(self.folder, 't.db'),
+                                                      host='127.0.0.1', port=0, reorderMs=0)
+        self.collector._openDb()
+
+    def tearDown(self):
+        self.collector.db.close()
+        self.collector.udp.close()
+        self.collector.tcp.close()
+        shutil.rmtree(self.folder)
+
+    def stored(self):
+        return self.collector.db.execute('SELECT node, ts, temperature FROM samples '
+                                         'ORDER BY node, ts').fetchall()
+
+    def test_duplicate_frame_dropped(self):
+        self.collector.handleFrame(frame(1, 0, 100))
+        self.collector.handleFrame(frame(1, 0, 100))
+        self.assertEqual(self.collector.stats['duplicate'], 1)
+        self.assertEqual(self.collector.flush(), 3)
+
+    def test_restarted_node_is_not_a_duplicate(self):
+        self.collector.handleFrame(frame(1, 0, 100))
+        self.collector.handleFrame(frame(1, 1, 100, start=30))
+        # restart: seq back to 0 under a new epoch
+        self.collector.handleFrame(frame(1, 0, 200, start=60))
+        self.collector.handleFrame(frame(2, 0, 200, start=60))
+        self.assertEqual(self.collector.stats['duplicate'], 0)
+        self.collector.handleFrame(frame(1, 0, 200, start=60))
+        self.assertEqual(self.collector.stats['duplicate'], 1)
+        # a late repeat from before the restart is kept out by (node, ts)
+        self.collector.handleFrame(frame(1, 1, 100, start=30))
+        self.collector.flush()
+        rows = self.stored()
+        self.assertEqual(len(rows), 12)
+        self.assertEqual([ts for node, ts, t in rows if node == 1],
+                         [int(T0 * 1000) + i * 10000 for i in range(9)])
+
+    def test_samples_stored_in_time_order(self):
+        self.collector.handleFrame(frame(1, 1, 100, start=30))
+        self.collector.handleFrame(frame(1, 0, 100))
+        self.collector.flush()
+        ts = [r[0] for r in self.collector.db.execute('SELECT ts FROM samples ORDER BY rowid')]
+        self.assertEqual(ts, sorted(ts))
+
+    def test_tcp_stream_split_across_reads(self):
+        a, b = socket.socketpair()
+        self.collector._streams[b] = b''
+        data = frame(4, 0, 100) + frame(4, 1, 100, start=30)
+        a.sendall(data[:10])
+        self.collector._readStream(b)
+        a.sendall(data[10:50])
+        self.collector._readStream(b)
+        a.sendall(data[50:])
+        self.collector._readStream(b)
+        self.assertEqual(self.collector.stats['frames'], 2)
+        self.assertEqual(self.collector._streams[b], b'')
+        a.close()
+        b.close()
+
+if __name__=="__main__":
+   unittest.main()
@@ -0,0 +1,275 @@
+#!/usr/bin/python
+#--------------------------------------
+#    ___  ___  _
+#   / _ \/ _ \(_)_____ __ __ __ __
+#  / , _/ ___/ // _  // // // // /
+# /_/|_/_/  /_/ \_, / \___/ \_, /
+#              /___/       /___/
+#
+#           zones.py
+#  Multi-zone / multi-HAT fan control.
+#
+#  A zone maps one or more temp/humidity sensors to a set of fan channels
+#  on one MAX31790.  Any number of MAX31790s (one per address) can be
+#  used, so a single Pi can run several tents.
+#
+#  Every zone is served from one poll:
+#    1. each sensor is read once, even if several zones use it
+#    2. each zone picks a duty, registers are only written on a change
+#    3. each controller's six tach counts come back in one block read
+#
+#  fullbucket_v3 serves the zones in ZONES_PATH from its own loop when the
+#  file exists - its MAX31790 can be listed as a controller for channels
+#  2-6, channel 1 stays with the daemon.
+#
+#  Usage: python zones.py zones.json
+#
+#  zones.json
+#  {
+#    "period"      : 10,
+#    "controllers" : { "hat1" : { "bus" : 1, "addr" : "0x20",
+#                                 "fans" : { "1" : { "pulsePerRev" : 2, "maxRPM" : 3000 } } },
+#                      "hat2" : { "bus" : 1, "addr" : "0x23" } },
+#    "sensors"     : { "tentA" : { "type" : "bme280", "addr" : "0x76" },
+#                      "tentB" : { "type" : "bme280", "addr" : "0x77" } },
+#    "zones"       : [ { "name" : "tentA", "controller" : "hat1",
+#                        "channels" : [1, 2], "sensors" : ["tentA"] },
+#                      { "name" : "tentB", "controller" : "hat2",
+#                        "channels" : [1, 2, 3], "sensors" : ["tentB", "tentA"],
+#                        "combine" : "max",
+#                        "ladder" : [[84, 30], [80, 45], [75, 60], [null, 70]] } ]
+#  }
+#
+#  A ladder is a list of [temperature F, duty %] steps checked top down;
+#  the first step whose temperature is exceeded wins, null = otherwise
+#  (safeDuty when there is no null step).  It is compiled with
+#  fanCurve.Curve.
+#
+#  "fans" gives a MAX31790.FanProfile per channel (pulsePerRev,
+#  tachPeriods, spinUp, pwmFreq, minRPM, maxRPM); other channels use the
+#  default 2 pulses / 4 periods.
+#
+# Author : Drew Ross
+#
+#--------------------------------------
+import json
+import sys
+import time
+
+import autoTune
+import bme280
+import MAX31790
+import deviceHealth
+import fanCurve
+
+# fullbucket_v3's steps (duty is inverted: 30% = MAX fan speed)
+DEFAULT_LADDER = autoTune.LADDER
+SAFE_DUTY      = 30
+
+
+def _addr(value):
+    # Accept 0x76, 118 or "0x76"
+    if isinstance(value, int):
+        return value
+    return int(value, 0)
+
+
+def bme280Reader(config):
+    addr = _addr(config.get('addr', bme280.DEVICE))
+    return lambda: bme280.readBME280All(addr)
+
+# type -> factory returning a function that reads (tempC, pressure, humidity)
+SENSOR_TYPES = {
+    'bme280' : bme280Reader,
+}
+
+
+class Zone(object):
+    """Sensors -> ladder -> fan channels on one controller"""
+
+    def __init__(self, name, controller, channels, sensors, combine='mean',
+                 ladder=DEFAULT_LADDER, safeDuty=SAFE_DUTY):
+        self.name = name
+        self.controller = controller       # controller name
+        self.channels = list(channels)
+        self.sensors = list(sensors)       # sensor names
+        self.combine = combine             # 'mean', 'max' or 'min'
+        self.ladder = [(t, d) for t, d in ladder]
+        if None not in [t for t, d in self.ladder]:
+            self.ladder.append((None, safeDuty))
+        self.curve = fanCurve.Curve(self.ladder)
+        self.safeDuty = safeDuty
+        self.duty = None
+        self.temperatureF = None
+
+    def dutyFor(self, temperatureF):
+        duty = self.curve(temperatureF)
+        return self.safeDuty if duty is None else int(duty)
+
+    def combineTemps(self, temps):
+        if self.combine == 'max':
+            return max(temps)
+        if self.combine == 'min':
+            return min(temps)
+        return sum(temps) / float(len(temps))
+
+
+class ZoneManager(object):
+    """Serves every zone from a single polling schedule"""
+
+    def __init__(self, controllers, sensors, zones, period=10, log=None,
+                 profiles=None, shared=()):
+        """
+        profiles - {controller name: {channel: FanProfile}} written by setup()
+        shared   - controller names reset by someone else (fullbucket_v3's
+                   own chip): setup() only writes their profiles
+        """
+        self.controllers = controllers     # name -> MAX31790.Controller
+        self.sensors = sensors             # name -> read function
+        self.zones = zones
+        self.period = period
+        self.profiles = profiles or {}
+        self.shared = set(shared)
+        self.ready = set()                 # controllers set up
+        self.readings = {}
+        self.rpm = {}                      # controller name -> [rpm x6]
+        self._written = {}                 # (controller, channel) -> duty
+        self.health = deviceHealth.DeviceHealth(log=log)
+        for name in sensors:
+            self.health.add('sensor:' + name, staleAfter=6 * period)
+        for name in controllers:
+            self.health.add('max:' + name)
+
+    def setup(self):
+        """Set up every controller not done yet, True once all are.
+        A controller that fails is tried again on the next call."""
+        for name, ctrl in self.controllers.items():
+            if name not in self.ready and self.health.call('max:' + name, self._setup, name, ctrl,
+                                                           default=False, key='setup'):
+                self.ready.add(name)
+        return len(self.ready) == len(self.controllers)
+
+    def _setup(self, name, ctrl):
+        if name not in self.shared:
+            ctrl.initializeMAX(6)
+        ctrl.applyProfiles(self.profiles.get(name, {}))
+        return True
+
+    def poll(self):
+        # 0. controllers missing at startup are retried through their breaker
+        if len(self.ready) < len(self.controllers):
+            self.setup()
+
+        # 1. read each sensor once
+        for name, read in self.sensors.items():
+            self.readings[name] = self.health.call('sensor:' + name, read)
+
+        # 2. pick a duty per zone, write only what changed
+        for zone in self.zones:
+            temps = [self.readings[s][0] for s in zone.sensors
+                     if self.readings.get(s) is not None]
+            if temps:
+                zone.temperatureF = zone.combineTemps(temps) * 9 / 5.0 + 32
+                zone.duty = zone.dutyFor(zone.temperatureF)
+            else:
+                zone.temperatureF = None
+                zone.duty = zone.safeDuty
+            if zone.controller not in self.ready:
+                continue
+            ctrl = self.controllers[zone.controller]
+            for channel in zone.channels:
+                key = (zone.controller, channel)
+                if self._written.get(key) == zone.duty:
+                    continue
+                breaker = self.health.breakers['max:' + zone.controller]
+                self.health.call('max:' + zone.controller,
+                                 ctrl.setPWMTargetDuty, channel, zone.duty)
+                if breaker.failures == 0:
+                    self._written[key] = zone.duty
+
+        # 3. one block read of all tach counts per controller
+        for name, ctrl in self.controllers.items():
+            if name in self.ready:
+                self.rpm[name] = self.health.call('max:' + name, ctrl.readAllRPM,
+                                                  default=[0] * 6)
+
+    def status(self):
+        out = []
+        for zone in self.zones:
+            rpm = self.rpm.get(zone.controller, [0] * 6)
+            out.append({
+                'zone'         : zone.name,
+                'temperatureF' : zone.temperatureF,
+                'duty'         : zone.duty,
+                'rpm'          : [rpm[c - 1] for c in zone.channels],
+            })
+        return out
+
+    def run(self):
+        # Fixed-rate loop: sleep to the next deadline, not a fixed delay
+        deadline = time.time()
+        while True:
+            self.poll()
+            for s in self.status():
+                print("{zone}: {temperatureF} F | duty {duty} | rpm {rpm}".format(**s))
+            sys.stdout.flush()
+            deadline += self.period
+            delay = deadline - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.time()
+
+
+def loadZones(path, log=None, shared=None):
+    """Build a ZoneManager from a JSON config file (see top of file).
+
+    shared - {(bus, addr): MAX31790.Controller} already set up by the
+             caller, used instead of opening a second one
+    """
+    with open(path) as f:
+        config = json.load(f)
+
+    shared = shared or {}
+    controllers = {}
+    profiles = {}
+    sharedNames = []
+    for name, c in config['controllers'].items():
+        key = (c.get('bus', 1), _addr(c.get('addr', MAX31790.maxAddr)))
+        ctrl = shared.get(key)
+        if ctrl is None:
+            ctrl = MAX31790.Controller(*key)
+        else:
+            sharedNames.append(name)
+        profiles[name] = dict((int(ch), MAX31790.FanProfile(**p))
+                              for ch, p in c.get('fans', {}).items())
+        ctrl.profiles.update(profiles[name])
+        controllers[name] = ctrl
+    sensors = {}
+    for name, s in config['sensors'].items():
+        sensors[name] = SENSOR_TYPES[s.get('type', 'bme280')](s)
+
+    zones = []
+    for z in config['zones']:
+        zones.append(Zone(z['name'], z['controller'], z['channels'], z['sensors'],
+                          combine=z.get('combine', 'mean'),
+                          ladder=z.get('ladder', DEFAULT_LADDER),
+                          safeDuty=z.get('safeDuty', SAFE_DUTY)))
+        if z['controller'] not in controllers:
+            raise ValueError('zone {} uses unknown controller {}'.format(z['name'], z['controller']))
+        for s in z['sensors']:
+            if s not in sensors:
+                raise ValueError('zone {} uses unknown sensor {}'.format(z['name'], s))
+
+    return ZoneManager(controllers, sensors, zones, config.get('period', 10), log,
+                       profiles, sharedNames)
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'zones.json'
+    manager = loadZones(path, log=lambda m: sys.stdout.write(m + '\n'))
+    manager.setup()
+    manager.run()
+
+if __name__=="__main__":
+   main()